@@ -8,14 +8,21 @@ import json
 import logging
 from typing import Any
 
+from homeassistant.components.recorder import get_instance
+from homeassistant.components.recorder.models import StatisticData, StatisticMetaData
+from homeassistant.components.recorder.statistics import (
+    async_add_external_statistics,
+    get_last_statistics,
+)
 from homeassistant.components.zha import DOMAIN as ZHA_DOMAIN
 from homeassistant.components.zha.websocket_api import (
     SERVICE_ISSUE_ZIGBEE_CLUSTER_COMMAND,
 )
 from homeassistant.config_entries import ConfigEntry
-from homeassistant.const import ATTR_COMMAND
+from homeassistant.const import ATTR_COMMAND, UnitOfVolume
 from homeassistant.core import HomeAssistant, callback
 from homeassistant.helpers.update_coordinator import DataUpdateCoordinator
+from homeassistant.util import dt as dt_util
 from zha.application.const import (
     ATTR_CLUSTER_ID,
     ATTR_CLUSTER_TYPE,
@@ -28,7 +35,8 @@ from zha.application.const import (
     ZHA_EVENT,
 )
 
-from .const import DOMAIN
+from . import wire
+from .const import DOMAIN, NAME
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -39,7 +47,11 @@ SERIAL_DATA_CMD = 0x0000
 XBEE_DATA_ENDPOINT = 0xE8
 
 REMOTE_COMMAND_TIMEOUT = 5
+REQUEST_ID_LIMIT = 0x10000
+MAX_PAYLOAD_SIZE = 255
 DEFAULT_RETRY_COUNT = 5
+BATCH_DELAY = 0.05  # Time to collect the queued commands into one batch
+HISTORY_BACKLOG = 12  # Intervals behind downloaded out of the rotation
 
 
 class XBeeWatercounterApiClient:
@@ -54,10 +66,13 @@ class XBeeWatercounterApiClient:
 
         self.hass = hass
         self.device_ieee = device_ieee
-        self._cmd_lock = {}
         self._cmd_resp_lock = asyncio.Lock()
         self._awaiting = {}
+        self._next_id = 0
+        self._wire_names = None
+        self._wire_codes = None
         self._callbacks = {}
+        self._queue = []
         self._remove_listener = None
         self.start()
 
@@ -117,57 +132,150 @@ class XBeeWatercounterApiClient:
             self.hass.loop,
         ).result()
 
+    @staticmethod
+    def _encode(command, args, kwargs):
+        """Build the command request."""
+        if len(args) > 0 and len(kwargs) > 0:
+            return {"cmd": command, "args": (args, kwargs)}
+        if len(args) > 1:
+            return {"cmd": command, "args": args}
+        if len(args) == 1:
+            return {"cmd": command, "args": args[0]}
+        if len(kwargs) > 0:
+            return {"cmd": command, "args": kwargs}
+        return {"cmd": command}
+
     async def async_command(
         self, command, *args, retry_count=DEFAULT_RETRY_COUNT, **kwargs
     ):
         """Issue xbee watercounter command asynchronously."""
-        if len(args) > 0 and len(kwargs) > 0:
-            data = {"cmd": command, "args": (args, kwargs)}
-        elif len(args) > 1:
-            data = {"cmd": command, "args": args}
-        elif len(args) == 1:
-            data = {"cmd": command, "args": args[0]}
-        elif len(kwargs) > 0:
-            data = {"cmd": command, "args": kwargs}
-        else:
-            data = {"cmd": command}
+        return await self._async_request(
+            command, self._encode(command, args, kwargs), retry_count
+        )
 
-        data = json.dumps(data)
+    @property
+    def binary(self):
+        """Return whether the binary wire protocol is in use."""
+        return self._wire_names is not None
+
+    async def async_set_wire(self, binary=True):
+        """Switch between the binary and the JSON wire protocol.
+
+        Raises RuntimeError if the device does not support the binary protocol.
+        """
+        self._wire_names = None
+        self._wire_codes = None
+        names = await self.async_command("wire", "binary" if binary else "json")
+        if binary:
+            self._wire_names = names
+            self._wire_codes = {
+                name: code for code, name in enumerate(names) if name is not None
+            }
+
+    async def async_batch(
+        self, commands, retry_count=DEFAULT_RETRY_COUNT, return_exceptions=False
+    ):
+        """Issue several commands packed into as few frames as possible.
+
+        Each command is a tuple of the command name and its positional arguments.
+        The commands are executed in order and the list of results is returned.
+        The device runs the items while their results fit in the response frame,
+        the rest are sent again in the next frame.
+        """
+        overhead = len(json.dumps({"batch": [], "id": REQUEST_ID_LIMIT - 1}))
+        items = [self._encode(command, args, {}) for command, *args in commands]
+        results = []
+        while items:
+            frame = []
+            size = overhead
+            for item in items:
+                item_size = len(json.dumps(item)) + 2  # with the ", " separator
+                if frame and size + item_size > MAX_PAYLOAD_SIZE:
+                    break
+                frame.append(item)
+                size += item_size
+
+            response = await self._async_request("batch", {"batch": frame}, retry_count)
+            if not response:
+                raise RuntimeError("Command response: empty batch response")
+            for value in response:
+                if isinstance(value, dict) and "err" in value:
+                    value = RuntimeError(f"Command response: {value['err']}")
+                    if not return_exceptions:
+                        raise value
+                results.append(value)
+            items = items[len(response) :]
+        return results
+
+    async def async_queued_command(self, command, *args):
+        """Issue the command in one batch with the others queued meanwhile.
+
+        The commands issued together, e.g. by a scene moving several valves,
+        share the frames instead of a round trip each.
+        """
+        future = self.hass.loop.create_future()
+        self._queue.append((command, args, future))
+        if len(self._queue) == 1:
+            self.hass.async_create_task(self._async_send_queue())
+        return await future
 
+    async def _async_send_queue(self):
+        """Send the queued commands."""
+        await asyncio.sleep(BATCH_DELAY)
+        queue, self._queue = self._queue, []
+        try:
+            if len(queue) == 1:
+                results = [await self.async_command(queue[0][0], *queue[0][1])]
+            else:
+                results = await self.async_batch(
+                    [(command, *args) for command, args, _ in queue],
+                    return_exceptions=True,
+                )
+        except Exception as e:
+            results = [e] * len(queue)
+        for (_, _, future), result in zip(queue, results):
+            if future.done():
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+    async def _async_request(self, command, data, retry_count):
+        """Send the request and wait for the response with retries."""
+        e = ValueError("Non-positive retry_count")
+        for i in range(retry_count):
+            if i:
+                _LOGGER.debug("Retrying...")
+            # Every attempt gets its own id so that late responses are ignored
+            request_id = self._next_id
+            self._next_id = (self._next_id + 1) % REQUEST_ID_LIMIT
+            if self._wire_codes is not None and command in self._wire_codes:
+                frame = wire.encode(
+                    self._wire_codes[command], request_id, data.get("args")
+                ).decode("latin1")
+            else:
+                data["id"] = request_id
+                frame = json.dumps(data)
+            try:
+                return await asyncio.wait_for(
+                    self._cmd(command, request_id, frame),
+                    timeout=REMOTE_COMMAND_TIMEOUT,
+                )
+            except TimeoutError:
+                _LOGGER.error(f"No response to {command} command")
+                e = TimeoutError(f"No response to {command} command")
+            except Exception as exp:
+                _LOGGER.error(f"Error getting response for {command} command: {exp}")
+                e = exp
+            finally:
+                self._awaiting.pop(request_id, None)
+
+        raise e
+
+    async def _cmd(self, command, request_id, data):
         _LOGGER.debug("data: %s", data)
 
-        if command not in self._cmd_lock:
-            self._cmd_lock[command] = asyncio.Lock()
-
-        async with self._cmd_lock[command]:
-            e = ValueError("Non-positive retry_count")
-            for i in range(retry_count):
-                if i:
-                    _LOGGER.debug("Retrying...")
-                try:
-                    return await asyncio.wait_for(
-                        self._cmd(command, data),
-                        timeout=REMOTE_COMMAND_TIMEOUT,
-                    )
-                except TimeoutError:
-                    _LOGGER.error(f"No response to {command} command")
-                    try:
-                        del self._awaiting[command]
-                    except KeyError:
-                        pass
-                    e = TimeoutError(f"No response to {command} command")
-                except Exception as exp:
-                    _LOGGER.error(
-                        f"Error getting response for {command} command: {exp}"
-                    )
-                    e = exp
-
-            raise e
-
-    async def _cmd(self, command, data):
-        if command in self._awaiting:
-            raise RuntimeError("Command is already executing")
-
         data = {
             ATTR_CLUSTER_ID: XBEE_DATA_CLUSTER,
             ATTR_CLUSTER_TYPE: CLUSTER_TYPE_IN,
@@ -180,7 +288,7 @@ class XBeeWatercounterApiClient:
 
         future = asyncio.Future()
 
-        self._awaiting[command] = future
+        self._awaiting[request_id] = (command, future)
 
         try:
             await self.hass.services.async_call(
@@ -189,19 +297,47 @@ class XBeeWatercounterApiClient:
         except Exception as e:
             _LOGGER.error(e)
             future.set_exception(e)
-            del self._awaiting[command]
+            del self._awaiting[request_id]
 
         return await future
 
+    def _pop_awaiting(self, command, request_id):
+        """Find the future for the response."""
+        if request_id is not None:
+            if request_id not in self._awaiting:
+                return None
+            return self._awaiting.pop(request_id)[1]
+
+        # Firmware without request ids, assume the responses come in order
+        for key, (awaiting_command, future) in self._awaiting.items():
+            if awaiting_command == command:
+                del self._awaiting[key]
+                return future
+        return None
+
+    def _decode(self, data):
+        """Return the data dict and the request id of the received frame."""
+        raw = data.encode("latin1")
+        if not wire.is_binary(raw):
+            data = json.loads(data)
+            return data, data.pop("id", None)
+
+        code, request_id, value = wire.decode(raw)
+        if code == wire.NOTIFY:
+            return value, None
+        if self._wire_names is None or code >= len(self._wire_names):
+            raise ValueError(f"Unknown command code {code}")
+        return {f"{self._wire_names[code]}_resp": value}, request_id
+
     async def _async_data_received(self, data):
-        data = json.loads(data)
+        data, request_id = self._decode(data)
         for key, value in data.items():
             if key[-5:] == "_resp":
                 async with self._cmd_resp_lock:
                     command = key[:-5]
-                    if command not in self._awaiting:
+                    future = self._pop_awaiting(command, request_id)
+                    if future is None or future.done():
                         continue
-                    future = self._awaiting.pop(command)
                     if isinstance(value, dict) and "err" in value:
                         future.set_exception(
                             RuntimeError(f"Command response: {value['err']}")
@@ -246,9 +382,16 @@ class XBeeWatercounterDataUpdateCoordinator(DataUpdateCoordinator):
         self._device_reset = True
         self._callbacks = {}
         self._uptime = None
+        self.journal = False
+        self.unique_id = None
+        self._history_cursor = {}
+        self._history_hours = {}
+        self._history_turn = 0
 
         async def async_log(data):
-            self._xbee_logger.log(data["sev"], data["msg"])
+            # The device packs several records per frame
+            for record in data if isinstance(data, list) else [data]:
+                self._xbee_logger.log(record["sev"], record["msg"])
 
         self._remove_log_handler = self.client.add_subscriber("log", async_log)
 
@@ -279,8 +422,26 @@ class XBeeWatercounterDataUpdateCoordinator(DataUpdateCoordinator):
             "uptime", update_uptime
         )
 
-    async def device_reset(self):
-        """Run triggers on device reset."""
+    async def device_reset(self, journal=None):
+        """Run triggers on device reset.
+
+        The journal flag is asked from the device unless the snapshot had it.
+        The device history starts over, so does its download cursor.
+        """
+        self._history_cursor.clear()
+        if journal is not None:
+            self.journal = journal
+        else:
+            try:
+                self.journal = await self.client.async_command("journal")
+            except RuntimeError:
+                self.journal = False  # Firmware without the counter journal
+        if self.client.binary:
+            # The firmware may have been updated with other command codes
+            try:
+                await self.client.async_set_wire(binary=True)
+            except RuntimeError as e:
+                _LOGGER.debug("Binary protocol is not supported: %s", e)
         for listener in self._callbacks["device_reset"]:
             self.hass.async_create_task(listener())
 
@@ -314,6 +475,10 @@ class XBeeWatercounterDataUpdateCoordinator(DataUpdateCoordinator):
     async def async_config_entry_first_refresh(self) -> None:
         """Refresh data for the first time when a config entry is setup."""
         await super().async_config_entry_first_refresh()
+        try:
+            await self.client.async_set_wire(binary=True)
+        except RuntimeError as e:
+            _LOGGER.debug("Binary protocol is not supported: %s", e)
         self.unique_id = await self.client.async_command("unique_id")
         version_info = await self.client.async_command("atcmd", "VL")
         version_info = (
@@ -330,28 +495,124 @@ class XBeeWatercounterDataUpdateCoordinator(DataUpdateCoordinator):
     @callback
     async def async_update_data(self):
         """Update data."""
-        await self.client.async_command("bind")
         data: dict[str, Any] = {"counter": {}, "valve": {}}
+        snapshot = await self.client.async_command("snapshot", bind=True)
         if self._device_reset and self._uptime is not None:
             data["uptime"] = self._uptime
         else:
-            data["uptime"] = await self.client.async_command("uptime")
+            data["uptime"] = snapshot["up"]
             self._timestamp = dt.datetime.now(tz=dt.timezone.utc).timestamp()
         self._uptime = None
-        data["reset_cause"] = await self.client.async_command("reset_cause")
+        data["reset_cause"] = snapshot["rc"]
+        # Counters restored from the device journal survive the reset
+        data["journal"] = snapshot.get("j", False)
+        if data["uptime"] > 0 or data["journal"]:
+            for number in range(0, 3):
+                data["counter"][number] = snapshot["c"][number]
+        if snapshot.get("f") is not None:
+            data["flow"] = dict(enumerate(snapshot["f"]))
+        if snapshot.get("l") is not None:
+            data["leak"] = dict(enumerate(snapshot["l"]))
         if data["uptime"] > 0:
             for number in range(0, 3):
-                data["counter"][number] = await self.client.async_command(
-                    "counter", number
-                )
-                data["valve"][number] = await self.client.async_command("valve", number)
+                data["valve"][number] = {
+                    "state": snapshot["v"][number],
+                    "is_opening": snapshot["m"][number] > 0,
+                    "is_closing": snapshot["m"][number] < 0,
+                }
         else:
             if not self._device_reset:
                 self._device_reset = True
-                await self.device_reset()
+                await self.device_reset(data["journal"])
             value = int(self._timestamp + data["uptime"] + 0.5)
             await self.client.async_command("uptime", value)
             data["new_uptime"] = value
             self._device_reset = False
 
+        try:
+            await self._async_backfill_history(snapshot.get("h"))
+        except Exception as e:
+            _LOGGER.warning("Error importing the consumption history: %s", e)
+
         return data
+
+    async def _async_backfill_history(self, seq):
+        """Import the consumption recorded by the device into the statistics.
+
+        The snapshot carries the sequence number of the device history, and a
+        counter is downloaded only when it advanced past the cursor. The
+        counters take turns, one per refresh, unless never downloaded or
+        behind by the backlog after an outage. One chunk is downloaded per
+        refresh, so everything missed is imported over the next refreshes.
+        """
+        if (
+            seq is None
+            or self.unique_id is None
+            or "recorder" not in self.hass.config.components
+        ):
+            return
+
+        turn = self._history_turn
+        self._history_turn = (turn + 1) % 3
+        for number in range(3):
+            cursor = self._history_cursor.get(number)
+            if cursor is not None and (
+                cursor >= seq or (number != turn and seq - cursor < HISTORY_BACKLOG)
+            ):
+                continue
+            history = await self.client.async_command("history", number, cursor)
+            if history is None:
+                return  # The device does not record the history
+            hours = self._history_hours.setdefault(number, {})
+            interval = history["interval"] / 1000
+            end = dt_util.utcnow().timestamp() - history["age"] / 1000
+            for index, value in enumerate(history["data"], history["cursor"]):
+                start = end - (history["seq"] - index) * interval
+                hour = start - start % 3600
+                hours[hour] = hours.get(hour, 0) + value
+            cursor = history["cursor"] + len(history["data"])
+            self._history_cursor[number] = cursor
+
+            # The hours are complete up to the end of the last interval downloaded
+            end -= (history["seq"] - cursor) * interval
+            complete = {
+                hour: hours.pop(hour) for hour in sorted(hours) if hour + 3600 <= end
+            }
+            if complete:
+                await self._async_import_statistics(number, complete)
+
+    async def _async_import_statistics(self, number, hours):
+        """Add the hourly consumption after the last imported hour."""
+        statistic_id = f"{DOMAIN}:{self.unique_id.lower()}_counter_{number + 1}"
+        last = await get_instance(self.hass).async_add_executor_job(
+            get_last_statistics, self.hass, 1, statistic_id, True, {"sum"}
+        )
+        total = 0
+        last_start = None
+        if last.get(statistic_id):
+            total = last[statistic_id][0]["sum"] or 0
+            last_start = last[statistic_id][0]["start"]
+
+        statistics = []
+        for hour, value in hours.items():
+            if last_start is not None and hour <= last_start:
+                continue
+            total += value
+            statistics.append(
+                StatisticData(start=dt_util.utc_from_timestamp(hour), sum=total)
+            )
+        if not statistics:
+            return
+
+        async_add_external_statistics(
+            self.hass,
+            StatisticMetaData(
+                has_mean=False,
+                has_sum=True,
+                name=f"{NAME} {number + 1} consumption",
+                source=DOMAIN,
+                statistic_id=statistic_id,
+                unit_of_measurement=UnitOfVolume.LITERS,
+            ),
+            statistics,
+        )
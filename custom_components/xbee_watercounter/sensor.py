@@ -11,7 +11,7 @@ from homeassistant.components.sensor import (
     SensorEntityDescription,
     SensorStateClass,
 )
-from homeassistant.const import EntityCategory, UnitOfVolume
+from homeassistant.const import EntityCategory, UnitOfVolume, UnitOfVolumeFlowRate
 from homeassistant.core import callback
 from homeassistant.helpers import entity_platform
 
@@ -33,6 +33,10 @@ SOFT_RESET = "soft reset"
 UNKNOWN_RESET = "unknown cause {}"
 UNKNOWN = "unknown"
 
+LEAK_NONE = "none"
+LEAK_RATE = "rate"
+LEAK_DURATION = "duration"
+
 
 async def async_setup_entry(hass, entry, async_add_entities):
     """Set up the sensor platform."""
@@ -60,6 +64,47 @@ async def async_setup_entry(hass, entry, async_add_entities):
             )
         )
 
+    if "flow" in coordinator.data:
+        for number in range(3):
+            entity_description = SensorEntityDescription(
+                key="xbee_watercounter_flow_" + str(number + 1),
+                name="Flow rate",
+                has_entity_name=True,
+                icon="mdi:water-pump",
+                device_class=SensorDeviceClass.VOLUME_FLOW_RATE,
+                native_unit_of_measurement=UnitOfVolumeFlowRate.LITERS_PER_MINUTE,
+                state_class=SensorStateClass.MEASUREMENT,
+            )
+            sensors.append(
+                XBeeWatercounterFlowSensor(
+                    name="flow",
+                    number=number,
+                    coordinator=coordinator,
+                    entity_description=entity_description,
+                )
+            )
+
+    if "leak" in coordinator.data:
+        for number in range(3):
+            entity_description = SensorEntityDescription(
+                key="xbee_watercounter_leak_" + str(number + 1),
+                name="Leak",
+                has_entity_name=True,
+                translation_key="leak",
+                icon="mdi:pipe-leak",
+                device_class=SensorDeviceClass.ENUM,
+                options=[LEAK_NONE, LEAK_RATE, LEAK_DURATION],
+            )
+            sensors.append(
+                XBeeWatercounterLeakSensor(
+                    name="leak",
+                    number=number,
+                    coordinator=coordinator,
+                    entity_description=entity_description,
+                    conversion=lambda x: x or LEAK_NONE,
+                )
+            )
+
     entity_description = SensorEntityDescription(
         key="xbee_watercounter_uptime",
         name="Uptime",
@@ -136,7 +181,7 @@ class XBeeWatercounterCounterSensor(XBeeWatercounterBaseSensor, RestoreSensor):
         """Run when entity about to be added."""
         await super().async_added_to_hass()
 
-        if self.coordinator.data.get("uptime", 0) > 0:
+        if self._device_data_valid():
             self._handle_coordinator_update()
         else:
             if (old_data := await self.async_get_last_sensor_data()) is not None:
@@ -146,13 +191,24 @@ class XBeeWatercounterCounterSensor(XBeeWatercounterBaseSensor, RestoreSensor):
             await self._update_device()
 
         self.async_on_remove(
-            self.coordinator.add_subscriber("device_reset", self._update_device)
+            self.coordinator.add_subscriber("device_reset", self._device_reset)
+        )
+
+    async def _device_reset(self):
+        """Restore the counter on the device unless it kept it in flash."""
+        if not self.coordinator.journal:
+            await self._update_device()
+
+    def _device_data_valid(self) -> bool:
+        """Check whether the counter survived the last device reset."""
+        return self.coordinator.data.get("uptime", 0) > 0 or self.coordinator.data.get(
+            "journal", False
         )
 
     @callback
     def _handle_coordinator_update(self) -> None:
         """Handle updated data from the coordinator."""
-        if self.coordinator.data.get("uptime", 0) <= 0:
+        if not self._device_data_valid():
             return  # Don't trust the data because the device has rebooted
 
         value = self.coordinator.data.get(self._name)
@@ -160,6 +216,15 @@ class XBeeWatercounterCounterSensor(XBeeWatercounterBaseSensor, RestoreSensor):
             value = value.get(self._number)
         if self._conversion is not None:
             value = self._conversion(value)
+        if (
+            self.coordinator.data.get("uptime", 0) <= 0
+            and value is not None
+            and self._attr_native_value is not None
+            and value < self._attr_native_value
+        ):
+            # The journal was saved before the last pulses, keep the newer value
+            self.hass.async_create_task(self._update_device())
+            return
         self._attr_native_value = value
 
         self.schedule_update_ha_state()
@@ -184,6 +249,44 @@ class XBeeWatercounterCounterSensor(XBeeWatercounterBaseSensor, RestoreSensor):
         self.schedule_update_ha_state()
 
 
+class XBeeWatercounterFlowSensor(XBeeWatercounterBaseSensor):
+    """Representation of an XBee Watercounter Flow rate sensor."""
+
+    async def async_added_to_hass(self):
+        """Run when entity about to be added."""
+        await super().async_added_to_hass()
+
+        self._handle_coordinator_update()
+
+    @callback
+    def _handle_coordinator_update(self) -> None:
+        """Handle updated data from the coordinator."""
+        self._attr_native_value = self.coordinator.data.get(self._name, {}).get(
+            self._number
+        )
+
+        self.schedule_update_ha_state()
+
+
+class XBeeWatercounterLeakSensor(XBeeWatercounterBaseSensor):
+    """Representation of an XBee Watercounter Leak detection sensor."""
+
+    async def async_added_to_hass(self):
+        """Run when entity about to be added."""
+        await super().async_added_to_hass()
+
+        self._handle_coordinator_update()
+
+    @callback
+    def _handle_coordinator_update(self) -> None:
+        """Handle updated data from the coordinator."""
+        self._attr_native_value = self._conversion(
+            self.coordinator.data.get(self._name, {}).get(self._number)
+        )
+
+        self.schedule_update_ha_state()
+
+
 class XBeeWatercounterUptimeSensor(XBeeWatercounterBaseSensor):
     """Representation of an XBee Watercounter Uptime sensor."""
 
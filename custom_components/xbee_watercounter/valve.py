@@ -43,7 +43,10 @@ class XBeeWatercounterValve(XBeeWatercounterEntity, ValveEntity):
     """Representation of an XBee Watercounter valves."""
 
     _attr_supported_features = (
-        ValveEntityFeature.OPEN | ValveEntityFeature.CLOSE | ValveEntityFeature.STOP
+        ValveEntityFeature.OPEN
+        | ValveEntityFeature.CLOSE
+        | ValveEntityFeature.STOP
+        | ValveEntityFeature.SET_POSITION
     )
 
     def __init__(
@@ -105,7 +108,7 @@ class XBeeWatercounterValve(XBeeWatercounterEntity, ValveEntity):
 
     async def async_open_valve(self) -> None:
         """Open valve."""
-        resp = await self.coordinator.client.async_command("open", self._number)
+        resp = await self.coordinator.client.async_queued_command("open", self._number)
 
         if resp == "OK":
             self._attr_is_opening = True
@@ -114,16 +117,34 @@ class XBeeWatercounterValve(XBeeWatercounterEntity, ValveEntity):
 
     async def async_close_valve(self) -> None:
         """Close the valve."""
-        resp = await self.coordinator.client.async_command("close", self._number)
+        resp = await self.coordinator.client.async_queued_command("close", self._number)
 
         if resp == "OK":
             self._attr_is_opening = False
             self._attr_is_closing = True
             self.async_write_ha_state()
 
+    async def async_set_valve_position(self, position: int) -> None:
+        """Move the valve to the position, the device stops the motor itself."""
+        if position >= 100:
+            await self.async_open_valve()
+            return
+        if position <= 0:
+            await self.async_close_valve()
+            return
+        resp = await self.coordinator.client.async_queued_command(
+            "position", self._number, position
+        )
+
+        if resp == "OK" and self._attr_current_valve_position is not None:
+            current = self._attr_current_valve_position
+            self._attr_is_opening = position > current
+            self._attr_is_closing = position < current
+            self.async_write_ha_state()
+
     async def async_stop_valve(self) -> None:
         """Stop the valve."""
-        resp = await self.coordinator.client.async_command("stop", self._number)
+        resp = await self.coordinator.client.async_queued_command("stop", self._number)
 
         if resp == "OK":
             self._attr_is_opening = False
@@ -0,0 +1,157 @@
+"""Compact binary encoding of the device commands, see flash/lib/wire.py."""
+
+from __future__ import annotations
+
+import struct
+from typing import Any
+
+MAGIC = 0xFB
+NOTIFY = 0xFF
+HEADER = struct.Struct("<BBH")
+
+_NONE = 0
+_FALSE = 1
+_TRUE = 2
+_UINT8 = 3
+_INT32 = 4
+_INT64 = 5
+_FLOAT = 6
+_STR = 7
+_LIST = 8
+_DICT = 9
+_FLOAT32 = 10
+_KEYED = 11
+_KEY_STR = 0xFF
+
+# Notification name prefixes of the one-byte keys, append only
+KEYS = ("uptime", "log", "counter", "valve", "opening", "closing", "flow", "leak")
+
+_INT32_STRUCT = struct.Struct("<i")
+_INT64_STRUCT = struct.Struct("<q")
+_FLOAT_STRUCT = struct.Struct("<d")
+_FLOAT32_STRUCT = struct.Struct("<f")
+
+
+def _pack_str(buf: bytearray, value: str) -> None:
+    value = value.encode("utf-8")
+    if len(value) > 255:
+        raise ValueError("string too long")
+    buf.append(len(value))
+    buf.extend(value)
+
+
+def _pack_value(buf: bytearray, value: Any) -> None:
+    if value is None:
+        buf.append(_NONE)
+    elif value is False:
+        buf.append(_FALSE)
+    elif value is True:
+        buf.append(_TRUE)
+    elif isinstance(value, int):
+        if 0 <= value <= 255:
+            buf += bytes((_UINT8, value))
+        elif -0x80000000 <= value <= 0x7FFFFFFF:
+            buf.append(_INT32)
+            buf += _INT32_STRUCT.pack(value)
+        else:
+            buf.append(_INT64)
+            buf += _INT64_STRUCT.pack(value)
+    elif isinstance(value, float):
+        buf.append(_FLOAT)
+        buf += _FLOAT_STRUCT.pack(value)
+    elif isinstance(value, str):
+        buf.append(_STR)
+        _pack_str(buf, value)
+    elif isinstance(value, (list, tuple)):
+        if len(value) > 255:
+            raise ValueError("list too long")
+        buf += bytes((_LIST, len(value)))
+        for item in value:
+            _pack_value(buf, item)
+    elif isinstance(value, dict):
+        if len(value) > 255:
+            raise ValueError("dict too long")
+        buf += bytes((_DICT, len(value)))
+        for key, item in value.items():
+            _pack_str(buf, key)
+            _pack_value(buf, item)
+    else:
+        raise TypeError(f"Unsupported type {type(value).__name__}")
+
+
+def _unpack_str(data: bytes, pos: int) -> tuple[str, int]:
+    end = pos + 1 + data[pos]
+    return data[pos + 1 : end].decode("utf-8"), end
+
+
+def _unpack_key(data: bytes, pos: int) -> tuple[str, int]:
+    key = data[pos]
+    if key == _KEY_STR:
+        return _unpack_str(data, pos + 1)
+    name = KEYS[key >> 3]
+    if key & 7:
+        name = f"{name}_{(key & 7) - 1}"
+    return name, pos + 1
+
+
+def _unpack_value(data: bytes, pos: int) -> tuple[Any, int]:
+    tag = data[pos]
+    pos += 1
+    if tag == _NONE:
+        return None, pos
+    if tag == _FALSE:
+        return False, pos
+    if tag == _TRUE:
+        return True, pos
+    if tag == _UINT8:
+        return data[pos], pos + 1
+    if tag == _INT32:
+        return _INT32_STRUCT.unpack_from(data, pos)[0], pos + 4
+    if tag == _INT64:
+        return _INT64_STRUCT.unpack_from(data, pos)[0], pos + 8
+    if tag == _FLOAT:
+        return _FLOAT_STRUCT.unpack_from(data, pos)[0], pos + 8
+    if tag == _FLOAT32:
+        return _FLOAT32_STRUCT.unpack_from(data, pos)[0], pos + 4
+    if tag == _STR:
+        return _unpack_str(data, pos)
+    if tag == _LIST:
+        value = []
+        count = data[pos]
+        pos += 1
+        for _ in range(count):
+            item, pos = _unpack_value(data, pos)
+            value.append(item)
+        return value, pos
+    if tag in (_DICT, _KEYED):
+        unpack_key = _unpack_str if tag == _DICT else _unpack_key
+        value = {}
+        count = data[pos]
+        pos += 1
+        for _ in range(count):
+            key, pos = unpack_key(data, pos)
+            value[key], pos = _unpack_value(data, pos)
+        return value, pos
+    raise ValueError(f"Unknown type {tag}")
+
+
+def is_binary(data: bytes) -> bool:
+    """Check whether the frame is binary rather than JSON."""
+    return len(data) > 0 and data[0] == MAGIC
+
+
+def encode(code: int, request_id: int, value: Any = None) -> bytes:
+    """Return the binary frame with the value."""
+    buf = bytearray(HEADER.pack(MAGIC, code, request_id))
+    _pack_value(buf, value)
+    return bytes(buf)
+
+
+def decode(data: bytes) -> tuple[int, int, Any]:
+    """Return the command code, the request id and the value of the frame."""
+    if len(data) < HEADER.size or data[0] != MAGIC:
+        raise ValueError("Invalid frame")
+    _, code, request_id = HEADER.unpack_from(data)
+    if len(data) == HEADER.size:
+        return code, request_id, None
+    return code, request_id, _unpack_value(data, HEADER.size)[0]
@@ -15,6 +15,11 @@ _LOGGER = logging.getLogger(__name__)
 WatercounterCommands(
     config.counter,
     config.valve,
+    config.journal,
+    config.flow,
+    config.history,
+    config.leak,
+    config.crashlog,
 )
 collect()
 
@@ -40,13 +45,15 @@ if config.debug:
         alloc = mem_alloc()
         print("MEM {:.2%}".format(alloc / (alloc + mem_free())))
 
-    main_loop.schedule_task(_stats, period=1000)
+    main_loop.schedule_task(_stats, period=1000, name="stats")
 
 else:
     from machine import WDT
 
     main_loop.schedule_task(
-        (lambda wdt: lambda: wdt.feed())(WDT(timeout=30000)), period=1000
+        (lambda wdt: lambda: wdt.feed())(WDT(timeout=30000)),
+        period=1000,
+        name="wdt",
     )
     kbd_intr(-1)
 
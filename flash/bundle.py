@@ -1,6 +1,18 @@
-"""Install bundle."""
+"""Install bundle.
 
+The content hashes of the compiled sources are kept in a manifest, so only
+the changed modules are compiled and the bundle is rebuilt only when one of
+its modules changed. The manifest is saved after every module, so after the
+reset on a memory error the compilation resumes where it stopped.
+
+The installer is compiled on every deploy to run again after the reset, and
+removed once done. Only a change of its source bundles it.
+"""
+
+from binascii import hexlify
 from gc import collect
+from hashlib import sha256
+from json import dump, load
 
 import machine
 import uos
@@ -9,47 +21,104 @@ from xbee import atcmd
 
 _bundle_list = [
     "lib/logging.mpy",
+    "lib/gcpolicy.mpy",
+    "lib/wire.mpy",
     "lib/core.mpy",
     "lib/mainloop.mpy",
     "lib/xbeepin.mpy",
+    "lib/journal.mpy",
+    "lib/crashlog.mpy",
     "valve.mpy",
     "counter.mpy",
+    "leak.mpy",
     "commands.mpy",
     "config.mpy",
     "__init__.mpy",
 ]
 
+_MANIFEST = "bundle.json"
+
+
+def _load_manifest():
+    """Return the saved manifest, a missing one rebuilds everything."""
+    try:
+        with open(_MANIFEST) as f:
+            return load(f)
+    except (OSError, ValueError):
+        return {"files": {}, "dirty": True}
+
+
+def _save_manifest():
+    """Write the manifest."""
+    with open(_MANIFEST, "w") as f:
+        dump(_manifest, f)
+
+
+def _digest(name):
+    """Return the content hash of the file."""
+    digest = sha256()
+    with open(name, "rb") as f:
+        while True:
+            chunk = f.read(256)
+            if not chunk:
+                break
+            digest.update(chunk)
+    return hexlify(digest.digest()[:8]).decode()
+
+
+_manifest = _load_manifest()
+
 atcmd("AP", 0)
 
-# First stage: compile files
+# First stage: compile the changed files
 if any(file.endswith(".py") for file in uos.listdir() + uos.listdir("lib")):
     opt_level(3)
 
-    def compile_file(name):
-        """Compile a single file."""
+    def compile_file(name, path, listing):
+        """Compile a single file unless compiled from the same source.
+
+        Return True if the source changed.
+        """
+        mpy = name[:-3] + ".mpy"
         try:
-            uos.remove(name.replace(".py", ".mpy"))
+            digest = _digest(name)
         except OSError:
-            pass
-        collect()
-        uos.compile(name)
+            digest = None
+        changed = digest is None or _manifest["files"].get(path) != digest
+        if changed or mpy not in listing:
+            try:
+                uos.remove(mpy)
+            except OSError:
+                pass
+            collect()
+            uos.compile(name)
+            _manifest["files"][path] = digest
+            if path[:-3] + ".mpy" in _bundle_list:
+                _manifest["dirty"] = True
+            _save_manifest()
         uos.remove(name)
+        return changed
 
     def compile_dir(name="."):
         """Compile the files in directory (non-recursive)."""
         cwd = uos.getcwd()
         uos.chdir(name)
-        for filename in uos.listdir():
+        prefix = "" if name == "." else name + "/"
+        listing = uos.listdir()
+        for filename in listing:
             if filename.endswith(".py"):
-                compile_file(filename)
+                compile_file(filename, prefix + filename, listing)
         uos.chdir(cwd)
 
     try:
         # First compile main.py and bundle.py
-        if "main.py" in uos.listdir():
-            compile_file("main.py")
-        if "bundle.py" in uos.listdir():
-            compile_file("bundle.py")
+        listing = uos.listdir()
+        if "main.py" in listing:
+            compile_file("main.py", "main.py", listing)
+        if "bundle.py" in listing and compile_file("bundle.py", "bundle.py", listing):
+            # Bundling it replaces the bundle of the modules
+            _manifest["dirty"] = True
+            _save_manifest()
             uos.bundle("bundle.mpy")
         compile_dir()
         compile_dir("lib")
@@ -59,15 +128,28 @@ if any(file.endswith(".py") for file in uos.listdir() + uos.listdir("lib")):
         uos.sync()
         machine.soft_reset()  # Retry or continue after reboot
 
-# Second stage: bundle
-if "bundle" in uos.bundle():
+# Second stage: bundle if any of the modules changed
+if _manifest["dirty"]:
+    if "bundle" in uos.bundle():
 
-    def _unbundle():
-        uos.bundle(None)
-        machine.soft_reset()
+        def _unbundle():
+            uos.bundle(None)
+            machine.soft_reset()
 
-    _unbundle()
-uos.remove("bundle.mpy")
-uos.sync()
-collect()
-uos.bundle(*_bundle_list)
+        _unbundle()
+    try:
+        uos.remove("bundle.mpy")
+    except OSError:
+        pass  # Not compiled this time
+    _manifest["dirty"] = False
+    _save_manifest()
+    uos.sync()
+    collect()
+    try:
+        uos.bundle(*_bundle_list)
+    except Exception:
+        _manifest["dirty"] = True
+        _save_manifest()
+        raise
+elif "bundle.mpy" in uos.listdir():
+    uos.remove("bundle.mpy")
@@ -1,28 +1,64 @@
 """Module defines remote commands."""
 
-from json import dumps as json_dumps
-
 from lib.core import Commands
 
 
 class WatercounterCommands(Commands):
     """Define application remote commands."""
 
+    _wire_table = (
+        "atcmd",
+        "bind",
+        "close",
+        "counter",
+        "crashlog",
+        "help",
+        "history",
+        "journal",
+        "leak",
+        "logger",
+        "open",
+        "position",
+        "reset_cause",
+        "snapshot",
+        "soft_reset",
+        "stats",
+        "stop",
+        "test",
+        "unbind",
+        "unique_id",
+        "uptime",
+        "valve",
+        "wire",
+    )
+
     def __init__(
         self,
         counter,
         valve,
+        journal=None,
+        flow=None,
+        history=None,
+        leak=None,
+        crashlog=None,
     ):
         """Init the module."""
         super().__init__()
         self._counter = counter
         self._valve = valve
+        self._journal = journal
+        self._flow = flow
+        self._history = history
+        self._leak = leak
+        self._crashlog = crashlog
 
         self._binds = {
             "counter": [{}, {}, {}],
             "valve": [{}, {}, {}],
             "opening": [{}, {}, {}],
             "closing": [{}, {}, {}],
+            "flow": [{}, {}, {}],
+            "leak": [{}, {}, {}],
         }
 
     def __del__(self):
@@ -51,6 +87,11 @@ class WatercounterCommands(Commands):
         self._valve[number].close()
         return "OK"
 
+    def cmd_position(self, sender_eui64, number, position):
+        """Move the valve to the position."""
+        self._valve[number].set_position(position)
+        return "OK"
+
     def cmd_stop(self, sender_eui64, number):
         """Cancel current operation."""
         self._valve[number].stop()
@@ -63,6 +104,88 @@ class WatercounterCommands(Commands):
         self._counter[number].state = state
         return "OK"
 
+    def cmd_history(self, sender_eui64, number, cursor=None, count=None):
+        """Get the counter consumption per interval starting from the cursor."""
+        if self._history is None:
+            return None
+        return self._history[number].read(cursor, count)
+
+    def cmd_leak(
+        self,
+        sender_eui64,
+        number,
+        max_rate=None,
+        max_duration=None,
+        max_gap=None,
+        reset=False,
+    ):
+        """Get or set the leak detection rules, zero disables a rule."""
+        if self._leak is None:
+            return None
+        leak = self._leak[number]
+        if max_rate is not None:
+            leak.max_rate = max_rate or None
+        if max_duration is not None:
+            leak.max_duration = max_duration or None
+        if max_gap is not None:
+            leak.max_gap = max_gap
+        if reset:
+            leak.reset()
+        return {
+            "state": leak.state,
+            "max_rate": leak.max_rate,
+            "max_duration": leak.max_duration,
+            "max_gap": leak.max_gap,
+        }
+
+    def cmd_snapshot(self, sender_eui64=None, bind=False):
+        """Get the state of all entities in one response.
+
+        The keys are short to fit the response in one frame: up for the
+        uptime, rc for the reset cause, c, v, f and l for the counters, the
+        valves, the flow rates and the leak states, m for the valve motion,
+        1 opening, -1 closing or 0, j for the journal flag and h for the
+        lowest sequence number of the histories.
+        """
+        if bind:
+            self.cmd_bind(sender_eui64)
+        return {
+            "up": self.cmd_uptime(sender_eui64),
+            "rc": self.cmd_reset_cause(sender_eui64),
+            "c": [counter.state for counter in self._counter],
+            "v": [valve.state for valve in self._valve],
+            "m": [
+                1 if valve.is_opening.state else -1 if valve.is_closing.state else 0
+                for valve in self._valve
+            ],
+            "f": [flow.state for flow in self._flow] if self._flow else None,
+            "l": [leak.state for leak in self._leak] if self._leak else None,
+            "j": self.cmd_journal(sender_eui64),
+            "h": min(x.seq for x in self._history) if self._history else None,
+        }
+
+    def cmd_journal(self, sender_eui64=None, save=False):
+        """Return whether the counters were restored from flash on boot."""
+        if self._journal is None:
+            return False
+        if save:
+            self._journal.save(force=True)
+        return self._journal.restored
+
+    def cmd_crashlog(self, sender_eui64=None, index=0, clear=False):
+        """Get the fault record by its index from the newest, or clear them."""
+        if self._crashlog is None:
+            return None
+        if clear:
+            self._crashlog.clear()
+            return "OK"
+        records = self._crashlog.read()
+        if index >= len(records):
+            return {"count": len(records)}
+        record = records[index]
+        record["count"] = len(records)
+        return record
+
     def cmd_bind(self, sender_eui64, target=None):
         """Subscribe to updates."""
         target = bytes(target, encoding="utf-8") if target is not None else sender_eui64
@@ -70,7 +193,7 @@ class WatercounterCommands(Commands):
         def bind(entity, binds, name):
             if target not in binds:
                 binds[target] = entity.subscribe(
-                    lambda x: self._transmit(target, json_dumps({name: x}))
+                    lambda x: self._notify(target, name, x)
                 )
 
         for number in range(3):
@@ -94,6 +217,18 @@ class WatercounterCommands(Commands):
                 self._binds["closing"][number],
                 "closing_{}".format(number),
             )
+            if self._flow:
+                bind(
+                    self._flow[number],
+                    self._binds["flow"][number],
+                    "flow_{}".format(number),
+                )
+            if self._leak:
+                bind(
+                    self._leak[number],
+                    self._binds["leak"][number],
+                    "leak_{}".format(number),
+                )
         return "OK"
 
     def cmd_unbind(self, sender_eui64=None, target=None):
@@ -113,4 +248,8 @@ class WatercounterCommands(Commands):
             unbind(self._valve[number], self._binds["valve"][number])
             unbind(self._valve[number].is_opening, self._binds["opening"][number])
             unbind(self._valve[number].is_closing, self._binds["closing"][number])
+            if self._flow:
+                unbind(self._flow[number], self._binds["flow"][number])
+            if self._leak:
+                unbind(self._leak[number], self._binds["leak"][number])
         return "OK"
@@ -2,8 +2,13 @@
 
 from gc import collect
 
-from counter import Counter
-from lib.xbeepin import DigitalInput, DigitalOutput
+from counter import Counter, FlowRate, History
+from leak import LeakDetector
+from lib import gcpolicy
+from lib.crashlog import CrashLog
+from lib.journal import Journal
+from lib.mainloop import main_loop
+from lib.xbeepin import DebouncedInput, DigitalOutput, PulseInput
 from machine import Pin
 from valve import Valve
 
@@ -11,18 +16,52 @@ collect()
 
 debug = False
 
+gcpolicy.set_mode(gcpolicy.IDLE, threshold=4096)
+
+# Keep the exceptions and the tasks running over a third of the watchdog
+# timeout in flash to find out the cause of the resets
+crashlog = CrashLog()
+main_loop.set_fault_handler(crashlog.record, overrun=10000)
+
 Pin("D0", mode=Pin.ALT, alt=Pin.AF0_COMMISSION)
 Pin("D5", mode=Pin.ALT, alt=Pin.AF5_ASSOC_IND)
 Pin("D10", mode=Pin.ALT, alt=Pin.AF10_RSSI)
+
+
+def _input(gpio):
+    """Count the meter pulses with interrupts where the firmware supports them.
+
+    Otherwise the pins are polled every 500 ms, less than the meter contacts
+    stay closed, and every 20 ms only while a change is debounced.
+    """
+    if hasattr(Pin, "irq"):
+        return PulseInput(gpio, rise_time=50, name=gpio)
+    return DebouncedInput(gpio, rise_time=100, name=gpio)
+
+
 counter = [
-    Counter(sensor=DigitalInput("D4")),
-    Counter(sensor=DigitalInput("D6")),
-    Counter(sensor=DigitalInput("D7")),
+    Counter(sensor=_input("D4")),
+    Counter(sensor=_input("D6")),
+    Counter(sensor=_input("D7")),
 ]
+# Restore the counters saved before the reset and keep saving them on every
+# 10 L pulse, about one file rewrite per 640 L with 64 records per file
+journal = Journal("counter", len(counter))
+journal.track(counter, threshold=10, period=600000)
+
+# The tasks are named per line to tell them apart in the loop stats
+flow = [FlowRate(x, name="flow{}".format(n)) for n, x in enumerate(counter)]
+history = [History(x, name="history{}".format(n)) for n, x in enumerate(counter)]
+
 valve = [
     Valve(direction_switch=DigitalOutput("D1"), power_switch=DigitalOutput("D2")),
     Valve(direction_switch=DigitalOutput("D3"), power_switch=DigitalOutput("D8")),
     Valve(direction_switch=DigitalOutput("D9"), power_switch=DigitalOutput("D11")),
 ]
+# The leak rules are off until they are set remotely with the leak command
+leak = [
+    LeakDetector(counter[x], flow[x], valve[x], name="leak{}".format(x))
+    for x in range(3)
+]
 
 collect()
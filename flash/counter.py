@@ -1,13 +1,23 @@
 """Counter implementation."""
 
+from array import array
+from time import ticks_diff, ticks_ms
+
 from lib import logging
 from lib.core import Sensor
+from lib.mainloop import main_loop
 
 _LOGGER = logging.getLogger(__name__)
 
 
 class Counter(Sensor):
-    """Representation of a Counter."""
+    """Representation of a Counter.
+
+    The sensor is either a binary sensor following the meter switch, or an
+    edge counting sensor with a ``level`` property, such as
+    ``lib.xbeepin.PulseInput``. The ``volume`` sensor adds up what the meter
+    counted since the start, setting the counter does not change it.
+    """
 
     _type = int
 
@@ -24,35 +34,192 @@ class Counter(Sensor):
         self._sensor = sensor
         self._point_lo_hi = point_lo_hi
         self._point_hi_lo = point_hi_lo
+        self.volume = Sensor(0)
 
-        self._sensor_subscriber = self._sensor.subscribe(
-            lambda x: self._sensor_changed(x)
-        )
-
-        self._sensor_changed(self._sensor.state)
+        if hasattr(sensor, "level"):
+            self._edges = sensor.state
+            self._sensor_subscriber = sensor.subscribe(lambda x: self._edges_changed(x))
+            self._sensor_changed(sensor.level)
+        else:
+            self._sensor_subscriber = sensor.subscribe(
+                lambda x: self._sensor_changed(x)
+            )
+            self._sensor_changed(sensor.state)
 
     def __del__(self):
         """Cancel callbacks."""
         self._sensor.unsubscribe(self._sensor_subscriber)
 
-    def _sensor_changed(self, new_state):
-        """Handle sensor changes."""
-        if new_state is None:
-            return
-
-        lastdigit = self.state % 10
+    def _advance(self, value, new_state):
+        """Return the counter value after the sensor switched to the new state."""
+        lastdigit = value % 10
         if self._point_hi_lo < self._point_lo_hi:
             state = lastdigit < self._point_hi_lo or self._point_lo_hi <= lastdigit
         else:
             state = self._point_lo_hi <= lastdigit and lastdigit < self._point_hi_lo
 
         if state == new_state:
-            return
+            return value
 
         new_lastdigit = self._point_lo_hi if new_state else self._point_hi_lo
 
-        self.state += (
+        return value + (
             new_lastdigit - lastdigit
             if new_lastdigit > lastdigit
             else new_lastdigit + 10 - lastdigit
         )
+
+    def _sensor_changed(self, new_state):
+        """Handle sensor changes."""
+        if new_state is None:
+            return
+
+        self._count(self._advance(self.state, new_state))
+
+    def _edges_changed(self, edges):
+        """Fold the edges counted since the last update."""
+        count = edges - self._edges
+        self._edges = edges
+        if count <= 0:
+            return
+
+        # Replay the edges so that the last one leaves the current level
+        level = self._sensor.level
+        first = level if count % 2 else not level
+        value = self._advance(self.state, first)
+        value += (count - 1) // 2 * 10
+        if not count % 2:
+            value = self._advance(value, level)
+        self._count(value)
+
+    def _count(self, value):
+        """Set the counted value and add the difference to the volume."""
+        delta = value - self.state
+        self.state = value
+        if delta > 0:
+            self.volume.state += delta
+
+
+class FlowRate(Sensor):
+    """Flow rate in liters per minute derived from the counter pulse timing.
+
+    The ticks and the counted volumes of the last pulses are kept in a small
+    ring, the rate is the volume over the time they span. Without new pulses
+    the rate decays as if the next pulse was about to come, and drops to zero
+    after the timeout.
+    """
+
+    _readonly = True
+    _type = int
+    _period = 10000
+    _lowpass = 60000
+    _size = 8
+    _timeout = 600000
+
+    def __init__(self, counter, *args, **kwargs):
+        """Initialize the flow rate sensor."""
+        self._counter = counter
+        self._ticks = array("l", [0] * self._size)
+        self._values = array("l", [0] * self._size)
+        self._head = 0
+        self._count = 0
+        super().__init__(*args, **kwargs)
+        self._counter_subscriber = counter.volume.subscribe(lambda x: self._pulse(x))
+
+    def __del__(self):
+        """Cancel callbacks."""
+        if self._counter_subscriber is not None:
+            self._counter.volume.unsubscribe(self._counter_subscriber)
+            self._counter_subscriber = None
+        super().__del__()
+
+    def _pulse(self, value):
+        """Record the counted volume with the current time."""
+        self._head = (self._head + 1) % self._size
+        self._ticks[self._head] = ticks_ms()
+        self._values[self._head] = value
+        if self._count < self._size:
+            self._count += 1
+        self.update(auto=True)
+
+    def _get(self):
+        """Calculate the flow rate."""
+        if self._count < 2:
+            return 0
+        head = self._head
+        first = (head - self._count + 1) % self._size
+        idle = ticks_diff(ticks_ms(), self._ticks[head])
+        if idle >= self._timeout:
+            self._count = 0
+            return 0
+        span = ticks_diff(self._ticks[head], self._ticks[first])
+        volume = self._values[head] - self._values[first]
+        if span <= 0:
+            return 0
+        rate = volume * 60000 // span
+        # Past the average pulse interval the flow must have slowed down
+        pulses = self._count - 1
+        if idle * pulses > span:
+            rate = min(rate, volume * 60000 // (idle * pulses))
+        return rate
+
+
+class History:
+    """Consumption of a counter per interval in a preallocated ring.
+
+    The consumption is the volume counted from the meter, setting the counter
+    does not change it. Every recorded interval gets the next sequence number,
+    which serves as the download cursor. The ring keeps the last size
+    intervals.
+    """
+
+    _chunk = 16  # Intervals per response, fits the payload size
+
+    def __init__(self, counter, size=288, interval=300000, name="history"):
+        """Initialize the history."""
+        self._counter = counter
+        self._size = size
+        self._interval = interval
+        self._data = array("H", [0] * size)
+        self._seq = 0
+        self._last = counter.volume.state
+        self._time = ticks_ms()
+        self._task = main_loop.schedule_task(
+            lambda: self._record(), next_run=interval, period=interval, name=name
+        )
+
+    def __del__(self):
+        """Cancel callbacks."""
+        main_loop.remove_task(self._task)
+
+    def _record(self):
+        """Record the consumption since the last interval."""
+        value = self._counter.volume.state
+        delta = min(value - self._last, 0xFFFF)
+        self._data[self._seq % self._size] = delta
+        self._last = value
+        self._seq += 1
+        self._time = ticks_ms()
+
+    @property
+    def seq(self):
+        """Return the sequence number of the next interval."""
+        return self._seq
+
+    def read(self, cursor=None, count=None):
+        """Return the intervals starting from the cursor.
+
+        An unknown or expired cursor starts from the oldest interval kept.
+        The age is the time in ms since the end of the last interval.
+        """
+        first = max(0, self._seq - self._size)
+        if cursor is None or cursor < first or cursor > self._seq:
+            cursor = first
+        end = min(self._seq, cursor + (self._chunk if count is None else count))
+        return {
+            "seq": self._seq,
+            "age": ticks_diff(ticks_ms(), self._time),
+            "interval": self._interval,
+            "cursor": cursor,
+            "data": [self._data[x % self._size] for x in range(cursor, end)],
+        }
@@ -0,0 +1,96 @@
+"""Leak detection implementation."""
+
+from time import ticks_diff, ticks_ms
+
+from lib import logging
+from lib.core import Sensor
+from lib.mainloop import main_loop
+
+_LOGGER = logging.getLogger(__name__)
+
+RATE = "rate"
+DURATION = "duration"
+
+
+class LeakDetector(Sensor):
+    """Close the valve locally when the water flow looks like a leak.
+
+    The flow trips the detector when its rate exceeds max_rate (L/min) or when
+    it lasts longer than max_duration (ms). The flow is continuous while the
+    counted pulses come less than max_gap (ms) apart, setting the counter is
+    not a pulse. The state is None or the
+    rule that tripped, and it is cleared when the valve is opened again.
+    """
+
+    def __init__(
+        self,
+        counter,
+        flow,
+        valve,
+        max_rate=None,
+        max_duration=None,
+        max_gap=300000,
+        period=10000,
+        name="leak",
+        *args,
+        **kwargs,
+    ):
+        """Initialize the leak detector."""
+        self._counter = counter
+        self._flow = flow
+        self._valve = valve
+        self.max_rate = max_rate
+        self.max_duration = max_duration
+        self.max_gap = max_gap
+        self._start = None
+        self._last = None
+        super().__init__(*args, **kwargs)
+        self._counter_subscriber = counter.volume.subscribe(lambda x: self._pulse())
+        self._valve_subscriber = valve.is_opening.subscribe(
+            lambda x: self.reset() if x else None
+        )
+        self._task = main_loop.schedule_task(
+            lambda: self.check(), next_run=period, period=period, name=name
+        )
+
+    def __del__(self):
+        """Cancel callbacks."""
+        main_loop.remove_task(self._task)
+        self._counter.volume.unsubscribe(self._counter_subscriber)
+        self._valve.is_opening.unsubscribe(self._valve_subscriber)
+        super().__del__()
+
+    def _pulse(self):
+        """Extend the continuous flow by the counter pulse."""
+        now = ticks_ms()
+        if self._last is None or ticks_diff(now, self._last) > self.max_gap:
+            self._start = now
+        self._last = now
+        self.check()
+
+    def check(self):
+        """Apply the rules to the current flow."""
+        if self._last is not None and ticks_diff(ticks_ms(), self._last) > self.max_gap:
+            self._start = self._last = None
+        if self.state is not None or self._valve.is_closing.state:
+            return
+        if self.max_rate is not None and self._flow.state > self.max_rate:
+            self._trip(RATE)
+        elif (
+            self.max_duration is not None
+            and self._start is not None
+            and ticks_diff(self._last, self._start) >= self.max_duration
+        ):
+            self._trip(DURATION)
+
+    def _trip(self, rule):
+        """Close the valve and report the rule."""
+        _LOGGER.warning("Leak detected: %s", rule)
+        self.state = rule
+        self._valve.close()
+
+    def reset(self):
+        """Clear the tripped state and the flow duration."""
+        self._start = self._last = None
+        if self.state is not None:
+            self.state = None
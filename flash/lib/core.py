@@ -1,17 +1,26 @@
 """Implementation of Sensor and Switch classes with event subscription support."""
 
 from binascii import hexlify
-from gc import collect
 from json import dumps as json_dumps, loads as json_loads
 from time import ticks_diff, ticks_ms
 
-from lib import logging
+from lib import logging, wire
+from lib.gcpolicy import collect
 from lib.mainloop import main_loop
 from machine import reset_cause, soft_reset, unique_id
 from xbee import ADDR_COORDINATOR, atcmd, receive, transmit
 
+try:
+    from xbee import receive_callback
+except ImportError:
+    receive_callback = None
+
 _LOGGER = logging.getLogger(__name__)
 
+_TOO_LARGE = {"err": "Response too large"}
+_TOO_LARGE_SIZE = len(json_dumps(_TOO_LARGE)) + 2  # With the ", " separator
+_BUSY = {"err": "Receive queue full"}
+
 
 class Sensor:
     """Base class."""
@@ -22,8 +31,8 @@ class Sensor:
     _period = None
     _lowpass = None
 
-    def __init__(self, value=None, period=None, lowpass=None):
-        """Init the class."""
+    def __init__(self, value=None, period=None, lowpass=None, name=None):
+        """Init the class, the name of the update task defaults to the class."""
         self._triggers = []
         self._state = None
         self._last_callback_value = None
@@ -48,6 +57,7 @@ class Sensor:
                 lambda: self.update(auto=True),
                 next_run=self._period,
                 period=self._period,
+                name=type(self).__name__ if name is None else name,
             )
         else:
             self._updates = None
@@ -66,8 +76,9 @@ class Sensor:
                 callback(value)
                 collect()
             except Exception as e:
-                _LOGGER.error("callback error for {}".format(callback))
-                _LOGGER.error("{}: {}".format(type(e).__name__, e))
+                _LOGGER.error("callback error for %s", callback)
+                _LOGGER.error("%s: %s", type(e).__name__, e)
+                main_loop.fault(e)
 
     def subscribe(self, callback):
         """Add new callback."""
@@ -136,25 +147,153 @@ class Switch(Sensor):
 class Commands:
     """Define application remote commands."""
 
-    def __init__(self):
+    _rx_queue_size = 4
+    _rx_budget_count = 4  # Frames handled per update run
+    _rx_budget_ms = 50  # Time spent handling frames per update run
+    # Check of the wake flag while sleeping, None handles the received frames
+    # on the next run of any task, within the shortest task period
+    _wake_interval = None
+    _max_payload = 255
+    # Names of the binary command codes, append only. Without a table the codes
+    # follow the sorted command list.
+    _wire_table = None
+    _tx_queue_size = 8
+    _tx_retries = 5
+    _tx_backoff_min = 50
+    _tx_backoff_max = 800
+
+    def __init__(self, event_driven=True):
         """Init the module."""
-        self._updates = main_loop.schedule_task(lambda: self.update(), period=500)
+        self._commands = sorted(name[4:] for name in dir(self) if name[:4] == "cmd_")
+        # Command name -> (bound method, response key)
+        self._dispatch = {
+            name: (getattr(self, "cmd_" + name), "{}_resp".format(name))
+            for name in self._commands
+        }
+        # The index in the table is the binary command code
+        self._codes = self._commands if self._wire_table is None else self._wire_table
+        # Senders using the binary wire protocol
+        self._binary = set()
+        if event_driven and receive_callback is not None:
+            # Frames are delivered by the firmware and handled on the next turn
+            self._frames = []
+            self._updates = None
+            receive_callback(lambda x: self._on_receive(x))
+            main_loop.set_wake_interval(self._wake_interval)
+        else:
+            # No callback support, poll the receive queue
+            self._frames = None
+            self._updates = main_loop.schedule_task(
+                lambda: self.update(), period=500, name="commands"
+            )
+        self._backlog = None
+        self._rejects = []
+        self._outbox = {}
+        self._flush_task = None
+        # Transmit ring buffer, filled only while the transfer buffer is full
+        self._tx_eui64 = [None] * self._tx_queue_size
+        self._tx_data = [None] * self._tx_queue_size
+        self._tx_key = [None] * self._tx_queue_size
+        self._tx_tries = bytearray(self._tx_queue_size)
+        self._tx_head = 0
+        self._tx_count = 0
+        self._tx_backoff = self._tx_backoff_min
+        self._tx_task = None
         self._last_upd = ticks_ms()
         self._uptime = 0
         self._uptime_cb = main_loop.schedule_task(
-            lambda: self._uptime_upd(), period=30000
+            lambda: self._uptime_upd(), period=30000, name="uptime"
         )
 
     def __del__(self):
         """Cancel callbacks."""
+        if self._frames is not None:
+            receive_callback(None)
+            main_loop.set_wake_interval()
+            self._frames = None
         main_loop.remove_task(self._updates)
+        main_loop.remove_task(self._backlog)
+        main_loop.remove_task(self._flush_task)
+        main_loop.remove_task(self._tx_task)
+        self._outbox = {}
         if self._uptime_cb is not None:
             main_loop.remove_task(self._uptime_cb)
 
+    def _on_receive(self, frame):
+        """Queue the frame delivered by the receive callback.
+
+        The frames over the queue size are answered with an error, sent on the
+        next turn as well.
+        """
+        if len(self._frames) >= self._rx_queue_size:
+            response = None
+            if len(self._rejects) < self._rx_queue_size:
+                try:
+                    response = self._busy(frame)
+                except Exception:
+                    pass  # Not a command frame
+            if response is None:
+                _LOGGER.warning("Receive queue full, frame dropped")
+                return
+            self._rejects.append((frame["sender_eui64"], response))
+        else:
+            self._frames.append(frame)
+        if self._updates is None or self._updates.next_run is None:
+            self._updates = main_loop.schedule_task(
+                lambda: self.update(), name="commands"
+            )
+        main_loop.wake()
+
+    def _busy(self, x):
+        """Return the error response to the frame."""
+        payload = x["payload"]
+        if payload and payload[0] == wire.MAGIC:
+            if len(payload) < wire.HEADER_SIZE:
+                raise ValueError("invalid frame")
+            return wire.encode(payload[1], payload[2] | payload[3] << 8, _BUSY)
+        d = json_loads(payload)
+        cmd = "batch_resp" if "batch" in d else "{}_resp".format(d["cmd"])
+        response = {cmd: _BUSY}
+        if d.get("id") is not None:
+            response["id"] = d["id"]
+        return json_dumps(response)
+
+    def _receive(self):
+        """Return the next received frame or None."""
+        if self._frames is None:
+            return receive()
+        if self._frames:
+            return self._frames.pop(0)
+        return None
+
+    def _next_frame(self, start, handled):
+        """Return the next frame or None if the budget of the run is spent."""
+        if (
+            handled >= self._rx_budget_count
+            or ticks_diff(ticks_ms(), start) >= self._rx_budget_ms
+        ):
+            # Let other tasks run, the remaining frames are handled right after
+            if self._backlog is None or self._backlog.next_run is None:
+                self._backlog = main_loop.schedule_task(
+                    lambda: self.update(), name="commands"
+                )
+            return None
+        return self._receive()
+
     def update(self):
         """Receive commands."""
-        x = receive()
+        while self._rejects:
+            self._transmit(*self._rejects.pop(0))
+        start = ticks_ms()
+        handled = 0
+        x = self._receive()
         while x is not None:
+            handled += 1
+            if x["payload"] and x["payload"][0] == wire.MAGIC:
+                self._update_binary(x)
+                x = self._next_frame(start, handled)
+                continue
+
             # Example: {
             #    "broadcast": False,
             #    "dest_ep": 232,
@@ -168,69 +307,275 @@ class Commands:
             try:
                 cmd = None
                 d = json_loads(x["payload"])
-                cmd = d["cmd"]
-                args = d.get("args")
+                req_id = d.get("id")
                 sender_eui64 = x["sender_eui64"]
-                x = None
-                d = None
-                collect()
-                method = "cmd_{}".format(cmd)
-                if hasattr(self, method):
-                    method = getattr(self, method)
-                    if args is None:
-                        response = method(sender_eui64=sender_eui64)
-                    elif isinstance(args, dict):
-                        response = method(sender_eui64=sender_eui64, **args)
-                    elif (
-                        isinstance(args, list)
-                        and len(args) == 2
-                        and isinstance(args[0], list)
-                        and isinstance(args[1], dict)
-                    ):
-                        response = method(sender_eui64, *args[0], **args[1])
-                    elif isinstance(args, list):
-                        response = method(sender_eui64, *args)
-                    else:
-                        response = method(sender_eui64, args)
-                    method = None
-                    args = None
+                if "batch" in d:
+                    # Example: {"batch": [{"cmd": "open", "args": 0}, ...]}
+                    cmd = "batch_resp"
+                    args = d["batch"]
+                    x = None
+                    d = None
                     collect()
-                    response = {"{}_resp".format(cmd): response}
+                    if not isinstance(args, list):
+                        raise TypeError("batch must be a list")
+                    response = self._execute_batch(sender_eui64, args)
                 else:
-                    raise AttributeError("No such command")
+                    cmd = d["cmd"]
+                    entry = self._dispatch.get(cmd)
+                    cmd = "{}_resp".format(cmd) if entry is None else entry[1]
+                    args = d.get("args")
+                    x = None
+                    d = None
+                    collect()
+                    response = self._execute(sender_eui64, entry, args)
+                    entry = None
+                args = None
+                collect()
+                response = {cmd: response}
             except Exception as e:
                 if cmd is not None:
-                    response = {
-                        "{}_resp".format(cmd): {
-                            "err": "{}: {}".format(type(e).__name__, e)
-                        }
-                    }
+                    response = {cmd: {"err": "{}: {}".format(type(e).__name__, e)}}
                 else:
                     raise ValueError("invalid json")
 
+            if req_id is not None:
+                response["id"] = req_id
             self._transmit(sender_eui64, json_dumps(response))
             response = None
             sender_eui64 = None
             cmd = None
+            req_id = None
             collect()
 
-            x = receive()
+            x = self._next_frame(start, handled)
 
-    def _transmit(self, eui64, data, limit=3):
-        """Retries sending data on full transfer buffer."""
+    def _update_binary(self, x):
+        """Execute the command from the binary frame."""
+        sender_eui64 = x["sender_eui64"]
+        try:
+            code, req_id, args = wire.decode(x["payload"])
+        except Exception:
+            raise ValueError("invalid frame")
+        x = None
+        self._binary.add(sender_eui64)
         try:
-            transmit(eui64, data)
+            entry = None
+            if code < len(self._codes):
+                entry = self._dispatch.get(self._codes[code])
+            response = self._execute(sender_eui64, entry, args)
+            entry = None
+            args = None
+            collect()
+            response = wire.encode(code, req_id, response)
         except Exception as e:
-            _LOGGER.error("Exception on transmit: {}: {}".format(type(e).__name__, e))
-            if isinstance(e, OSError) and "EAGAIN" in str(e) and limit > 1:
-                main_loop.schedule_task(
-                    (
-                        lambda eui64, data, limit: lambda: self._transmit(
-                            eui64, data, limit
-                        )
-                    )(eui64, data, limit - 1),
-                    next_run=50,
-                )
+            response = wire.encode(
+                code, req_id, {"err": "{}: {}".format(type(e).__name__, e)}
+            )
+        self._transmit(sender_eui64, response)
+        response = None
+        collect()
+
+    def _execute(self, sender_eui64, entry, args):
+        """Run the dispatch table entry and return the result."""
+        if entry is None:
+            raise AttributeError("No such command")
+        method = entry[0]
+        if args is None:
+            return method(sender_eui64=sender_eui64)
+        if isinstance(args, dict):
+            return method(sender_eui64=sender_eui64, **args)
+        if (
+            isinstance(args, list)
+            and len(args) == 2
+            and isinstance(args[0], list)
+            and isinstance(args[1], dict)
+        ):
+            return method(sender_eui64, *args[0], **args[1])
+        if isinstance(args, list):
+            return method(sender_eui64, *args)
+        return method(sender_eui64, args)
+
+    def _execute_batch(self, sender_eui64, items):
+        """Run the batch items while their results fit in the response frame.
+
+        The items left when the frame is full are not run, so the response list
+        is shorter than the batch. A result too large for the frame is replaced
+        with an error.
+        """
+        response = []
+        size = len('{"batch_resp": [], "id": 65535}')
+        for item in items:
+            if size + _TOO_LARGE_SIZE > self._max_payload:
+                break
+            result = self._execute_item(sender_eui64, item)
+            length = len(json_dumps(result)) + 2  # With the ", " separator
+            if size + length > self._max_payload:
+                result = _TOO_LARGE
+                length = _TOO_LARGE_SIZE
+            size += length
+            response.append(result)
+        return response
+
+    def _execute_item(self, sender_eui64, item):
+        """Run a command from a batch and return the result or the error."""
+        try:
+            return self._execute(
+                sender_eui64, self._dispatch.get(item["cmd"]), item.get("args")
+            )
+        except Exception as e:
+            return {"err": "{}: {}".format(type(e).__name__, e)}
+
+    def _transmit(self, eui64, data, key=None):
+        """Send data or queue it when the transfer buffer is full.
+
+        The key of a notification is the target and the tuple of the names. A
+        queued frame is superseded by a newer one carrying all its names.
+        """
+        if not self._tx_count:
+            try:
+                transmit(eui64, data)
+                return
+            except Exception as e:
+                _LOGGER.error("Exception on transmit: %s: %s", type(e).__name__, e)
+                if not (isinstance(e, OSError) and "EAGAIN" in str(e)):
+                    return
+        self._tx_enqueue(eui64, data, key)
+
+    def _tx_enqueue(self, eui64, data, key):
+        """Append the frame to the transmit queue and schedule the drain task."""
+        size = self._tx_queue_size
+        if key is not None:
+            self._tx_supersede(key)
+        if self._tx_count == size:
+            _LOGGER.warning("Transmit queue full, oldest frame dropped")
+            self._tx_pop()
+        slot = (self._tx_head + self._tx_count) % size
+        self._tx_eui64[slot] = eui64
+        self._tx_data[slot] = data
+        self._tx_key[slot] = key
+        self._tx_tries[slot] = 0
+        self._tx_count += 1
+        if self._tx_task is None or self._tx_task.next_run is None:
+            self._tx_task = main_loop.schedule_task(
+                lambda: self._tx_drain(), next_run=self._tx_backoff, name="transmit"
+            )
+
+    def _tx_supersede(self, key):
+        """Drop the queued frames carrying only names of the new frame.
+
+        The new frame goes to the tail, so the state changes keep their order.
+        """
+        size = self._tx_queue_size
+        target, names = key
+        kept = 0
+        for i in range(self._tx_count):
+            slot = (self._tx_head + i) % size
+            old = self._tx_key[slot]
+            if old is not None and old[0] == target and all(x in names for x in old[1]):
+                continue
+            dest = (self._tx_head + kept) % size
+            if dest != slot:
+                self._tx_eui64[dest] = self._tx_eui64[slot]
+                self._tx_data[dest] = self._tx_data[slot]
+                self._tx_key[dest] = old
+                self._tx_tries[dest] = self._tx_tries[slot]
+            kept += 1
+        for i in range(kept, self._tx_count):
+            slot = (self._tx_head + i) % size
+            self._tx_eui64[slot] = None
+            self._tx_data[slot] = None
+            self._tx_key[slot] = None
+        self._tx_count = kept
+
+    def _tx_pop(self):
+        """Drop the frame at the head of the transmit queue."""
+        head = self._tx_head
+        self._tx_eui64[head] = None
+        self._tx_data[head] = None
+        self._tx_key[head] = None
+        self._tx_head = (head + 1) % self._tx_queue_size
+        self._tx_count -= 1
+
+    def _tx_drain(self):
+        """Send queued frames in order, backing off while the buffer is full."""
+        while self._tx_count:
+            head = self._tx_head
+            try:
+                transmit(self._tx_eui64[head], self._tx_data[head])
+            except Exception as e:
+                _LOGGER.error("Exception on transmit: %s: %s", type(e).__name__, e)
+                self._tx_tries[head] += 1
+                if (
+                    isinstance(e, OSError)
+                    and "EAGAIN" in str(e)
+                    and self._tx_tries[head] < self._tx_retries
+                ):
+                    self._tx_backoff = min(self._tx_backoff * 2, self._tx_backoff_max)
+                    self._tx_task = main_loop.schedule_task(
+                        lambda: self._tx_drain(),
+                        next_run=self._tx_backoff,
+                        name="transmit",
+                    )
+                    return
+            self._tx_pop()
+            self._tx_backoff = self._tx_backoff_min
+        collect()
+
+    def _notify(self, eui64, name, value):
+        """Queue a notification, sent merged with others on the next loop turn."""
+        pending = self._outbox.get(eui64)
+        if pending is None:
+            pending = self._outbox[eui64] = {}
+        pending[name] = value
+        if self._flush_task is None or self._flush_task.next_run is None:
+            self._flush_task = main_loop.schedule_task(
+                lambda: self._flush(), name="notify"
+            )
+
+    def _flush(self):
+        """Send queued notifications, one frame per target up to the payload size."""
+        outbox = self._outbox
+        self._outbox = {}
+        for eui64, pending in outbox.items():
+            if eui64 in self._binary:
+                self._flush_binary(eui64, pending)
+                continue
+            frame = ""
+            names = []
+            for name, value in pending.items():
+                item = json_dumps({name: value})[1:-1]
+                if len(item) + 2 > self._max_payload:
+                    _LOGGER.error("Notification %s too large, dropped", name)
+                    continue
+                # With the braces and the ", " separator
+                if frame and len(frame) + len(item) + 4 > self._max_payload:
+                    self._transmit(eui64, "{" + frame + "}", (eui64, tuple(names)))
+                    frame = ""
+                    names = []
+                frame = frame + ", " + item if frame else item
+                names.append(name)
+            if frame:
+                self._transmit(eui64, "{" + frame + "}", (eui64, tuple(names)))
+        outbox = None
+        collect()
+
+    def _flush_binary(self, eui64, pending):
+        """Send the notifications as binary frames up to the payload size."""
+        items = []
+        names = []
+        size = wire.HEADER_SIZE + 2
+        for name, value in pending.items():
+            item = wire.pack_item(name, value)
+            if items and (size + len(item) > self._max_payload or len(items) == 255):
+                self._transmit(eui64, wire.notification(items), (eui64, tuple(names)))
+                items = []
+                names = []
+                size = wire.HEADER_SIZE + 2
+            items.append(item)
+            names.append(name)
+            size += len(item)
+        if items:
+            self._transmit(eui64, wire.notification(items), (eui64, tuple(names)))
 
     def _uptime_upd(self, auto=True):
         """Set uptime notification."""
@@ -239,7 +584,9 @@ class Commands:
         self._last_upd = now
         if auto:
             self._transmit(
-                ADDR_COORDINATOR, json_dumps({"uptime": -self._uptime / 1000})
+                ADDR_COORDINATOR,
+                json_dumps({"uptime": -self._uptime / 1000}),
+                (ADDR_COORDINATOR, ("uptime",)),
             )
 
     def cmd_uptime(self, sender_eui64, uptime=None):
@@ -257,7 +604,17 @@ class Commands:
 
     def cmd_help(self, sender_eui64=None):
         """Return the list of available commands."""
-        return [cmd[4:] for cmd in dir(self) if cmd.startswith("cmd_")]
+        return self._commands
+
+    def cmd_wire(self, sender_eui64, mode=None):
+        """Select the "binary" or "json" protocol and return the command codes."""
+        if mode == "binary":
+            self._binary.add(sender_eui64)
+        elif mode == "json":
+            self._binary.discard(sender_eui64)
+        elif mode is not None:
+            raise ValueError("Unknown wire mode")
+        return self._codes
 
     def cmd_test(self, sender_eui64, *args, **kwargs):
         """Echo arguments."""
@@ -274,6 +631,25 @@ class Commands:
             logging.getLogger().setTarget(target)
         return "OK"
 
+    def cmd_stats(self, sender_eui64=None, index=None, reset=False, enable=None):
+        """Return main loop profiling counters.
+
+        The loop counters come with the number of tasks, the counters of one
+        task are read by its index to fit the response in one frame.
+        """
+        if enable is not None:
+            main_loop.set_profiling(enable)
+        stats = main_loop.stats()
+        if reset:
+            main_loop.reset_stats()
+        if stats is None:
+            return None
+        tasks = stats.pop("tasks")
+        stats["count"] = len(tasks)
+        if index is None or index >= len(tasks):
+            return stats
+        return {"task": tasks[index], "count": len(tasks)}
+
     def cmd_soft_reset(self, sender_eui64=None):
         """Schedule soft reset."""
         main_loop.schedule_task(soft_reset)
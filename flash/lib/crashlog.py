@@ -0,0 +1,71 @@
+"""Persistent log of the faults retained across resets.
+
+Every fault is a fixed-size journal record with the uptime in seconds, the
+free memory, the task name and the exception. The writes per boot are limited
+so that a failing periodic task does not wear the flash out.
+
+The RAM does not survive a watchdog reset, so the task running at the time is
+not known on the next boot. A task that hangs is never recorded as overrun,
+so the reset names the last overrun task as a hint only, not as the cause.
+"""
+
+from gc import mem_free
+from time import ticks_ms
+
+from lib.journal import Journal
+from machine import WDT_RESET, reset_cause
+
+_TASK_SIZE = 16
+_TEXT_SIZE = 48
+
+
+class CrashLog(Journal):
+    """Fault records kept in flash."""
+
+    _files = 2
+    _records = 4
+    _limit = 4  # Records written per boot
+
+    def __init__(self, name="crash"):
+        """Init the class."""
+        super().__init__(name, self._records, "Ii{}s{}s".format(_TASK_SIZE, _TEXT_SIZE))
+        self._written = 0
+        self.load()
+        if reset_cause() == WDT_RESET:
+            records = self.read()
+            text = "Watchdog timer reset"
+            if records and records[0]["exc"].startswith("Overrun"):
+                text += ", last overrun " + records[0]["task"]
+            self.record("reset", text)
+
+    def record(self, task, e):
+        """Write the fault unless the limit for this boot is reached."""
+        if self._written >= self._limit:
+            return
+        self._written += 1
+        try:
+            text = e if isinstance(e, str) else "{}: {}".format(type(e).__name__, e)
+            self.append(
+                [
+                    ticks_ms() // 1000,
+                    mem_free(),
+                    bytes(task or "", "utf-8")[:_TASK_SIZE],
+                    bytes(text, "utf-8")[:_TEXT_SIZE],
+                ]
+            )
+        except Exception:
+            pass  # Nothing else to do, the device is already failing
+
+    def read(self):
+        """Return the records from the newest."""
+        records = sorted((x[1] for x in self._read()), key=lambda x: -x[1])
+        return [
+            {
+                "seq": seq,
+                "uptime": uptime,
+                "mem_free": free,
+                "task": task.rstrip(b"\0").decode("utf-8", "ignore"),
+                "exc": text.rstrip(b"\0").decode("utf-8", "ignore"),
+            }
+            for _, seq, uptime, free, task, text in records
+        ]
@@ -0,0 +1,39 @@
+"""Garbage collection policy shared by the main loop and the commands."""
+
+from gc import collect as gc_collect, mem_free
+
+from micropython import const
+
+ALWAYS = const(0)  # Collect at every collection point
+THRESHOLD = const(1)  # Collect only when free memory drops below the watermark
+IDLE = const(2)  # Collect before the loop sleeps or below the watermark
+
+_mode = ALWAYS
+_threshold = 4096
+
+
+def set_mode(mode, threshold=None):
+    """Update the policy mode and the free memory watermark."""
+    global _mode, _threshold
+    if mode not in (ALWAYS, THRESHOLD, IDLE):
+        raise ValueError("Unknown gc mode")
+    _mode = mode
+    if threshold is not None:
+        _threshold = threshold
+
+
+def get_mode():
+    """Return the policy mode and the free memory watermark."""
+    return _mode, _threshold
+
+
+def collect():
+    """Run garbage collection at a regular collection point if required."""
+    if _mode == ALWAYS or mem_free() < _threshold:
+        gc_collect()
+
+
+def idle():
+    """Run garbage collection when the loop is about to sleep if required."""
+    if _mode == IDLE:
+        gc_collect()
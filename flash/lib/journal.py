@@ -0,0 +1,170 @@
+"""Wear-leveled append-only journal of integer values in flash.
+
+The records are appended to one of several files in turn, so that the erase
+cycles are spread between them. Every record carries a sequence number and a
+checksum. On boot the valid record with the highest sequence number wins, a
+record torn by a power loss is skipped and cut off before the next append.
+"""
+
+from lib import logging
+from lib.mainloop import main_loop
+from micropython import const
+from ustruct import calcsize, pack_into, unpack_from
+
+_LOGGER = logging.getLogger(__name__)
+
+_MAGIC = const(0x4A)
+
+
+def _checksum(data):
+    """Return the Fletcher-16 checksum of the data."""
+    a = 0
+    b = 0
+    for x in data:
+        a = (a + x) % 255
+        b = (b + a) % 255
+    return b << 8 | a
+
+
+class Journal:
+    """Persistent storage of a fixed number of integer values.
+
+    The values are packed with the fmt struct format when given.
+    """
+
+    _files = 2
+    _records = 64  # Records per file before switching to the next one
+
+    def __init__(self, name, size, fmt=None):
+        """Init the class."""
+        self._name = name
+        self._format = "<BI" + (fmt if fmt is not None else "{}i".format(size))
+        self._size = calcsize(self._format)
+        self._buffer = bytearray(self._size + 2)
+        self._seq = 0
+        self._file = 0
+        self._count = self._records
+        self._sensors = None
+        self._saved = None
+        self._threshold = None
+        self._task = None
+        self.restored = False
+
+    def __del__(self):
+        """Cancel callbacks."""
+        main_loop.remove_task(self._task)
+
+    def _path(self, number):
+        """Return the file name."""
+        return "{}{}.jnl".format(self._name, number)
+
+    def _valid(self, data):
+        """Check the magic and the checksum of the record."""
+        checksum = unpack_from("<H", data, self._size)[0]
+        return data[0] == _MAGIC and checksum == _checksum(data[: self._size])
+
+    def _read(self):
+        """Yield the file number and the record for all valid records."""
+        for number in range(self._files):
+            try:
+                with open(self._path(number), "rb") as f:
+                    while True:
+                        data = f.read(self._size + 2)
+                        if len(data) < self._size + 2:
+                            break
+                        if self._valid(data):
+                            yield number, unpack_from(self._format, data)
+            except OSError:
+                pass
+
+    def load(self):
+        """Return the most recent valid values or None."""
+        best = None
+        for number, record in self._read():
+            if best is None or record[1] > best[1]:
+                best = record
+                self._file = number
+        self._count = self._records
+        if best is None:
+            return None
+        self._seq = best[1]
+        try:
+            self._resume()
+        except OSError as e:
+            _LOGGER.error("Journal read failed: %s: %s", type(e).__name__, e)
+        return list(best[2:])
+
+    def _resume(self):
+        """Continue appending to the file of the most recent record.
+
+        A record torn at the end of the file is cut off by rewriting the
+        complete ones, so the next record starts on a record boundary.
+        """
+        size = self._size + 2
+        path = self._path(self._file)
+        with open(path, "rb") as f:
+            data = f.read()
+        count = len(data) // size
+        if len(data) > count * size:
+            with open(path, "wb") as f:
+                f.write(memoryview(data)[: count * size])
+        self._count = count
+
+    def append(self, values):
+        """Write the values to the journal."""
+        if self._count >= self._records:
+            self._file = (self._file + 1) % self._files
+            self._count = 0
+        self._seq += 1
+        buffer = self._buffer
+        pack_into(self._format, buffer, 0, _MAGIC, self._seq, *values)
+        pack_into("<H", buffer, self._size, _checksum(memoryview(buffer)[: self._size]))
+        with open(self._path(self._file), "ab" if self._count else "wb") as f:
+            f.write(buffer)
+        self._count += 1
+
+    def clear(self):
+        """Empty all files."""
+        for number in range(self._files):
+            with open(self._path(number), "wb"):
+                pass
+        self._file = 0
+        self._count = self._records
+
+    def track(self, sensors, threshold=10, period=600000):
+        """Restore the sensor states and save them when changed.
+
+        The states are saved as soon as one of them moved by the threshold,
+        smaller changes are saved once per period.
+        """
+        values = self.load()
+        if values is not None and len(values) == len(sensors):
+            for sensor, value in zip(sensors, values):
+                sensor.state = value
+            self.restored = True
+        self._sensors = sensors
+        self._saved = [sensor.state for sensor in sensors]
+        self._threshold = threshold
+        for sensor in sensors:
+            sensor.subscribe(lambda x: self._changed())
+        self._task = main_loop.schedule_task(
+            lambda: self.save(), next_run=period, period=period, name="journal"
+        )
+
+    def _changed(self):
+        """Save the states if one of them moved by the threshold."""
+        for sensor, saved in zip(self._sensors, self._saved):
+            if abs(sensor.state - saved) >= self._threshold:
+                self.save()
+                return
+
+    def save(self, force=False):
+        """Save the sensor states if changed since the last save."""
+        values = [sensor.state for sensor in self._sensors]
+        if not force and values == self._saved:
+            return
+        try:
+            self.append(values)
+            self._saved = values
+        except OSError as e:
+            _LOGGER.error("Journal write failed: %s: %s", type(e).__name__, e)
@@ -1,6 +1,7 @@
 """Micropython logging implementation for xbee sending logs remotely."""
 
 from json import dumps as json_dumps
+from time import ticks_diff, ticks_ms
 
 from micropython import const
 from xbee import ADDR_COORDINATOR, transmit
@@ -12,13 +13,47 @@ ERROR = const(40)
 CRITICAL = const(50)
 
 
+def _truncate(text, size):
+    """Cut the text to size bytes of UTF-8, keeping whole characters."""
+    data = text.encode()[: max(0, size)]
+    start = len(data)
+    while start and data[start - 1] & 0xC0 == 0x80:
+        start -= 1
+    if start and data[start - 1] >= 0xC0:
+        lead = data[start - 1]
+        if len(data) - start + 1 < (2 if lead < 0xE0 else 3 if lead < 0xF0 else 4):
+            data = data[: start - 1]
+    return data.decode()
+
+
 class Logger:
-    """XBee remote logger."""
+    """XBee remote logger.
+
+    The records are kept in a ring and sent by a main loop task, several per
+    frame and at most _frame_budget frames per second. A record repeating the
+    last one is counted instead of stored, the oldest record is dropped when
+    the ring is full or when the frame fails for another reason than a full
+    transfer buffer. The frame size is counted in bytes of the UTF-8 encoding.
+    """
+
+    _size = 16
+    _max_payload = 255
+    _frame_budget = 2  # Frames per second
+    _flush_delay = 100  # Let the state notifications go first
 
     def __init__(self, name=None):
         """Init the class."""
         self._target = ADDR_COORDINATOR
         self._level = DEBUG
+        self._levels = bytearray(self._size)
+        self._msgs = [None] * self._size
+        self._repeats = [0] * self._size
+        self._head = 0
+        self._count = 0
+        self._dropped = 0
+        self._window = ticks_ms()
+        self._frames = 0
+        self._flush_task = None
 
     def setTarget(self, target=ADDR_COORDINATOR):
         """Update target device eui64."""
@@ -32,19 +67,119 @@ class Logger:
         """Get logging level."""
         return self._level
 
-    def makeRecord(self, level, msg, *args, **kwargs):
+    def isEnabledFor(self, level):
+        """Check whether the records of the level are logged."""
+        return self._level <= level
+
+    def makeRecord(self, level, msg, repeats=1):
         """Format the record."""
-        if args:
-            msg = msg % args
-        return json_dumps({"log": {"sev": level, "msg": msg}})
+        if repeats > 1:
+            msg = "{} (repeated {} times)".format(msg, repeats)
+        return {"sev": level, "msg": msg}
 
     def log(self, level, msg, *args, **kwargs):
-        """Write logs."""
-        if self._level <= level:
+        """Buffer the record for sending.
+
+        The %-style arguments are only formatted when the level is enabled.
+        """
+        if self._level > level:
+            return
+        if args:
+            msg = msg % args
+        last = (self._head + self._count - 1) % self._size
+        if self._count and self._msgs[last] == msg and self._levels[last] == level:
+            self._repeats[last] += 1
+            return
+        if self._count == self._size:
+            self._pop(1)
+            self._dropped += 1
+        tail = (self._head + self._count) % self._size
+        self._levels[tail] = level
+        self._msgs[tail] = msg
+        self._repeats[tail] = 1
+        self._count += 1
+        self._schedule(self._flush_delay)
+
+    def _pop(self, count):
+        """Remove the oldest records."""
+        for _ in range(count):
+            self._msgs[self._head] = None
+            self._head = (self._head + 1) % self._size
+        self._count -= count
+
+    def _schedule(self, delay):
+        """Schedule the flush unless already pending."""
+        if self._flush_task is not None and self._flush_task.next_run is not None:
+            return
+        from lib.mainloop import main_loop
+
+        self._flush_task = main_loop.schedule_task(
+            lambda: self.flush(), next_run=delay, name="logging"
+        )
+
+    def _pack(self):
+        """Return the frame with the oldest records and the number packed."""
+        items = []
+        if self._dropped:
+            items.append(
+                json_dumps(
+                    self.makeRecord(
+                        WARNING, "{} log records dropped".format(self._dropped)
+                    )
+                )
+            )
+        limit = self._max_payload - len('{"log": []}')
+        size = sum(len(x.encode()) + 2 for x in items)
+        count = 0
+        while count < self._count:
+            index = (self._head + count) % self._size
+            record = self.makeRecord(
+                self._levels[index], self._msgs[index], self._repeats[index]
+            )
+            item = json_dumps(record)
+            length = len(item.encode())
+            if not items and length > limit:
+                # Every byte cut shortens the item by one byte at least
+                msg = record["msg"]
+                record["msg"] = _truncate(msg, len(msg.encode()) - length + limit)
+                item = json_dumps(record)
+                length = len(item.encode())
+            if items and size + length > limit:
+                break
+            items.append(item)
+            size += length + 2
+            count += 1
+        return '{"log": [' + ", ".join(items) + "]}", count
+
+    def flush(self, force=False):
+        """Send the buffered records within the frame budget."""
+        now = ticks_ms()
+        if ticks_diff(now, self._window) >= 1000:
+            self._window = now
+            self._frames = 0
+        while self._count or self._dropped:
+            if not force and self._frames >= self._frame_budget:
+                self._schedule(1000 - ticks_diff(now, self._window))
+                return
+            frame, count = self._pack()
             try:
-                transmit(self._target, self.makeRecord(level, msg, *args, **kwargs))
-            except Exception:
-                pass
+                transmit(self._target, frame)
+            except Exception as e:
+                if isinstance(e, OSError) and "EAGAIN" in str(e):
+                    if not force:
+                        # The transfer buffer is full, retry in the next window
+                        self._schedule(1000 - ticks_diff(now, self._window))
+                    return
+                if not self._count:
+                    return
+                # Do not let a record that cannot be sent block the others
+                self._pop(1)
+                self._dropped += 1
+                self._frames += 1
+                continue
+            self._pop(count)
+            self._dropped = 0
+            self._frames += 1
 
     def debug(self, msg, *args, **kwargs):
         """Write debug logs."""
@@ -74,3 +209,8 @@ def getLogger(name=None):
     """Compatibility function to get the logger."""
 
     return _logger
+
+
+def flush():
+    """Send all buffered records regardless of the frame budget."""
+    _logger.flush(force=True)
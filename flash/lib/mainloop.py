@@ -1,9 +1,9 @@
 """Simple main loop implementation."""
 
-from gc import collect
 from time import sleep_ms, ticks_add, ticks_diff, ticks_ms
 
 from lib import logging
+from lib.gcpolicy import collect, idle
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -11,10 +11,12 @@ _LOGGER = logging.getLogger(__name__)
 class Task:
     """Class representing the task."""
 
-    def __init__(self, callback, next_run=None, period=None):
+    def __init__(self, callback, next_run=None, period=None, name=None):
         """Init the class."""
         self._callback = callback
         self._period = period
+        self._name = name
+        self._stats = None
         if next_run is None:
             self._next_run = ticks_ms()
         else:
@@ -26,8 +28,9 @@ class Task:
             collect()
             self._callback()
         except Exception as e:
-            _LOGGER.error("mainloop: error with {}".format(self._callback))
-            _LOGGER.error("{}: {}".format(type(e).__name__, e))
+            _LOGGER.error("mainloop: error with %s", self._callback)
+            _LOGGER.error("%s: %s", type(e).__name__, e)
+            main_loop.fault(e, self)
 
         if self._period:
             self._next_run = ticks_add(self._next_run, self._period)
@@ -41,6 +44,36 @@ class Task:
         collect()
         return None
 
+    def _record(self, duration, lateness):
+        """Update the profiling counters."""
+        stats = self._stats
+        if stats is None:
+            # runs, total time, max time, total lateness, max lateness
+            self._stats = stats = [0, 0, 0, 0, 0]
+        stats[0] += 1
+        stats[1] += duration
+        if duration > stats[2]:
+            stats[2] = duration
+        stats[3] += lateness
+        if lateness > stats[4]:
+            stats[4] = lateness
+
+    @property
+    def name(self):
+        """Return the task name or the callback description."""
+        return self._name if self._name is not None else str(self._callback)
+
+    @property
+    def stats(self):
+        """Return the task name and the profiling counters."""
+        if self._stats is None:
+            return [self.name, 0, 0, 0, 0, 0]
+        return [self.name] + self._stats
+
+    def cancel(self):
+        """Mark the task as completed so that the loop drops it."""
+        self._callback = None
+
     @property
     def next_run(self):
         """Return the time of the next scheduled execution or None if completed."""
@@ -50,63 +83,132 @@ class Task:
 
 
 class Loop:
-    """Event loop."""
+    """Event loop.
+
+    The tasks are kept in a binary min-heap ordered by their next run time, so
+    the next deadline is always at the top. Removed tasks are only marked as
+    cancelled and dropped once they reach the top of the heap.
+    """
 
     def __init__(self):
         """Init the class."""
-        self._last_run = None
         self._tasks = []
+        self._pending = []
+        self._running = False
         self._stop = False
-        self._task_scheduled = False
+        self._wake = False
+        self._wake_interval = None
+        self._stats = None
+        self._current = None
+        self._fault_handler = None
+        self._overrun = None
+
+    def _push(self, task):
+        """Insert the task into the heap."""
+        heap = self._tasks
+        heap.append(task)
+        pos = len(heap) - 1
+        next_run = task._next_run
+        while pos > 0:
+            parent = (pos - 1) >> 1
+            if ticks_diff(next_run, heap[parent]._next_run) >= 0:
+                break
+            heap[pos] = heap[parent]
+            pos = parent
+        heap[pos] = task
+
+    def _pop(self):
+        """Remove and return the task from the top of the heap."""
+        heap = self._tasks
+        top = heap[0]
+        task = heap.pop()
+        size = len(heap)
+        if size:
+            next_run = task._next_run
+            pos = 0
+            child = 1
+            while child < size:
+                if (
+                    child + 1 < size
+                    and ticks_diff(heap[child + 1]._next_run, heap[child]._next_run) < 0
+                ):
+                    child += 1
+                if ticks_diff(heap[child]._next_run, next_run) >= 0:
+                    break
+                heap[pos] = heap[child]
+                pos = child
+                child = 2 * pos + 1
+            heap[pos] = task
+        return top
+
+    def _top(self):
+        """Return the next active task, dropping the cancelled ones."""
+        heap = self._tasks
+        while heap:
+            if heap[0]._callback is not None:
+                return heap[0]
+            self._pop()
+        return None
 
     def schedule_task(self, *args, **kwargs):
         """Add new task."""
         collect()
         task = Task(*args, **kwargs)
-        self._tasks.append(task)
-        self._task_scheduled = True
+        if self._running:
+            # Defer to the next iteration
+            self._pending.append(task)
+        else:
+            self._push(task)
         collect()
         return task
 
     def remove_task(self, task):
         """Remove task if scheduled."""
-        if task is not None and task in self._tasks:
-            self._tasks.remove(task)
-            collect()
+        if task is not None:
+            task.cancel()
 
     def reset(self):
         """Remove all tasks."""
         self._tasks.clear()
+        self._pending.clear()
         collect()
 
     def run_once(self):
         """Run one iteration and return the time of next execution."""
         collect()
-        next_time = None
-        self._task_scheduled = False
-
-        for task in self._tasks.copy():
-            if task not in self._tasks:
-                continue
-            next_run = task.next_run
-            if next_run is not None and ticks_diff(next_run, ticks_ms()) <= 0:
+        now = ticks_ms()
+        self._wake = False
+        if self._stats is not None:
+            self._stats[0] += 1
+        self._running = True
+        try:
+            while True:
+                task = self._top()
+                if task is None or ticks_diff(task._next_run, now) > 0:
+                    break
+                self._pop()
+                self._current = task
+                start = ticks_ms()
+                lateness = ticks_diff(start, task._next_run)
                 next_run = task.run()
-
-            if next_run is None and task in self._tasks:
-                self._tasks.remove(task)
-                collect()
-
-            if next_run is not None and (
-                next_time is None or ticks_diff(next_run, next_time) < 0
-            ):
-                next_time = next_run
-
-        if self._task_scheduled:
-            next_time = self.next_run
-            self._task_scheduled = False
+                duration = ticks_diff(ticks_ms(), start)
+                if self._stats is not None:
+                    task._record(duration, lateness)
+                if self._overrun is not None and duration > self._overrun:
+                    self.fault("Overrun {} ms".format(duration), task)
+                self._current = None
+                if next_run is not None and task.next_run is not None:
+                    self._pending.append(task)
+        finally:
+            self._running = False
+            for task in self._pending:
+                if task.next_run is not None:
+                    self._push(task)
+            self._pending.clear()
 
         collect()
-        return next_time
+        task = self._top()
+        return task._next_run if task is not None else None
 
     def run(self):
         """Run the loop continuously."""
@@ -121,31 +223,100 @@ class Loop:
                 raise RuntimeError("No tasks")
             diff = ticks_diff(next_time, now)
             if diff > 0 and not self._stop:
-                sleep_ms(diff)
+                idle()
+                self._sleep(next_time, diff)
+                if self._stats is not None:
+                    self._stats[1] += ticks_diff(ticks_ms(), now)
         collect()
         return next_time
 
+    def _sleep(self, next_time, diff):
+        """Sleep until the next scheduled time unless woken up earlier."""
+        interval = self._wake_interval
+        if interval is None:
+            sleep_ms(diff)
+            return
+        while diff > 0 and not self._wake:
+            sleep_ms(diff if diff < interval else interval)
+            diff = ticks_diff(next_time, ticks_ms())
+
+    def set_wake_interval(self, interval=None):
+        """Set how often the sleeping loop checks for the wake up requests."""
+        self._wake_interval = interval
+
+    def wake(self):
+        """Interrupt the current sleep to handle newly scheduled tasks."""
+        self._wake = True
+
     @property
     def next_run(self):
         """Return the time of the next scheduled execution."""
+        task = self._top()
+        if task is None:
+            return None
         now = ticks_ms()
-        next_time = None
+        if ticks_diff(task._next_run, now) <= 0:
+            return now
+        return task._next_run
 
-        for task in self._tasks:
-            next_run = task.next_run
-            if ticks_diff(next_run, now) <= 0:
-                return now
+    def set_fault_handler(self, handler=None, overrun=None):
+        """Set the callback for the exceptions, called with the task name and them.
 
-            if next_run is not None and (
-                next_time is None or ticks_diff(next_run, next_time) < 0
-            ):
-                next_time = next_run
+        A task running longer than overrun ms is reported as well, with the
+        "Overrun" message and the time.
+        """
+        self._fault_handler = handler
+        self._overrun = overrun
 
-        return next_time
+    def fault(self, e, task=None):
+        """Report the exception raised by the task or the running one."""
+        if self._fault_handler is None:
+            return
+        if task is None:
+            task = self._current
+        try:
+            self._fault_handler(task.name if task is not None else None, e)
+        except Exception as e:
+            _LOGGER.error("mainloop: fault handler error %s: %s", type(e).__name__, e)
 
     def stop(self):
         """Exit the loop after current iteration."""
         self._stop = True
 
+    def set_profiling(self, enable=True):
+        """Enable or disable the collection of the profiling counters."""
+        if not enable:
+            self.reset_stats()
+            self._stats = None
+        elif self._stats is None:
+            # iterations, time sleeping
+            self._stats = [0, 0]
+
+    def reset_stats(self):
+        """Reset the profiling counters."""
+        if self._stats is not None:
+            self._stats[0] = 0
+            self._stats[1] = 0
+        for task in self._tasks + self._pending:
+            task._stats = None
+        if self._current is not None:
+            self._current._stats = None
+
+    def stats(self):
+        """Return the profiling counters or None if profiling is disabled.
+
+        The tasks are sorted by name, the running one included.
+        """
+        if self._stats is None:
+            return None
+        tasks = [x for x in self._tasks + self._pending if x.next_run is not None]
+        if self._current is not None and self._current not in tasks:
+            tasks.append(self._current)
+        return {
+            "iterations": self._stats[0],
+            "sleep": self._stats[1],
+            "tasks": sorted((task.stats for task in tasks), key=lambda x: x[0]),
+        }
+
 
 main_loop = Loop()
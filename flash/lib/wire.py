@@ -0,0 +1,188 @@
+"""Compact binary encoding of commands, responses and notifications.
+
+Frame: magic byte, command code, request id (little endian) and one typed value.
+The command codes are fixed by the command table of the device. The names of
+the notifications are one-byte keys, the index of the prefix in KEYS shifted by
+3 bits with the number suffix plus one, e.g. counter_0 is 0x11.
+"""
+
+from micropython import const
+from ustruct import pack, unpack_from
+
+MAGIC = const(0xFB)  # Never the first byte of a JSON frame
+NOTIFY = const(0xFF)  # Command code of the notifications
+HEADER_SIZE = const(4)
+
+_NONE = const(0)
+_FALSE = const(1)
+_TRUE = const(2)
+_UINT8 = const(3)
+_INT32 = const(4)
+_INT64 = const(5)
+_FLOAT = const(6)
+_STR = const(7)
+_LIST = const(8)
+_DICT = const(9)
+_FLOAT32 = const(10)
+_KEYED = const(11)  # Dict with one-byte keys
+_KEY_STR = const(0xFF)  # Key followed by the name string
+
+# Notification name prefixes, append only
+KEYS = ("uptime", "log", "counter", "valve", "opening", "closing", "flow", "leak")
+
+
+def _pack_str(buf, value):
+    """Append a length prefixed utf-8 string."""
+    value = value.encode("utf-8")
+    if len(value) > 255:
+        raise ValueError("string too long")
+    buf.append(len(value))
+    buf.extend(value)
+
+
+def pack_value(buf, value):
+    """Append the typed value to the bytearray."""
+    if value is None:
+        buf.append(_NONE)
+    elif value is False:
+        buf.append(_FALSE)
+    elif value is True:
+        buf.append(_TRUE)
+    elif isinstance(value, int):
+        if 0 <= value <= 255:
+            buf.append(_UINT8)
+            buf.append(value)
+        elif -0x80000000 <= value <= 0x7FFFFFFF:
+            buf.append(_INT32)
+            buf.extend(pack("<i", value))
+        else:
+            buf.append(_INT64)
+            buf.extend(pack("<q", value))
+    elif isinstance(value, float):
+        buf.append(_FLOAT32)  # The device floats are single precision
+        buf.extend(pack("<f", value))
+    elif isinstance(value, str):
+        buf.append(_STR)
+        _pack_str(buf, value)
+    elif isinstance(value, (list, tuple)):
+        if len(value) > 255:
+            raise ValueError("list too long")
+        buf.append(_LIST)
+        buf.append(len(value))
+        for item in value:
+            pack_value(buf, item)
+    elif isinstance(value, dict):
+        if len(value) > 255:
+            raise ValueError("dict too long")
+        buf.append(_DICT)
+        buf.append(len(value))
+        for key, item in value.items():
+            _pack_str(buf, key)
+            pack_value(buf, item)
+    else:
+        raise TypeError("unsupported type")
+
+
+def pack_item(name, value):
+    """Return the packed notification item, see notification()."""
+    buf = bytearray()
+    pos = name.rfind("_")
+    number = 0
+    prefix = name
+    if pos > 0 and name[pos + 1 :].isdigit():
+        number = int(name[pos + 1 :]) + 1
+        prefix = name[:pos]
+    if number < 8 and prefix in KEYS:
+        buf.append(KEYS.index(prefix) << 3 | number)
+    else:
+        buf.append(_KEY_STR)
+        _pack_str(buf, name)
+    pack_value(buf, value)
+    return buf
+
+
+def _unpack_key(data, pos):
+    """Return the notification name and the position after it."""
+    key = data[pos]
+    if key == _KEY_STR:
+        return _unpack_str(data, pos + 1)
+    name = KEYS[key >> 3]
+    if key & 7:
+        name = "{}_{}".format(name, (key & 7) - 1)
+    return name, pos + 1
+
+
+def _unpack_str(data, pos):
+    """Return the string and the position after it."""
+    end = pos + 1 + data[pos]
+    return str(data[pos + 1 : end], "utf-8"), end
+
+
+def unpack_value(data, pos=0):
+    """Return the typed value and the position after it."""
+    tag = data[pos]
+    pos += 1
+    if tag == _NONE:
+        return None, pos
+    if tag == _FALSE:
+        return False, pos
+    if tag == _TRUE:
+        return True, pos
+    if tag == _UINT8:
+        return data[pos], pos + 1
+    if tag == _INT32:
+        return unpack_from("<i", data, pos)[0], pos + 4
+    if tag == _INT64:
+        return unpack_from("<q", data, pos)[0], pos + 8
+    if tag == _FLOAT:
+        return unpack_from("<d", data, pos)[0], pos + 8
+    if tag == _FLOAT32:
+        return unpack_from("<f", data, pos)[0], pos + 4
+    if tag == _STR:
+        return _unpack_str(data, pos)
+    if tag == _LIST:
+        value = []
+        count = data[pos]
+        pos += 1
+        for _ in range(count):
+            item, pos = unpack_value(data, pos)
+            value.append(item)
+        return value, pos
+    if tag == _DICT or tag == _KEYED:
+        value = {}
+        count = data[pos]
+        pos += 1
+        for _ in range(count):
+            if tag == _DICT:
+                key, pos = _unpack_str(data, pos)
+            else:
+                key, pos = _unpack_key(data, pos)
+            value[key], pos = unpack_value(data, pos)
+        return value, pos
+    raise ValueError("unknown type")
+
+
+def encode(code, req_id, value):
+    """Return the frame with the value."""
+    buf = bytearray(pack("<BBH", MAGIC, code, req_id))
+    pack_value(buf, value)
+    return buf
+
+
+def notification(items):
+    """Return the notification frame with the packed dict items."""
+    buf = bytearray(pack("<BBHBB", MAGIC, NOTIFY, 0, _KEYED, len(items)))
+    for item in items:
+        buf.extend(item)
+    return buf
+
+
+def decode(data):
+    """Return the command code, the request id and the value of the frame."""
+    if len(data) < HEADER_SIZE or data[0] != MAGIC:
+        raise ValueError("invalid frame")
+    code = data[1]
+    req_id = data[2] | data[3] << 8
+    if len(data) == HEADER_SIZE:
+        return code, req_id, None
+    return code, req_id, unpack_value(data, HEADER_SIZE)[0]
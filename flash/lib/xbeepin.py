@@ -1,7 +1,14 @@
 """Interface to the XBee pins with as core.Sensor classes."""
 
+from array import array
+from time import ticks_diff, ticks_ms
+
 from lib.core import Sensor
+from lib.mainloop import main_loop
 from machine import ADC, PWM, Pin
+from micropython import const
+
+_FULL_SCALE = const(1000)
 
 
 class DigitalOutput(Sensor):
@@ -41,6 +48,169 @@ class DigitalInput(Sensor):
         return self._pin.value()
 
 
+class DebouncedInput(DigitalInput):
+    """Digital input sensor with a time based glitch filter.
+
+    The state rises once the pin stays high for rise_time ms and falls once it
+    stays low for fall_time ms. With the integrator enabled, the time spent
+    high and low is integrated instead, so glitches only delay the switch.
+
+    The pin is polled every period ms, and every fast_period ms only while it
+    differs from the state. The pulses shorter than the period may be missed.
+    """
+
+    _period = 500
+
+    def __init__(
+        self,
+        gpio,
+        pull=Pin.PULL_UP,
+        rise_time=100,
+        fall_time=None,
+        integrator=False,
+        fast_period=20,
+        *args,
+        **kwargs,
+    ):
+        """Init the class."""
+        self._rise_time = rise_time
+        self._fall_time = rise_time if fall_time is None else fall_time
+        self._integrator = integrator
+        self._fast_period = fast_period
+        self._fast = None
+        self._output = None
+        self._raw = None
+        self._since = ticks_ms()
+        self._level = 0
+        super().__init__(gpio, pull, *args, **kwargs)
+
+    def __del__(self):
+        """Cancel callbacks."""
+        main_loop.remove_task(self._fast)
+        super().__del__()
+
+    def _get(self):
+        """Get filtered pin state, polled fast while a transition is pending."""
+        output = self._filter()
+        if self._raw == output:
+            main_loop.remove_task(self._fast)
+        elif self._fast is None or self._fast.next_run is None:
+            self._fast = main_loop.schedule_task(
+                lambda: self.update(auto=True),
+                next_run=self._fast_period,
+                period=self._fast_period,
+                name="debounce",
+            )
+        return output
+
+    def _filter(self):
+        """Return the filtered pin state."""
+        raw = bool(self._pin.value())
+        now = ticks_ms()
+        if self._output is None:
+            self._output = self._raw = raw
+            self._since = now
+            self._level = _FULL_SCALE if raw else 0
+            return raw
+
+        if self._integrator:
+            # The time of a change between the samples is not known
+            elapsed = ticks_diff(now, self._since) if raw == self._raw else 0
+            self._raw = raw
+            self._since = now
+            if raw:
+                if self._rise_time > 0:
+                    self._level += elapsed * _FULL_SCALE // self._rise_time
+                else:
+                    self._level = _FULL_SCALE
+                if self._level >= _FULL_SCALE:
+                    self._level = _FULL_SCALE
+                    self._output = True
+            else:
+                if self._fall_time > 0:
+                    self._level -= elapsed * _FULL_SCALE // self._fall_time
+                else:
+                    self._level = 0
+                if self._level <= 0:
+                    self._level = 0
+                    self._output = False
+            return self._output
+
+        if raw != self._raw:
+            self._raw = raw
+            self._since = now
+        if raw != self._output and ticks_diff(now, self._since) >= (
+            self._rise_time if raw else self._fall_time
+        ):
+            self._output = raw
+        return self._output
+
+
+class PulseInput(Sensor):
+    """Digital input counting the edges with the pin interrupts.
+
+    The state is the total number of edges seen. The interrupt handler only
+    increments a preallocated 16-bit counter, the periodic update folds it
+    into the state. Edges within rise_time ms after a rising edge or
+    fall_time ms after a falling edge are treated as contact bounce.
+    """
+
+    _readonly = True
+    _type = int
+    _period = 1000
+
+    def __init__(
+        self, gpio, pull=Pin.PULL_UP, rise_time=0, fall_time=None, *args, **kwargs
+    ):
+        """Init the class."""
+        self._pin = Pin(gpio, Pin.IN, pull)
+        self._rise_time = rise_time
+        self._fall_time = rise_time if fall_time is None else fall_time
+        self._last_edge = array("l", [ticks_ms()])
+        self._last_rise = array("b", [0])
+        self._edges = array("H", [0])
+        self._last_edges = 0
+        self._total = 0
+        self._level = bool(self._pin.value())
+        self._handler = self._irq
+        self._pin.irq(handler=self._handler, trigger=Pin.IRQ_RISING | Pin.IRQ_FALLING)
+        super().__init__(*args, **kwargs)
+
+    def __del__(self):
+        """Cancel callbacks."""
+        self._pin.irq(handler=None)
+        super().__del__()
+
+    def _irq(self, pin):
+        """Count the edge, must not allocate."""
+        now = ticks_ms()
+        if ticks_diff(now, self._last_edge[0]) < (
+            self._rise_time if self._last_rise[0] else self._fall_time
+        ):
+            return
+        self._last_edge[0] = now
+        self._last_rise[0] = pin.value()
+        self._edges[0] = (self._edges[0] + 1) & 0xFFFF
+
+    def _get(self):
+        """Fold the new edges into the total."""
+        edges = self._edges
+        while True:
+            count = edges[0]
+            level = self._pin.value()
+            if edges[0] == count:
+                break
+        self._level = bool(level)
+        self._total += (count - self._last_edges) & 0xFFFF
+        self._last_edges = count
+        return self._total
+
+    @property
+    def level(self):
+        """Return the pin level as of the last update."""
+        return self._level
+
+
 class AnalogOutput(Sensor):
     """PWM output."""
 
@@ -13,6 +13,8 @@ _LOGGER = logging.getLogger(__name__)
 try:
     main_loop.run()
 except BaseException as e:
-    _LOGGER.error("Mainloop exception: {}: {}".format(type(e).__name__, e))
+    _LOGGER.error("Mainloop exception: %s: %s", type(e).__name__, e)
+    main_loop.fault(e)
 finally:
     _LOGGER.error("Mainloop exited")
+    logging.flush()
@@ -0,0 +1,167 @@
+"""Report the code size and the RAM footprint of the compiled modules.
+
+Usage: footprint.py MOCKS BUNDLE_LIMIT MODULE_LIMIT RAM_LIMIT
+
+Run from the flash directory after the build. The size of every .mpy file,
+the total size of the bundle and its total RAM footprint are compared with the
+limits in bytes. The RAM footprint is estimated by importing the bundled
+modules under the test mocks in the MOCKS directory, the imported modules
+first, and tracing the memory allocated by each import. It is measured on the
+host, so its limit is a budget derived from a previous build rather than the
+device memory. A limit of 0 is not checked, the exit status is 1 when a limit
+is exceeded.
+"""
+
+import ast
+import gc
+import os
+import sys
+import tempfile
+import tracemalloc
+
+BUNDLE = "bundle.py"
+
+
+def bundle_list():
+    """Return the bundled files listed in the install script."""
+    with open(BUNDLE) as f:
+        tree = ast.parse(f.read())
+    for node in tree.body:
+        if isinstance(node, ast.Assign) and any(
+            getattr(x, "id", None) == "_bundle_list" for x in node.targets
+        ):
+            return ast.literal_eval(node.value)
+    raise ValueError("No bundle list in {}".format(BUNDLE))
+
+
+def sizes():
+    """Return the size of every compiled file."""
+    names = sorted(
+        os.path.join(path, name)[2:]
+        for path, _, files in os.walk(".")
+        for name in files
+        if name.endswith(".mpy")
+    )
+    return {x: os.path.getsize(x) for x in names}
+
+
+def _imports(module):
+    """Return the names imported by the module, except in the functions."""
+    with open(module.replace(".", "/") + ".py") as f:
+        nodes = [ast.parse(f.read())]
+    while nodes:
+        node = nodes.pop()
+        if not isinstance(node, (ast.FunctionDef, ast.Lambda)):
+            nodes.extend(ast.iter_child_nodes(node))
+        if isinstance(node, ast.Import):
+            yield from (x.name for x in node.names)
+        elif isinstance(node, ast.ImportFrom) and node.module:
+            yield node.module
+            yield from (node.module + "." + x.name for x in node.names)
+
+
+def import_order(modules):
+    """Return the modules sorted so that the imported ones come first."""
+    result = []
+    seen = set()
+
+    def visit(module):
+        if module not in seen:
+            seen.add(module)
+            for name in _imports(module):
+                if name in modules:
+                    visit(name)
+            result.append(module)
+
+    for module in modules:
+        visit(module)
+    return result
+
+
+def footprint(modules, mocks):
+    """Return the memory allocated by importing every module in turn.
+
+    The imported modules, the module path and the time and gc modules replaced
+    by the mocks are restored afterwards.
+    """
+    cwd = os.getcwd()
+    path = sys.path[:]
+    saved = dict(sys.modules)
+    sys.path[:0] = [cwd, os.path.abspath(mocks)]
+    try:
+        sys.modules["time"] = __import__("mock_time")
+        sys.modules["gc"] = __import__("mock_gc")
+        modules = import_order(modules)
+        local = {x.split(".")[0] for x in modules}
+        for name in {x for module in modules for x in _imports(module)}:
+            if name.split(".")[0] not in local:
+                try:
+                    __import__(name)  # The builtins and mocks are not charged
+                except ImportError:
+                    pass
+        result = {}
+        with tempfile.TemporaryDirectory() as tmpdir:
+            os.chdir(tmpdir)  # The journals are created in the current directory
+            tracemalloc.start()
+            try:
+                for module in modules:
+                    gc.collect()
+                    before = tracemalloc.get_traced_memory()[0]
+                    __import__(module)
+                    gc.collect()
+                    result[module] = tracemalloc.get_traced_memory()[0] - before
+            finally:
+                tracemalloc.stop()
+                os.chdir(cwd)
+    finally:
+        sys.path[:] = path
+        for name in [x for x in sys.modules if x not in saved]:
+            del sys.modules[name]
+        sys.modules.update(saved)
+    return result
+
+
+def _over(name, kind, value, limit):
+    """Return the message of a value over the limit."""
+    if limit and value > limit:
+        return ["{} {} {} over the limit of {}".format(name, kind, value, limit)]
+    return []
+
+
+def main(argv):
+    """Run the command line tool."""
+    if len(argv) != 5:
+        print(__doc__)
+        return 2
+    mocks = argv[1]
+    bundle_limit, module_limit, ram_limit = (int(x) for x in argv[2:])
+    bundled = bundle_list()
+    files = sizes()
+    missing = [x for x in bundled if x not in files]
+    if missing:
+        print("Not compiled: {}".format(", ".join(missing)))
+        return 1
+    ram = footprint([x[:-4].replace("/", ".") for x in bundled], mocks)
+
+    errors = []
+    print("{:<24}{:>8}{:>10}".format("File", "Size", "RAM"))
+    for name, size in files.items():
+        used = ram.get(name[:-4].replace("/", "."))
+        print("{:<24}{:>8}{:>10}".format(name, size, "" if used is None else used))
+        errors += _over(name, "size", size, module_limit)
+    total = sum(files[x] for x in bundled)
+    total_ram = sum(ram.values())
+    print("{:<24}{:>8}{:>10}".format("Bundle", total, total_ram))
+    if bundle_limit:
+        print("{:.0%} of the bundle limit used".format(total / bundle_limit))
+    if ram_limit:
+        print("{:.0%} of the RAM budget used".format(total_ram / ram_limit))
+    errors += _over("Bundle", "size", total, bundle_limit)
+    errors += _over("Bundle", "RAM", total_ram, ram_limit)
+    for error in errors:
+        print(error)
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
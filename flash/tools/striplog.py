@@ -0,0 +1,95 @@
+"""Remove the logger calls below a level from a source file before compiling.
+
+Usage: striplog.py LEVEL SOURCE OUTPUT
+
+The level is a number or a name such as warning. The removed statements are
+replaced with pass and blank lines, so the line numbers stay the same.
+"""
+
+import sys
+import tokenize
+
+LEVELS = {"debug": 10, "info": 20, "warning": 30, "error": 40, "critical": 50}
+LOGGER = "_LOGGER"
+
+_OPEN = "([{"
+_CLOSE = ")]}"
+_STATEMENT = (tokenize.NEWLINE, tokenize.INDENT, tokenize.DEDENT)
+_SKIP = (tokenize.NL, tokenize.COMMENT)
+
+
+def _call_end(tokens, pos):
+    """Return the index of the token closing the bracket at the position."""
+    depth = 0
+    for index in range(pos, len(tokens)):
+        token = tokens[index]
+        if token.type == tokenize.OP and token.string in _OPEN:
+            depth += 1
+        elif token.type == tokenize.OP and token.string in _CLOSE:
+            depth -= 1
+            if not depth:
+                return index
+    raise ValueError("Unbalanced brackets")
+
+
+def _is_call(tokens, pos, level):
+    """Check whether the statement at the position logs below the level."""
+    if pos + 3 >= len(tokens):
+        return False
+    name, dot, method, bracket = tokens[pos : pos + 4]
+    return (
+        name.type == tokenize.NAME
+        and name.string == LOGGER
+        and dot.string == "."
+        and method.string in LEVELS
+        and LEVELS[method.string] < level
+        and bracket.string == "("
+    )
+
+
+def strip(lines, level):
+    """Return the source lines without the logger calls below the level."""
+    lines = list(lines)
+    tokens = list(tokenize.generate_tokens(iter(lines).__next__))
+    statement = True
+    pos = 0
+    while pos < len(tokens):
+        token = tokens[pos]
+        if token.type in _SKIP:
+            pos += 1
+            continue
+        if statement and _is_call(tokens, pos, level):
+            end = _call_end(tokens, pos + 3)
+            after = end + 1
+            while tokens[after].type == tokenize.COMMENT:
+                after += 1
+            # Only whole statements, the value of a call may be used
+            if tokens[after].type in (tokenize.NEWLINE, tokenize.ENDMARKER):
+                first, last = token.start[0], tokens[end].end[0]
+                indent = lines[first - 1][: token.start[1]]
+                lines[first - 1] = indent + "pass\n"
+                for row in range(first, last):
+                    lines[row] = "\n"
+                pos = after
+                continue
+        statement = token.type in _STATEMENT
+        pos += 1
+    return lines
+
+
+def main(argv):
+    """Run the command line tool."""
+    if len(argv) != 4:
+        print(__doc__)
+        return 2
+    level = argv[1]
+    level = int(level) if level.isdigit() else LEVELS[level.lower()]
+    with open(argv[2]) as source:
+        lines = source.readlines()
+    with open(argv[3], "w") as output:
+        output.writelines(strip(lines, level))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -1,5 +1,7 @@
 """Valve implementation."""
 
+from time import ticks_diff, ticks_ms
+
 from lib import logging
 from lib.core import Sensor, Switch
 from lib.mainloop import main_loop
@@ -8,14 +10,21 @@ _LOGGER = logging.getLogger(__name__)
 
 
 class Valve(Sensor):
-    """Representation of a Valve device."""
+    """Representation of a Valve device.
+
+    While the motor runs the position is interpolated from the time it started.
+    A single one-shot task fires at the next milestone or at the end of travel,
+    so the position is reported only there and when the motor stops. The full
+    travel takes operation_time seconds to open and closing_time to close.
+    """
 
     def __init__(
         self,
         direction_switch,
         power_switch,
         operation_time=15,
-        discretization=5,
+        closing_time=None,
+        milestones=(),
         *args,
         **kwargs,
     ):
@@ -23,41 +32,96 @@ class Valve(Sensor):
         self._direction_switch = direction_switch
         self._power_switch = power_switch
         self._operation_time = operation_time
-        self._discretization = discretization
+        self._closing_time = (
+            closing_time if closing_time is not None else operation_time
+        )
+        self._milestones = milestones
         self.is_closing = Switch()
         self.is_opening = Switch()
-        super().__init__(*args, **kwargs)
-
+        self._start = None
+        self._start_position = None
+        self._opening = False
+        self._target = None
         self._operate_task = None
+        super().__init__(*args, **kwargs)
 
     def __del__(self):
         """Cancel callbacks."""
         self.stop()
 
+    @property
+    def state(self):
+        """Get the current position."""
+        if self._start is None:
+            return self._state
+        return self._position()
+
+    @state.setter
+    def state(self, value):
+        """Set the current position."""
+        if self._start is not None and value is not None:
+            self._move(value)
+        self._report(value)
+
+    def _report(self, value):
+        """Notify the subscribers of the new position."""
+        if value != self._state or self._state is None:
+            self._state = value
+            self._run_triggers(value)
+
+    def _travel_time(self):
+        """Return the time in ms to travel one percent in the current direction."""
+        return (self._operation_time if self._opening else self._closing_time) * 10
+
+    def _end(self):
+        """Return the position where the current travel stops."""
+        if self._target is not None:
+            return self._target
+        return 100 if self._opening else 0
+
+    def _position(self):
+        """Interpolate the position from the time the motor runs.
+
+        The position does not pass the end of travel, even if the timer fired
+        late.
+        """
+        travel = ticks_diff(ticks_ms(), self._start) // self._travel_time()
+        if self._opening:
+            return min(self._end(), self._start_position + travel)
+        return max(self._end(), self._start_position - travel)
+
+    def _move(self, position):
+        """Start the travel from the position and arm the timer."""
+        self._start = ticks_ms()
+        self._start_position = position
+        self._schedule()
+
+    def _schedule(self):
+        """Arm the timer for the next milestone or the end of travel."""
+        main_loop.remove_task(self._operate_task)
+        position = self._position()
+        target = self._end()
+        for milestone in self._milestones:
+            if (self._opening and position < milestone < target) or (
+                not self._opening and target < milestone < position
+            ):
+                target = milestone
+        delay = abs(target - self._start_position) * self._travel_time()
+        self._operate_task = main_loop.schedule_task(
+            lambda: self._operate(),
+            next_run=max(0, delay - ticks_diff(ticks_ms(), self._start)),
+            name="valve",
+        )
+
     def _operate(self):
-        """Update current status."""
-        new_state = self.state
-        if self.is_closing.state:
-            if new_state is None:
-                new_state = 100
-            new_state -= self._discretization
-            if new_state < 0:
-                new_state = 0
-            if new_state == 0:
-                self.stop()
-        elif self.is_opening.state:
-            if new_state is None:
-                new_state = 0
-            new_state += self._discretization
-            if new_state > 100:
-                new_state = 100
-            if new_state == 100:
-                self.stop()
-        else:
-            _LOGGER.warning("Not in transition")
+        """Report the milestone or stop at the end of travel."""
+        self._operate_task = None
+        position = self._position()
+        if position == self._end():  # Reached or passed
             self.stop()
             return
-        self.state = new_state
+        self._report(position)
+        self._schedule()
 
     def stop(self):
         """Stop current operation."""
@@ -65,49 +129,55 @@ class Valve(Sensor):
         self._operate_task = None
         self._direction_switch.state = False
         self._power_switch.state = False
+        if self._start is not None:
+            position = self._position()
+            self._start = None
+            self._report(position)
         self.is_opening.state = False
         self.is_closing.state = False
 
-    def open(self):
-        """Open the valve."""
-        if self.is_opening.state:
-            _LOGGER.info("Already opening")
+    def _run(self, opening, target=None):
+        """Run the motor towards the end or the target position."""
+        moving = self.is_opening if opening else self.is_closing
+        if moving.state:
+            if target == self._target:
+                _LOGGER.info("Already opening" if opening else "Already closing")
+                return
+            self._target = target
+            self._schedule()
             return
-        if self.is_closing.state:
-            self._operate()
+        if self._start is not None:
             self.stop()
-        self._direction_switch.state = True
+        self._direction_switch.state = opening
         self._power_switch.state = True
-        self.is_opening.state = True
-
-        if self._operate_task:
-            _LOGGER.warning("Task already scheduled")
-            main_loop.remove_task(self._operate_task)
-            self._operate_task = None
+        self._opening = opening
+        self._target = target
+        if self._state is not None:
+            self._move(self._state)
+        else:
+            self._move(0 if opening else 100)
+        moving.state = True
 
-        self._operate_task = main_loop.schedule_task(
-            lambda: self._operate(),
-            period=self._operation_time * self._discretization * 10,
-        )
+    def open(self):
+        """Open the valve."""
+        self._run(True)
 
     def close(self):
         """Close the valve."""
-        if self.is_closing.state:
-            _LOGGER.info("Already closing")
+        self._run(False)
+
+    def set_position(self, position):
+        """Move the valve to the position and stop there."""
+        if position >= 100:
+            self.open()
+            return
+        if position <= 0:
+            self.close()
             return
-        if self.is_opening.state:
-            self._operate()
+        current = self.state
+        if current is None:
+            raise ValueError("Unknown position")
+        if position == current:
             self.stop()
-        self._direction_switch.state = False
-        self._power_switch.state = True
-        self.is_closing.state = True
-
-        if self._operate_task:
-            _LOGGER.warning("Task already scheduled")
-            main_loop.remove_task(self._operate_task)
-            self._operate_task = None
-
-        self._operate_task = main_loop.schedule_task(
-            lambda: self._operate(),
-            period=self._operation_time * self._discretization * 10,
-        )
+            return
+        self._run(position > current, position)
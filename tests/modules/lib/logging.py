@@ -1,3 +1,7 @@
 """The logging module to run the tests."""
 
 from logging import *  # noqa: F401,F403
+
+
+def flush():
+    """Send the buffered records, the records are not buffered here."""
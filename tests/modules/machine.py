@@ -49,9 +49,12 @@ class Pin:
     AF17_SPI_SSEL = 17
     AF18_SPI_SCLK = 18
     AF19_SPI_ATTN = 19
+    IRQ_RISING = 1
+    IRQ_FALLING = 2
 
     value = MagicMock(return_value=False)
     init = MagicMock()
+    irq = MagicMock()
 
     def __init__(self, *args, **kwargs):
         """Save init args."""
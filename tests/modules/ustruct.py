@@ -0,0 +1,3 @@
+"""The ustruct module to run the tests."""
+
+from struct import calcsize, pack, pack_into, unpack, unpack_from  # noqa: F401
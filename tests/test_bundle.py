@@ -1,9 +1,10 @@
 """Test bundle."""
 
 import importlib
+import json
 from unittest.mock import call
 
-import bundle
+import pytest
 from machine import soft_reset as mock_soft_reset
 from micropython import opt_level as mock_opt_level
 from uos import (
@@ -16,7 +17,17 @@ from uos import (
 from xbee import atcmd as mock_atcmd
 
 
-def test_bundle_compile():
+@pytest.fixture(name="bundle")
+def bundle_fixture(tmp_path, monkeypatch):
+    """Run the bundle with the manifest and the sources in a temporary directory."""
+    monkeypatch.chdir(tmp_path)
+    module = importlib.import_module("bundle")
+    # Start without the manifest written by the first import
+    (tmp_path / "bundle.json").unlink(missing_ok=True)
+    yield module
+
+
+def test_bundle_compile(bundle):
     """Test compile."""
     assert "bundle.mpy" not in bundle._bundle_list
     assert "main.mpy" not in bundle._bundle_list
@@ -53,7 +64,7 @@ def test_bundle_compile():
     mock_remove.side_effect = None
 
 
-def test_bundle_compile_memory_error():
+def test_bundle_compile_memory_error(bundle):
     """Test compile with memory error."""
     mock_listdir.return_value = ["test.py"]
     mock_compile.reset_mock()
@@ -68,7 +79,7 @@ def test_bundle_compile_memory_error():
     mock_soft_reset.assert_called_once_with()
 
 
-def test_bundle_compile_main_bundle():
+def test_bundle_compile_main_bundle(bundle):
     """Test that main.py and bundle.py are compiled first."""
     mock_listdir.return_value = ["aaa.py", "bundle.py", "main.py", "zzz.py"]
     mock_compile.reset_mock()
@@ -87,7 +98,7 @@ def test_bundle_compile_main_bundle():
     assert mock_bundle.call_count == 3
 
 
-def test_bundle_all_compiled():
+def test_bundle_all_compiled(bundle):
     """Test bundle after compile."""
     mock_listdir.return_value = ["bundle.mpy", "test.mpy"]
     mock_atcmd.reset_mock()
@@ -104,3 +115,123 @@ def test_bundle_all_compiled():
     mock_sync.assert_called_once_with()
     mock_soft_reset.assert_called_once_with()
     assert mock_bundle.call_count == 3
+
+
+def test_bundle_incremental(bundle, tmp_path):
+    """Test only the changed modules are compiled and bundled."""
+    (tmp_path / "valve.py").write_text("# valve")
+    (tmp_path / "test.py").write_text("# test")
+    mock_listdir.return_value = ["valve.py", "test.py"]
+    mock_bundle.return_value = []
+    mock_compile.reset_mock()
+    mock_bundle.reset_mock()
+
+    importlib.reload(bundle)
+
+    assert mock_compile.call_count == 4
+    assert mock_bundle.call_count == 2
+    manifest = json.loads((tmp_path / "bundle.json").read_text())
+    assert not manifest["dirty"]
+    assert set(manifest["files"]) == {
+        "valve.py",
+        "test.py",
+        "lib/valve.py",
+        "lib/test.py",
+    }
+
+    # Nothing changed, nothing to compile or bundle
+    mock_listdir.return_value = ["valve.py", "test.py", "valve.mpy", "test.mpy"]
+    mock_compile.reset_mock()
+    mock_bundle.reset_mock()
+    mock_remove.reset_mock()
+    mock_soft_reset.reset_mock()
+
+    importlib.reload(bundle)
+
+    mock_compile.assert_not_called()
+    mock_bundle.assert_not_called()
+    assert mock_remove.call_args_list == [call("valve.py"), call("test.py")] * 2
+    mock_soft_reset.assert_called_once_with()
+
+    # A module outside the bundle is compiled without rebundling
+    (tmp_path / "test.py").write_text("# test changed")
+    mock_compile.reset_mock()
+
+    importlib.reload(bundle)
+
+    assert mock_compile.call_args_list == [call("test.py")] * 2
+    mock_bundle.assert_not_called()
+
+    # A memory error resumes after the compiled modules
+    (tmp_path / "valve.py").write_text("# valve changed")
+    (tmp_path / "test.py").write_text("# test changed again")
+    mock_compile.reset_mock()
+    mock_compile.side_effect = [None, MemoryError("Not enough memory")]
+    mock_soft_reset.side_effect = SystemExit
+
+    with pytest.raises(SystemExit):
+        importlib.reload(bundle)
+
+    mock_compile.side_effect = None
+    mock_soft_reset.side_effect = None
+    assert mock_compile.call_args_list == [call("valve.py"), call("test.py")]
+    assert json.loads((tmp_path / "bundle.json").read_text())["dirty"]
+    mock_compile.reset_mock()
+    mock_bundle.reset_mock()
+
+    importlib.reload(bundle)
+
+    assert mock_compile.call_args_list == [
+        call("test.py"),
+        call("valve.py"),
+        call("test.py"),
+    ]
+    assert mock_bundle.call_count == 2
+    assert not json.loads((tmp_path / "bundle.json").read_text())["dirty"]
+
+
+def test_bundle_installer(bundle, tmp_path):
+    """Test the installer is bundled only when its source changed."""
+    (tmp_path / "bundle.py").write_text("# bundle")
+    mock_listdir.return_value = ["bundle.py"]
+    mock_bundle.return_value = []
+    mock_compile.reset_mock()
+    mock_bundle.reset_mock()
+
+    importlib.reload(bundle)
+
+    assert mock_bundle.call_args_list[0] == call("bundle.mpy")
+    assert mock_bundle.call_args_list[-1] == call(*bundle._bundle_list)
+    assert not json.loads((tmp_path / "bundle.json").read_text())["dirty"]
+
+    # Deployed again unchanged, compiled to resume after the reset only
+    mock_listdir.return_value = ["bundle.py"]
+    mock_compile.reset_mock()
+    mock_bundle.reset_mock()
+    mock_remove.reset_mock()
+
+    importlib.reload(bundle)
+
+    assert mock_compile.call_args_list[0] == call("bundle.py")
+    mock_bundle.assert_not_called()
+    assert not json.loads((tmp_path / "bundle.json").read_text())["dirty"]
+
+    # Removed once done
+    mock_listdir.return_value = ["bundle.mpy"]
+    mock_compile.reset_mock()
+    mock_remove.reset_mock()
+
+    importlib.reload(bundle)
+
+    mock_compile.assert_not_called()
+    mock_bundle.assert_not_called()
+    mock_remove.assert_called_once_with("bundle.mpy")
+
+    # A changed installer is bundled again
+    (tmp_path / "bundle.py").write_text("# bundle changed")
+    mock_listdir.return_value = ["bundle.py", "bundle.mpy"]
+
+    importlib.reload(bundle)
+
+    assert mock_bundle.call_args_list[0] == call("bundle.mpy")
+    assert mock_bundle.call_args_list[-1] == call(*bundle._bundle_list)
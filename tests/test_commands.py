@@ -1,13 +1,14 @@
 """Test commands."""
 
 import logging
-from json import loads as json_loads
-from time import sleep as mock_sleep
-from unittest.mock import patch
+from json import dumps as json_dumps, loads as json_loads
+from time import sleep as mock_sleep, sleep_ms as mock_sleep_ms
+from unittest.mock import MagicMock, patch
 
 import commands
 import pytest
-from lib.core import Sensor, Switch
+from lib import wire
+from lib.core import Commands, Sensor, Switch
 from lib.mainloop import main_loop
 from machine import reset_cause as mock_reset_cause, soft_reset as mock_soft_reset
 from valve import Valve
@@ -98,6 +99,17 @@ def test_commands():
     mock_transmit.reset_mock()
 
     assert command("test") == "args: (), kwargs: {}"
+
+    mock_receive.return_value = {
+        "sender_eui64": b"\x00\x13\xa2\x00A\xa0n`",
+        "payload": '{"cmd": "test", "args": [5], "id": 17}',
+    }
+    cmnds.update()
+    assert json_loads(mock_transmit.call_args[0][1]) == {
+        "test_resp": "args: (5,), kwargs: {}",
+        "id": 17,
+    }
+    mock_transmit.reset_mock()
     assert command("test", "true") == "args: (True,), kwargs: {}"
     assert command("test", '{"test": "123"}') == "args: (), kwargs: {'test': '123'}"
     assert command("test", "[1, 2, 3]") == "args: (1, 2, 3), kwargs: {}"
@@ -109,17 +121,25 @@ def test_commands():
         "bind",
         "close",
         "counter",
+        "crashlog",
         "help",
+        "history",
+        "journal",
+        "leak",
         "logger",
         "open",
+        "position",
         "reset_cause",
+        "snapshot",
         "soft_reset",
+        "stats",
         "stop",
         "test",
         "unbind",
         "unique_id",
         "uptime",
         "valve",
+        "wire",
     ]
 
     mock_atcmd.reset_mock()
@@ -129,12 +149,14 @@ def test_commands():
     assert command("atcmd", '"VL"') == "OK"
     mock_atcmd.assert_called_once_with("VL")
     counter[0].state = 110
+    main_loop.run_once()
     assert mock_transmit.call_count == 1
     assert mock_transmit.call_args[0][0] == b"\x00\x13\xa2\x00A\xa0n`"
     assert mock_transmit.call_args[0][1] == '{"counter_0": 110}'
     mock_transmit.reset_mock()
     assert command("unbind") == "OK"
     counter[0].state = 115
+    main_loop.run_once()
     assert mock_transmit.call_count == 0
     assert command("unbind") == "OK"
 
@@ -143,6 +165,7 @@ def test_commands():
         == "OK"
     )
     valve[1].state = 60
+    main_loop.run_once()
     assert mock_transmit.call_count == 1
     assert mock_transmit.call_args[0][0] == b"\x00\x00\x00\x00\x00\x00\x00\x00"
     assert mock_transmit.call_args[0][1] == '{"valve_1": 60}'
@@ -152,20 +175,24 @@ def test_commands():
         == "OK"
     )
     valve[1].state = 70
+    main_loop.run_once()
     assert mock_transmit.call_count == 0
 
     assert command("bind") == "OK"
     valve[1].is_opening.state = True
+    main_loop.run_once()
     assert mock_transmit.call_count == 1
     assert mock_transmit.call_args[0][0] == b"\x00\x13\xa2\x00A\xa0n`"
     assert mock_transmit.call_args[0][1] == '{"opening_1": true}'
     mock_transmit.reset_mock()
     assert command("unbind") == "OK"
     valve[1].is_opening.state = False
+    main_loop.run_once()
     assert mock_transmit.call_count == 0
 
     assert command("bind") == "OK"
     valve[1].is_closing.state = True
+    main_loop.run_once()
     assert mock_transmit.call_count == 1
     assert mock_transmit.call_args[0][0] == b"\x00\x13\xa2\x00A\xa0n`"
     assert json_loads(mock_transmit.call_args[0][1]) == {
@@ -174,6 +201,7 @@ def test_commands():
     mock_transmit.reset_mock()
     assert command("unbind") == "OK"
     valve[1].is_closing.state = False
+    main_loop.run_once()
     assert mock_transmit.call_count == 0
 
     assert command("valve", 1) == {
@@ -197,11 +225,82 @@ def test_commands():
     assert valve[0].is_opening.state is False
     assert command("stop", 2) == "OK"
     assert valve[2].is_closing.state is False
+    assert command("position", "[1, 50]") == "OK"
+    assert valve[1].is_closing.state is True
+    assert command("stop", 1) == "OK"
+    assert valve[1].state == 90
+
+    mock_receive.return_value = {
+        "sender_eui64": b"\x00\x13\xa2\x00A\xa0n`",
+        "payload": '{"batch": [{"cmd": "open", "args": 0}, {"cmd": "close", "args": 2}'
+        ', {"cmd": "do_magic"}, {"cmd": "valve", "args": 0}], "id": 5}',
+    }
+    cmnds.update()
+    assert mock_transmit.call_count == 1
+    assert json_loads(mock_transmit.call_args[0][1]) == {
+        "batch_resp": [
+            "OK",
+            "OK",
+            {"err": "AttributeError: No such command"},
+            {"state": 0, "is_opening": True, "is_closing": False},
+        ],
+        "id": 5,
+    }
+    mock_transmit.reset_mock()
+    assert valve[0].is_opening.state is True
+    assert valve[2].is_closing.state is True
+    valve[0].stop()
+    valve[2].stop()
+
+    mock_receive.return_value = {
+        "sender_eui64": b"\x00\x13\xa2\x00A\xa0n`",
+        "payload": '{"batch": {"cmd": "open"}}',
+    }
+    cmnds.update()
+    assert json_loads(mock_transmit.call_args[0][1]) == {
+        "batch_resp": {"err": "TypeError: batch must be a list"}
+    }
+    mock_transmit.reset_mock()
+
+    # The items left when the response frame is full are not run
+    mock_receive.return_value = {
+        "sender_eui64": b"\x00\x13\xa2\x00A\xa0n`",
+        "payload": json_dumps(
+            {"batch": [{"cmd": "help"}] + [{"cmd": "valve", "args": 0}] * 8}
+        ),
+    }
+    cmnds.update()
+    assert len(mock_transmit.call_args[0][1]) <= cmnds._max_payload
+    response = json_loads(mock_transmit.call_args[0][1])["batch_resp"]
+    assert response[0] == {"err": "Response too large"}
+    assert 1 < len(response) < 9
+    assert response[1] == {"state": 0, "is_opening": False, "is_closing": False}
+    mock_transmit.reset_mock()
 
     assert command("counter", [0, 120]) == "OK"
     assert counter[0].state == 120
     assert command("counter", 0) == 120
 
+    mock_reset_cause.reset_mock()
+    assert command("snapshot") == {
+        "up": 0,
+        "rc": 6,
+        "c": [120, None, None],
+        "v": [0, 90, 100],
+        "m": [0, 0, 0],
+        "f": None,
+        "l": None,
+        "j": False,
+        "h": None,
+    }
+    assert command("snapshot", '{"bind": true}')["c"] == [120, None, None]
+    counter[1].state = 10
+    main_loop.run_once()
+    assert mock_transmit.call_count == 1
+    assert mock_transmit.call_args[0][1] == '{"counter_1": 10}'
+    mock_transmit.reset_mock()
+    assert command("unbind") == "OK"
+
     if logging.getLogger().getEffectiveLevel() == logging.DEBUG:
         assert command("logger", logging.WARNING) == "OK"
         assert logging.getLogger().getEffectiveLevel() == logging.WARNING
@@ -267,6 +366,18 @@ def test_commands():
 
     mock_reset_cause.reset_mock()
     assert command("reset_cause") == 6
+
+    assert command("stats") is None
+    stats = command("stats", '{"enable": true}')
+    assert stats["iterations"] == 0
+    tasks = [command("stats", json_dumps({"index": x})) for x in range(stats["count"])]
+    assert {"task": ["commands", 0, 0, 0, 0, 0], "count": stats["count"]} in tasks
+    assert command("stats", json_dumps({"index": stats["count"]})) == stats
+    main_loop.run_once()
+    stats = command("stats", '{"reset": true}')
+    assert stats["iterations"] == 1
+    assert command("stats")["iterations"] == 0
+    assert command("stats", '{"enable": false}') is None
     mock_reset_cause.assert_called_once_with()
 
     mock_transmit.side_effect = OSError("EAGAIN")
@@ -277,3 +388,480 @@ def test_commands():
     mock_schedule_task.assert_called_once()
 
     mock_transmit.side_effect = None
+
+
+def test_commands_receive_callback():
+    """Test event driven command reception."""
+    frame = {
+        "broadcast": False,
+        "dest_ep": 232,
+        "sender_eui64": b"\x00\x13\xa2\x00A\xa0n`",
+        "payload": '{"cmd": "unique_id"}',
+        "sender_nwk": 0,
+        "source_ep": 232,
+        "profile": 49413,
+        "cluster": 17,
+    }
+
+    with patch("lib.core.receive_callback") as mock_receive_callback:
+        cmnds = Commands()
+        mock_receive_callback.assert_called_once()
+        on_receive = mock_receive_callback.call_args[0][0]
+        assert cmnds._updates is None
+        assert main_loop._wake_interval is None
+
+        main_loop.run_once()
+        mock_receive.reset_mock()
+        mock_transmit.reset_mock()
+        for _ in range(4):
+            on_receive(frame)
+        assert main_loop._wake
+        assert len(cmnds._frames) == 4
+        assert cmnds._updates.next_run is not None
+
+        # The frames over the queue size are answered with an error
+        on_receive(dict(frame, payload='{"cmd": "test", "id": 7}'))
+        on_receive(dict(frame, payload=b"\xfb\x03\x08\x00"))
+        on_receive(dict(frame, payload="invalid"))
+        assert len(cmnds._frames) == 4
+        assert len(cmnds._rejects) == 2
+
+        main_loop.run_once()
+        assert mock_receive.call_count == 0
+        assert mock_transmit.call_count == 6
+        assert json_loads(mock_transmit.call_args_list[0][0][1]) == {
+            "test_resp": {"err": "Receive queue full"},
+            "id": 7,
+        }
+        assert wire.decode(mock_transmit.call_args_list[1][0][1]) == (
+            3,
+            8,
+            {"err": "Receive queue full"},
+        )
+        assert json_loads(mock_transmit.call_args[0][1]) == {
+            "unique_id_resp": "0102030405060708"
+        }
+        assert cmnds._rejects == []
+        assert cmnds._frames == []
+        assert cmnds._updates.next_run is None
+
+        mock_receive_callback.reset_mock()
+        cmnds.__del__()
+        mock_receive_callback.assert_called_once_with(None)
+        assert main_loop._wake_interval is None
+    mock_transmit.reset_mock()
+
+
+def test_commands_notify():
+    """Test coalesced notifications."""
+    cmnds = Commands(event_driven=False)
+    main_loop.run_once()
+    mock_transmit.reset_mock()
+
+    cmnds._notify(b"\x00\x00\x00\x00\x00\x00\x00\x01", "valve_0", 10)
+    cmnds._notify(b"\x00\x00\x00\x00\x00\x00\x00\x01", "opening_0", True)
+    cmnds._notify(b"\x00\x00\x00\x00\x00\x00\x00\x01", "valve_0", 20)
+    cmnds._notify(b"\x00\x00\x00\x00\x00\x00\x00\x02", "counter_1", 5)
+    assert mock_transmit.call_count == 0
+    main_loop.run_once()
+    assert mock_transmit.call_count == 2
+    assert mock_transmit.call_args_list[0][0] == (
+        b"\x00\x00\x00\x00\x00\x00\x00\x01",
+        '{"valve_0": 20, "opening_0": true}',
+    )
+    assert mock_transmit.call_args_list[1][0] == (
+        b"\x00\x00\x00\x00\x00\x00\x00\x02",
+        '{"counter_1": 5}',
+    )
+    mock_transmit.reset_mock()
+
+    main_loop.run_once()
+    assert mock_transmit.call_count == 0
+
+    for number in range(30):
+        cmnds._notify(
+            b"\x00\x00\x00\x00\x00\x00\x00\x01", "counter_{}".format(number), 1
+        )
+    main_loop.run_once()
+    assert mock_transmit.call_count == 2
+    merged = {}
+    for call in mock_transmit.call_args_list:
+        assert len(call[0][1]) <= cmnds._max_payload
+        merged.update(json_loads(call[0][1]))
+    assert len(merged) == 30
+    mock_transmit.reset_mock()
+
+    # Two items one byte over the payload when merged, one item over alone
+    cmnds._notify(b"\x00\x00\x00\x00\x00\x00\x00\x01", "a", "x" * 119)
+    cmnds._notify(b"\x00\x00\x00\x00\x00\x00\x00\x01", "b", "x" * 119)
+    cmnds._notify(b"\x00\x00\x00\x00\x00\x00\x00\x01", "c", "x" * 247)
+    main_loop.run_once()
+    assert mock_transmit.call_count == 2
+    for call in mock_transmit.call_args_list:
+        assert len(call[0][1]) <= cmnds._max_payload
+    assert "c" not in json_loads(mock_transmit.call_args[0][1])
+    mock_transmit.reset_mock()
+    cmnds.__del__()
+
+
+def test_commands_transmit_queue():
+    """Test queued transmission with backoff."""
+    cmnds = Commands(event_driven=False)
+    main_loop.remove_task(cmnds._uptime_cb)
+    main_loop.run_once()
+    mock_transmit.reset_mock()
+
+    def sent():
+        # Other instances may report their uptime meanwhile
+        return [x[0][1] for x in mock_transmit.call_args_list if x[0][0] == b"1"]
+
+    mock_transmit.side_effect = OSError("EAGAIN")
+    cmnds._transmit(b"1", "a", (b"1", ("x",)))
+    cmnds._transmit(b"1", "b")
+    cmnds._transmit(b"1", "c", (b"1", ("x",)))
+    assert sent() == ["a"]
+    assert cmnds._tx_count == 2
+
+    mock_sleep(50)
+    main_loop.run_once()
+    assert sent() == ["a", "b"]
+    assert cmnds._tx_backoff == 100
+    assert cmnds._tx_task.next_run is not None
+
+    mock_transmit.side_effect = None
+    mock_transmit.reset_mock()
+    mock_sleep(100)
+    main_loop.run_once()
+    assert sent() == ["b", "c"]
+    assert cmnds._tx_count == 0
+    assert cmnds._tx_backoff == 50
+    mock_transmit.reset_mock()
+
+    # A superseding frame keeps the order of the state changes
+    mock_transmit.side_effect = OSError("EAGAIN")
+    cmnds._transmit(b"1", "x=1", (b"1", ("x",)))
+    cmnds._transmit(b"1", "y=2", (b"1", ("y",)))
+    cmnds._transmit(b"1", "x=3", (b"1", ("x",)))
+    cmnds._transmit(b"2", "x=4", (b"2", ("x",)))
+    cmnds._transmit(b"1", "x=5, y=6", (b"1", ("x", "y")))
+    cmnds._transmit(b"1", "y=7", (b"1", ("y",)))
+    mock_transmit.side_effect = None
+    mock_transmit.reset_mock()
+    mock_sleep(50)
+    main_loop.run_once()
+    assert sent() == ["x=5, y=6", "y=7"]
+    mock_transmit.assert_any_call(b"2", "x=4")
+    mock_transmit.reset_mock()
+
+    cmnds._transmit(b"1", "d")
+    assert sent() == ["d"]
+    mock_transmit.reset_mock()
+
+    mock_transmit.side_effect = OSError("EAGAIN")
+    for x in range(10):
+        cmnds._transmit(b"1", str(x))
+    assert cmnds._tx_count == 8
+    assert cmnds._tx_data[cmnds._tx_head] == "2"
+    for x in range(5):
+        mock_sleep(800)
+        main_loop.run_once()
+    assert cmnds._tx_count == 7
+    assert cmnds._tx_data[cmnds._tx_head] == "3"
+
+    mock_transmit.side_effect = None
+    mock_transmit.reset_mock()
+    mock_sleep(800)
+    main_loop.run_once()
+    assert sent() == ["3", "4", "5", "6", "7", "8", "9"]
+    mock_transmit.reset_mock()
+    cmnds.__del__()
+
+
+def test_commands_binary():
+    """Test the binary wire protocol."""
+    cmnds = Commands(event_driven=False)
+    main_loop.remove_task(cmnds._uptime_cb)
+    sender = b"\x00\x13\xa2\x00A\xa0n`"
+
+    def request(payload):
+        mock_transmit.reset_mock()
+        mock_receive.return_value = {"sender_eui64": sender, "payload": payload}
+        cmnds.update()
+        assert mock_transmit.call_count == 1
+        assert mock_transmit.call_args[0][0] == sender
+        return mock_transmit.call_args[0][1]
+
+    codes = json_loads(request('{"cmd": "wire"}'))["wire_resp"]
+    assert codes == cmnds.cmd_help()
+    assert sender not in cmnds._binary
+
+    frame = request(bytes(wire.encode(codes.index("unique_id"), 0x1234, None)))
+    assert wire.decode(bytes(frame)) == (
+        codes.index("unique_id"),
+        0x1234,
+        "0102030405060708",
+    )
+    assert sender in cmnds._binary
+
+    frame = request(bytes(wire.encode(codes.index("test"), 1, [[1, 2], {"a": 3}])))
+    assert wire.decode(bytes(frame))[2] == "args: (1, 2), kwargs: {'a': 3}"
+
+    frame = request(bytes(wire.encode(codes.index("wire"), 2, "invalid")))
+    assert wire.decode(bytes(frame))[2] == {"err": "ValueError: Unknown wire mode"}
+
+    frame = request(bytes(wire.encode(200, 3, None)))
+    assert wire.decode(bytes(frame)) == (
+        200,
+        3,
+        {"err": "AttributeError: No such command"},
+    )
+
+    mock_receive.return_value = {"sender_eui64": sender, "payload": b"\xfb\x00"}
+    with pytest.raises(ValueError, match="invalid frame"):
+        cmnds.update()
+
+    mock_transmit.reset_mock()
+    cmnds._notify(sender, "counter_0", 12345)
+    cmnds._notify(sender, "opening_1", True)
+    main_loop.run_once()
+    assert mock_transmit.call_count == 1
+    assert wire.decode(bytes(mock_transmit.call_args[0][1])) == (
+        wire.NOTIFY,
+        0,
+        {"counter_0": 12345, "opening_1": True},
+    )
+
+    for number in range(40):
+        cmnds._notify(sender, "counter_{}".format(number), 100000)
+    mock_transmit.reset_mock()
+    main_loop.run_once()
+    assert mock_transmit.call_count == 3
+    merged = {}
+    for call in mock_transmit.call_args_list:
+        assert len(call[0][1]) <= cmnds._max_payload
+        merged.update(wire.decode(bytes(call[0][1]))[2])
+    assert len(merged) == 40
+
+    assert request('{"cmd": "wire", "args": "json"}') == '{"wire_resp": %s}' % (
+        json_dumps(codes)
+    )
+    assert sender not in cmnds._binary
+    cmnds._notify(sender, "counter_0", 1)
+    mock_transmit.reset_mock()
+    main_loop.run_once()
+    assert mock_transmit.call_args[0][1] == '{"counter_0": 1}'
+    mock_transmit.reset_mock()
+    mock_receive.return_value = None
+    cmnds.__del__()
+
+
+def test_commands_wire_table():
+    """Test the binary command codes are fixed by the table."""
+    counter = [Sensor() for x in range(3)]
+    valve = [Valve(direction_switch=Switch(), power_switch=Switch()) for x in range(3)]
+
+    class Extended(commands.WatercounterCommands):
+        def cmd_added(self, sender_eui64):
+            return "added"
+
+    cmnds = Extended(counter, valve)
+    codes = cmnds.cmd_wire(None)
+    assert codes == commands.WatercounterCommands._wire_table
+    assert codes.index("close") == 2
+    assert codes.index("open") == 10
+    assert "added" in cmnds.cmd_help()
+    assert "added" not in codes
+
+    # A command out of the table has no code
+    sender = b"\x00\x13\xa2\x00A\xa0n`"
+    mock_transmit.reset_mock()
+    mock_receive.return_value = {
+        "sender_eui64": sender,
+        "payload": bytes(wire.encode(len(codes), 1, None)),
+    }
+    cmnds.update()
+    assert wire.decode(bytes(mock_transmit.call_args[0][1]))[2] == {
+        "err": "AttributeError: No such command"
+    }
+    mock_transmit.reset_mock()
+    mock_receive.return_value = None
+    cmnds.__del__()
+    for x in valve:
+        x.__del__()
+
+
+def test_commands_receive_budget():
+    """Test received frames are handled in bounded runs."""
+    cmnds = Commands(event_driven=False)
+    main_loop.remove_task(cmnds._uptime_cb)
+    main_loop.remove_task(cmnds._updates)
+    frame = {"sender_eui64": b"1", "payload": '{"cmd": "unique_id"}'}
+    receive_once = mock_receive.side_effect
+
+    mock_receive.side_effect = [frame] * 6 + [None]
+    mock_transmit.reset_mock()
+    cmnds.update()
+    assert mock_transmit.call_count == 4
+    assert cmnds._backlog.next_run is not None
+    main_loop.run_once()
+    assert mock_transmit.call_count == 6
+    assert cmnds._backlog.next_run is None
+
+    # Time budget
+    mock_receive.side_effect = [frame] * 3 + [None]
+    mock_transmit.side_effect = lambda *args: mock_sleep_ms(30)
+    mock_transmit.reset_mock()
+    cmnds.update()
+    assert mock_transmit.call_count == 2
+    main_loop.run_once()
+    assert mock_transmit.call_count == 3
+
+    mock_transmit.side_effect = None
+    mock_transmit.reset_mock()
+    mock_receive.side_effect = receive_once
+    cmnds.__del__()
+
+
+def test_commands_journal():
+    """Test the counter journal command."""
+    counter = [Sensor() for x in range(3)]
+    valve = [Valve(direction_switch=Switch(), power_switch=Switch()) for x in range(3)]
+    journal = MagicMock(restored=True)
+    cmnds = commands.WatercounterCommands(counter, valve, journal)
+    assert cmnds.cmd_journal() is True
+    journal.save.assert_not_called()
+    assert cmnds.cmd_journal(save=True) is True
+    journal.save.assert_called_once_with(force=True)
+    assert cmnds.cmd_snapshot()["j"] is True
+    cmnds.__del__()
+    for x in valve:
+        x.__del__()
+
+
+def test_commands_flow():
+    """Test the flow rate notifications."""
+    counter = [Sensor() for x in range(3)]
+    flow = [Sensor() for x in range(3)]
+    valve = [Valve(direction_switch=Switch(), power_switch=Switch()) for x in range(3)]
+    cmnds = commands.WatercounterCommands(counter, valve, flow=flow)
+    flow[2].state = 12
+    assert cmnds.cmd_snapshot()["f"] == [None, None, 12]
+
+    cmnds.cmd_bind(b"1")
+    main_loop.run_once()
+    mock_transmit.reset_mock()
+    flow[1].state = 5
+    main_loop.run_once()
+    mock_transmit.assert_called_once_with(b"1", '{"flow_1": 5}')
+    mock_transmit.reset_mock()
+    cmnds.cmd_unbind()
+    flow[1].state = 6
+    main_loop.run_once()
+    assert mock_transmit.call_count == 0
+    cmnds.__del__()
+    for x in valve:
+        x.__del__()
+
+
+def test_commands_leak():
+    """Test the leak detection command and notifications."""
+    counter = [Sensor() for x in range(3)]
+    valve = [Valve(direction_switch=Switch(), power_switch=Switch()) for x in range(3)]
+    cmnds = commands.WatercounterCommands(counter, valve)
+    assert cmnds.cmd_leak(None, 1) is None
+    cmnds.__del__()
+
+    leak = [MagicMock() for x in range(3)]
+    for x in leak:
+        x.state = None
+        x.max_rate = None
+        x.max_duration = 3600000
+        x.max_gap = 300000
+    cmnds = commands.WatercounterCommands(counter, valve, leak=leak)
+    assert cmnds.cmd_leak(None, 1, 40, 0) == {
+        "state": None,
+        "max_rate": 40,
+        "max_duration": None,
+        "max_gap": 300000,
+    }
+    leak[1].reset.assert_not_called()
+    cmnds.cmd_leak(None, 1, reset=True)
+    leak[1].reset.assert_called_once_with()
+    leak[2].state = "rate"
+    assert cmnds.cmd_snapshot()["l"] == [None, None, "rate"]
+
+    cmnds.cmd_bind(b"1")
+    leak[0].subscribe.assert_called_once()
+    leak[0].subscribe.call_args[0][0]("duration")
+    main_loop.run_once()
+    mock_transmit.assert_any_call(b"1", '{"leak_0": "duration"}')
+    cmnds.cmd_unbind()
+    leak[0].unsubscribe.assert_called_once()
+    cmnds.__del__()
+    for x in valve:
+        x.__del__()
+
+
+def test_commands_snapshot_size():
+    """Test the snapshot response fits one frame in the worst case."""
+    counter = [Sensor(value=4294967295) for x in range(3)]
+    flow = [Sensor(value=99999) for x in range(3)]
+    leak = [Sensor(value="duration") for x in range(3)]
+    valve = [Valve(direction_switch=Switch(), power_switch=Switch()) for x in range(3)]
+    journal = MagicMock(restored=True)
+    history = [MagicMock(seq=9999999) for x in range(3)]
+    cmnds = commands.WatercounterCommands(
+        counter, valve, journal, flow, history, leak=leak
+    )
+    cmnds.cmd_uptime(None, 4294967295)
+    valve[0].open()
+    valve[1].close()
+    snapshot = cmnds.cmd_snapshot()
+    assert snapshot["m"] == [1, -1, 0]
+    response = json_dumps({"snapshot_resp": snapshot, "id": 65535})
+    assert len(response) <= cmnds._max_payload
+    cmnds.__del__()
+    for x in valve:
+        x.stop()
+        x.__del__()
+
+
+def test_commands_crashlog():
+    """Test the crash log command."""
+    counter = [Sensor() for x in range(3)]
+    valve = [Valve(direction_switch=Switch(), power_switch=Switch()) for x in range(3)]
+    cmnds = commands.WatercounterCommands(counter, valve)
+    assert cmnds.cmd_crashlog() is None
+    cmnds.__del__()
+
+    crashlog = MagicMock()
+    crashlog.read.return_value = [{"seq": 2}, {"seq": 1}]
+    cmnds = commands.WatercounterCommands(counter, valve, crashlog=crashlog)
+    assert cmnds.cmd_crashlog() == {"seq": 2, "count": 2}
+    assert cmnds.cmd_crashlog(None, 1) == {"seq": 1, "count": 2}
+    assert cmnds.cmd_crashlog(None, 2) == {"count": 2}
+    assert cmnds.cmd_crashlog(None, clear=True) == "OK"
+    crashlog.clear.assert_called_once_with()
+    cmnds.__del__()
+    for x in valve:
+        x.__del__()
+
+
+def test_commands_history():
+    """Test the history command."""
+    counter = [Sensor() for x in range(3)]
+    valve = [Valve(direction_switch=Switch(), power_switch=Switch()) for x in range(3)]
+    history = [MagicMock() for x in range(3)]
+    history[1].read.return_value = {"data": [1]}
+    cmnds = commands.WatercounterCommands(counter, valve)
+    assert cmnds.cmd_history(None, 1) is None
+    cmnds.__del__()
+    cmnds = commands.WatercounterCommands(counter, valve, history=history)
+    assert cmnds.cmd_history(None, 1, 10) == {"data": [1]}
+    history[1].read.assert_called_once_with(10, None)
+    for x in range(3):
+        history[x].seq = 5 - x
+    assert cmnds.cmd_snapshot()["h"] == 3
+    cmnds.__del__()
+    for x in valve:
+        x.__del__()
@@ -1,17 +1,36 @@
 """Test config."""
 
 import config
+from leak import LeakDetector
+from lib import gcpolicy
 from lib.core import Sensor
+from lib.crashlog import CrashLog
+from lib.mainloop import main_loop
 from valve import Valve
 
 
 def test_config():
     """Test config."""
     assert isinstance(config.debug, bool)
+    assert gcpolicy.get_mode()[0] == gcpolicy.IDLE
     assert isinstance(config.counter, list)
     assert len(config.counter) == 3
     assert isinstance(config.valve, list)
     assert len(config.valve) == 3
+    assert len(config.flow) == 3
+    assert len(config.history) == 3
+    assert len(config.leak) == 3
+    assert isinstance(config.crashlog, CrashLog)
+    assert main_loop._fault_handler == config.crashlog.record
+    main_loop.set_fault_handler()  # Do not write the faults of other tests
     for x in range(3):
         assert isinstance(config.counter[x], Sensor)
         assert isinstance(config.valve[x], Valve)
+        assert isinstance(config.leak[x], LeakDetector)
+        assert config.leak[x].max_rate is None
+        assert config.leak[x].max_duration is None
+    names = [config.counter[x]._sensor._updates.name for x in range(3)]
+    names += [config.flow[x]._updates.name for x in range(3)]
+    names += [config.history[x]._task.name for x in range(3)]
+    names += [config.leak[x]._task.name for x in range(3)]
+    assert len(set(names)) == 12
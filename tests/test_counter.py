@@ -1,9 +1,14 @@
 """The tests for the Counter class."""
 
+from time import sleep_ms as mock_sleep_ms
+from unittest.mock import MagicMock
 
 import pytest
-from counter import Counter
+from counter import Counter, FlowRate, History
 from lib.core import Sensor, Switch
+from lib.mainloop import main_loop
+from lib.xbeepin import PulseInput
+from machine import Pin
 
 
 def test_counter_lo_hi():
@@ -112,3 +117,190 @@ def test_counter_transition_hi_lo(initial, sensor_update, target):
 
     sensor.state = sensor_update
     assert counter.state == target
+
+
+@pytest.mark.parametrize(
+    "initial, edges, level, target",
+    (
+        (2, 1, True, 7),
+        (2, 2, False, 12),
+        (2, 3, True, 17),
+        (2, 4, False, 22),
+        (7, 1, False, 12),
+        (7, 5, False, 32),
+        (7, 6, True, 37),
+    ),
+)
+def test_counter_edges(initial, edges, level, target):
+    """Test counter folding the edges counted with interrupts."""
+    main_loop.reset()
+    Pin.value.return_value = initial % 10 >= 7
+    sensor = PulseInput("D0")
+    counter = Counter(sensor, point_lo_hi=7, point_hi_lo=2)
+    counter.state = initial
+
+    for _ in range(edges):
+        sensor._irq(sensor._pin)
+    Pin.value.return_value = level
+    sensor.update()
+    assert counter.state == target
+    Pin.value.return_value = False
+
+
+def setup_meter():
+    """Initialize a counter that adds 10 on every meter pulse."""
+    sensor = Switch()
+    return sensor, Counter(sensor, point_lo_hi=0, point_hi_lo=0)
+
+
+def pulse(sensor):
+    """Switch the meter on and off."""
+    sensor.state = True
+    sensor.state = False
+
+
+def test_counter_volume():
+    """Test the volume counted from the meter."""
+    sensor, counter = setup_meter()
+    assert counter.volume.state == 0
+    pulse(sensor)
+    pulse(sensor)
+    assert counter.state == 20
+    assert counter.volume.state == 20
+
+    # Setting the counter is not counted
+    counter.state = 1000
+    pulse(sensor)
+    assert counter.state == 1010
+    assert counter.volume.state == 30
+    counter.state = 0
+    assert counter.volume.state == 30
+
+
+def test_flow_rate():
+    """Test flow rate calculation from the pulse timing."""
+    sensor, counter = setup_meter()
+    flow = FlowRate(counter)
+    assert isinstance(flow, Sensor)
+    assert flow.state == 0
+
+    # 10 liters every 30 seconds
+    for x in range(1, 4):
+        mock_sleep_ms(30000)
+        pulse(sensor)
+    assert flow.state == 20
+
+    # The rate decays without pulses
+    mock_sleep_ms(30000)
+    flow.update()
+    assert flow.state == 20
+    mock_sleep_ms(30000)
+    flow.update()
+    assert flow.state == 10
+
+    # Only the last pulses in the ring count
+    for x in range(4, 14):
+        mock_sleep_ms(6000)
+        pulse(sensor)
+    assert flow.state == 100
+
+    # Setting the counter is not a flow
+    counter.state = 10
+    counter.state = 100000000
+    assert flow.state == 100
+
+    mock_sleep_ms(600000)
+    flow.update()
+    assert flow.state == 0
+
+    pulse(sensor)
+    mock_sleep_ms(6000)
+    pulse(sensor)
+    assert flow.state == 100
+
+    flow.__del__()
+    flow.__del__()  # Again from the garbage collector
+    pulse(sensor)
+    main_loop.remove_task(flow._updates)
+
+
+def test_flow_rate_lowpass():
+    """Test flow rate notifications."""
+    sensor, counter = setup_meter()
+    flow = FlowRate(counter)
+    callback = MagicMock()
+    flow.subscribe(callback)
+
+    mock_sleep_ms(6000)
+    pulse(sensor)
+    mock_sleep_ms(6000)
+    pulse(sensor)
+    callback.assert_called_once_with(100)
+    callback.reset_mock()
+
+    # Small changes are not reported right away
+    mock_sleep_ms(7000)
+    pulse(sensor)
+    mock_sleep_ms(100)
+    flow.update(auto=True)
+    assert flow.state == 92
+    callback.assert_not_called()
+    mock_sleep_ms(10000)
+    flow.update(auto=True)
+    callback.assert_called_once_with(flow.state)
+    flow.__del__()
+
+
+def test_history():
+    """Test consumption history ring."""
+    sensor, counter = setup_meter()
+    counter.state = 100
+    history = History(counter, size=4, interval=1000)
+    assert history.seq == 0
+    assert history.read() == {
+        "seq": 0,
+        "age": 0,
+        "interval": 1000,
+        "cursor": 0,
+        "data": [],
+    }
+
+    # Setting the counter is not a consumption
+    for pulses, value in (
+        (1, None),
+        (0, None),
+        (2, None),
+        (0, 5),
+        (3, 0),
+        (7000, None),
+    ):
+        if value is not None:
+            counter.state = value
+        for x in range(pulses):
+            pulse(sensor)
+        mock_sleep_ms(1000)
+        main_loop.run_once()
+
+    mock_sleep_ms(300)
+    assert history.seq == 6
+    assert history.read() == {
+        "seq": 6,
+        "age": 300,
+        "interval": 1000,
+        "cursor": 2,
+        "data": [20, 0, 30, 65535],
+    }
+    assert history.read(4)["data"] == [30, 65535]
+    assert history.read(5, count=1) == {
+        "seq": 6,
+        "age": 300,
+        "interval": 1000,
+        "cursor": 5,
+        "data": [65535],
+    }
+    assert history.read(6)["data"] == []
+    assert history.read(1)["cursor"] == 2
+    assert history.read(7)["cursor"] == 2
+    assert history.read(2, count=2)["data"] == [20, 0]
+
+    history.__del__()
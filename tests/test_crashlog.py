@@ -0,0 +1,64 @@
+"""Test crashlog lib."""
+
+from time import sleep_ms as mock_sleep_ms
+
+from lib.crashlog import CrashLog
+from machine import WDT_RESET, reset_cause as mock_reset_cause
+
+
+def test_crashlog(tmp_path):
+    """Test writing and reading the fault records."""
+    name = str(tmp_path / "crash")
+    crashlog = CrashLog(name)
+    assert crashlog.read() == []
+
+    mock_sleep_ms(5000)
+    crashlog.record("valve", ValueError("Test " + "x" * 50))
+    crashlog.record(None, "Text")
+    records = CrashLog(name).read()
+    assert [x["seq"] for x in records] == [2, 1]
+    assert records[0]["task"] == ""
+    assert records[0]["exc"] == "Text"
+    assert records[1]["task"] == "valve"
+    assert records[1]["exc"] == ("ValueError: Test " + "x" * 50)[:48]
+    assert records[1]["mem_free"] == 12000
+    assert records[1]["uptime"] >= 5
+
+    # The writes per boot are limited
+    for x in range(CrashLog._limit):
+        crashlog.record("task", "Fault {}".format(x))
+    records = CrashLog(name).read()
+    assert records[0]["exc"] == "Fault 1"
+    assert len(records) == CrashLog._limit
+
+    # The watchdog reset is recorded on boot
+    mock_reset_cause.return_value = WDT_RESET
+    records = CrashLog(name).read()
+    mock_reset_cause.return_value = 6
+    assert records[0]["task"] == "reset"
+    assert records[0]["exc"] == "Watchdog timer reset"
+    assert records[0]["seq"] == 5
+
+    # The task that overran right before the reset is named as a hint
+    crashlog = CrashLog(name)
+    crashlog.record("history0", "Overrun 12000 ms")
+    mock_reset_cause.return_value = WDT_RESET
+    records = CrashLog(name).read()
+    mock_reset_cause.return_value = 6
+    assert records[0]["task"] == "reset"
+    assert records[0]["exc"] == "Watchdog timer reset, last overrun history0"
+
+    # The records of the earlier boots are kept
+    assert [x["seq"] for x in records] == [7, 6, 5, 4, 3, 2, 1]
+
+    # The characters split by the record size are dropped
+    crashlog = CrashLog(name)
+    crashlog.record(
+        "t\u00e9\u00e9\u00e9\u00e9\u00e9\u00e9\u00e9\u00e9", "x" * 47 + "\u00e9"
+    )
+    records = CrashLog(name).read()
+    assert records[0]["task"] == "t\u00e9\u00e9\u00e9\u00e9\u00e9\u00e9\u00e9"
+    assert records[0]["exc"] == "x" * 47
+
+    crashlog.clear()
+    assert CrashLog(name).read() == []
@@ -0,0 +1,104 @@
+"""Test the build report tool."""
+
+import os
+import shutil
+import subprocess
+import sys
+
+from tools import footprint
+
+BUNDLE = [
+    "lib/logging.mpy",
+    "lib/gcpolicy.mpy",
+    "lib/wire.mpy",
+    "lib/core.mpy",
+    "lib/mainloop.mpy",
+    "lib/xbeepin.mpy",
+    "lib/journal.mpy",
+    "lib/crashlog.mpy",
+    "valve.mpy",
+    "counter.mpy",
+    "leak.mpy",
+    "commands.mpy",
+    "config.mpy",
+    "__init__.mpy",
+]
+
+
+def test_import_order(monkeypatch):
+    """Test sorting the modules after their imports."""
+    monkeypatch.chdir("flash")
+    order = footprint.import_order(
+        [x[:-4].replace("/", ".") for x in footprint.bundle_list()]
+    )
+    assert sorted(order) == sorted(x[:-4].replace("/", ".") for x in BUNDLE)
+    assert order.index("lib.logging") < order.index("lib.mainloop")
+    assert order.index("lib.core") < order.index("valve")
+    assert order.index("config") < order.index("__init__")
+    assert order[-1] == "__init__"
+
+
+def test_footprint(tmp_path, monkeypatch):
+    """Test the imports are measured and undone."""
+    mocks = os.path.abspath("tests/modules")
+    (tmp_path / "probe.py").write_text("import time\n\nDATA = [time] * 10000\n")
+    monkeypatch.chdir(tmp_path)
+    path = sys.path[:]
+    modules = {x: sys.modules[x] for x in ("time", "gc")}
+    assert footprint.footprint(["probe"], mocks)["probe"] >= 80000
+    assert "probe" not in sys.modules
+    assert sys.path == path
+    assert all(sys.modules[x] is modules[x] for x in modules)
+
+
+def _report(path, *limits):
+    """Run the tool on the tree."""
+    return subprocess.run(
+        [sys.executable, "tools/footprint.py", "../tests/modules"]
+        + [str(x) for x in limits],
+        cwd=path / "flash",
+        stdout=subprocess.PIPE,
+        universal_newlines=True,
+    )
+
+
+def test_report(tmp_path, monkeypatch):
+    """Test the report and the budgets."""
+    shutil.copytree("flash", str(tmp_path / "flash"))
+    shutil.copytree("tests/modules", str(tmp_path / "tests/modules"))
+    monkeypatch.chdir(tmp_path / "flash")
+    bundled = footprint.bundle_list()
+    assert bundled == BUNDLE
+    result = _report(tmp_path, 0, 0, 0)
+    assert result.returncode == 1
+    assert result.stdout.startswith("Not compiled: lib/logging.mpy")
+
+    for name in bundled:
+        shutil.copy(name[:-4] + ".py", name)  # Fake compilation
+    total = sum(os.path.getsize(x) for x in bundled)
+
+    result = _report(tmp_path, 0, 0, 0)
+    assert result.returncode == 0
+    lines = result.stdout.splitlines()
+    assert lines[0].split() == ["File", "Size", "RAM"]
+    assert len(lines) == len(bundled) + 2
+    row = lines[-1].split()
+    assert row[:2] == ["Bundle", str(total)]
+    assert int(row[2]) > 0
+    assert not os.path.exists("crash0.jnl")
+
+    # The measured RAM varies a little between the runs
+    result = _report(tmp_path, total, 0, int(row[2]) * 2)
+    assert result.returncode == 0
+    assert "100% of the bundle limit used" in result.stdout
+    assert "of the RAM budget used" in result.stdout
+
+    result = _report(tmp_path, total - 1, 0, 1)
+    assert result.returncode == 1
+    lines = result.stdout.splitlines()
+    assert "Bundle size {} over the limit of {}".format(total, total - 1) in lines
+    assert any(x.startswith("Bundle RAM ") for x in lines)
+    assert not any(x.startswith("config.mpy ") for x in lines[len(bundled) + 2 :])
+
+    result = _report(tmp_path)
+    assert result.returncode == 2
@@ -0,0 +1,67 @@
+"""Test gcpolicy lib."""
+
+from gc import collect as mock_collect, mem_free as mock_mem_free
+from unittest import mock
+
+import pytest
+from lib import gcpolicy, mainloop
+
+
+@pytest.fixture(autouse=True)
+def restore_mode():
+    """Restore the policy after the test."""
+    mode, threshold = gcpolicy.get_mode()
+    yield
+    gcpolicy.set_mode(mode, threshold)
+    mock_mem_free.return_value = 12000
+
+
+def test_always():
+    """Test collection on every call."""
+    gcpolicy.set_mode(gcpolicy.ALWAYS)
+    mock_collect.reset_mock()
+    gcpolicy.collect()
+    assert mock_collect.call_count == 1
+    gcpolicy.idle()
+    assert mock_collect.call_count == 1
+
+
+def test_threshold():
+    """Test collection below the free memory watermark."""
+    gcpolicy.set_mode(gcpolicy.THRESHOLD, threshold=8000)
+    assert gcpolicy.get_mode() == (gcpolicy.THRESHOLD, 8000)
+    mock_collect.reset_mock()
+    mock_mem_free.return_value = 12000
+    gcpolicy.collect()
+    gcpolicy.idle()
+    assert mock_collect.call_count == 0
+
+    mock_mem_free.return_value = 7000
+    gcpolicy.collect()
+    assert mock_collect.call_count == 1
+
+
+def test_idle():
+    """Test collection before the loop sleeps."""
+    gcpolicy.set_mode(gcpolicy.IDLE, threshold=8000)
+    mock_collect.reset_mock()
+    gcpolicy.collect()
+    assert mock_collect.call_count == 0
+    gcpolicy.idle()
+    assert mock_collect.call_count == 1
+
+    mock_collect.reset_mock()
+    loop = mainloop.Loop()
+    callback = mock.MagicMock()
+    loop.schedule_task(callback)
+    loop.schedule_task(lambda: loop.stop(), next_run=100)
+    loop.run()
+    callback.assert_called_once_with()
+    assert mock_collect.call_count == 1
+
+
+def test_invalid_mode():
+    """Test unknown mode."""
+    with pytest.raises(ValueError) as excinfo:
+        gcpolicy.set_mode(5)
+    assert "Unknown gc mode" in str(excinfo.value)
@@ -0,0 +1,97 @@
+"""Test journal lib."""
+
+from time import sleep_ms as mock_sleep_ms
+
+from lib.core import Sensor
+from lib.journal import Journal
+from lib.mainloop import main_loop
+
+
+class Value(Sensor):
+    """Integer sensor."""
+
+    _type = int
+
+
+def test_journal(tmp_path):
+    """Test appending and loading the records."""
+    name = str(tmp_path / "test")
+    journal = Journal(name, 3)
+    assert journal.load() is None
+
+    journal.append([1, 2, 3])
+    journal.append([4, -5, 6])
+    assert Journal(name, 3).load() == [4, -5, 6]
+    assert (tmp_path / "test1.jnl").stat().st_size == 2 * 19
+
+    # Switch files after the record limit
+    for x in range(Journal._records + 1):
+        journal.append([x, 0, 0])
+    assert (tmp_path / "test0.jnl").stat().st_size == 3 * 19
+    assert Journal(name, 3).load() == [Journal._records, 0, 0]
+
+
+def test_journal_recovery(tmp_path):
+    """Test torn and corrupted records are skipped."""
+    name = str(tmp_path / "test")
+    journal = Journal(name, 2)
+    journal.append([10, 20])
+    journal.append([30, 40])
+
+    path = tmp_path / "test1.jnl"
+    data = bytearray(path.read_bytes())
+    path.write_bytes(data + data[:5])
+    journal = Journal(name, 2)
+    assert journal.load() == [30, 40]
+
+    # The torn record is cut off and the next one appended after the last
+    journal.append([35, 45])
+    assert path.stat().st_size == 3 * 15
+    assert Journal(name, 2).load() == [35, 45]
+
+    data[-3] ^= 1
+    path.write_bytes(data)
+    journal = Journal(name, 2)
+    assert journal.load() == [10, 20]
+
+    # The next record follows the corrupted one with the next sequence number
+    journal.append([50, 60])
+    assert path.stat().st_size == 3 * 15
+    assert Journal(name, 2).load() == [50, 60]
+
+    # A full file switches to the other one
+    for x in range(Journal._records - 3):
+        journal.append([x, 0])
+    assert not (tmp_path / "test0.jnl").exists()
+    journal.append([70, 80])
+    assert (tmp_path / "test0.jnl").stat().st_size == 15
+    assert Journal(name, 2).load() == [70, 80]
+
+
+def test_journal_track(tmp_path):
+    """Test sensor states are restored and saved."""
+    name = str(tmp_path / "test")
+    sensors = [Value(), Value()]
+    journal = Journal(name, 2)
+    journal.track(sensors, threshold=10, period=1000)
+    assert not journal.restored
+    assert journal.load() is None
+
+    sensors[0].state = 5
+    assert journal.load() is None
+    sensors[1].state = 10
+    assert Journal(name, 2).load() == [5, 10]
+
+    sensors[0].state = 6
+    mock_sleep_ms(1000)
+    main_loop.run_once()
+    assert Journal(name, 2).load() == [6, 10]
+
+    restored = [Value(), Value()]
+    journal2 = Journal(name, 2)
+    journal2.track(restored)
+    assert journal2.restored
+    assert [x.state for x in restored] == [6, 10]
+
+    main_loop.remove_task(journal._task)
+    main_loop.remove_task(journal2._task)
@@ -0,0 +1,105 @@
+"""The tests for the LeakDetector class."""
+
+from time import sleep_ms as mock_sleep_ms
+from unittest.mock import MagicMock
+
+from counter import Counter, FlowRate
+from leak import DURATION, RATE, LeakDetector
+from lib.core import Sensor, Switch
+from lib.mainloop import main_loop
+from valve import Valve
+
+
+def setup_leak(**kwargs):
+    """Initialize components, the counter adds 10 on every meter pulse."""
+    sensor = Switch()
+    counter = Counter(sensor, point_lo_hi=0, point_hi_lo=0)
+    flow = FlowRate(counter)
+    valve = Valve(direction_switch=Switch(), power_switch=Switch())
+    leak = LeakDetector(counter, flow, valve, **kwargs)
+    return sensor, flow, valve, leak
+
+
+def pulse(sensor):
+    """Switch the meter on and off."""
+    sensor.state = True
+    sensor.state = False
+
+
+def teardown_leak(sensor, flow, valve, leak):
+    """Cancel the tasks, the subscriptions go with the objects."""
+    main_loop.remove_task(leak._task)
+    main_loop.remove_task(flow._updates)
+    valve.stop()
+
+
+def test_leak_rate():
+    """Test the rate rule."""
+    sensor, flow, valve, leak = setup_leak(max_rate=50)
+    assert isinstance(leak, Sensor)
+    assert leak.state is None
+    callback = MagicMock()
+    leak.subscribe(callback)
+
+    # Setting the counter is not a flow
+    leak._counter.state = 100000000
+    mock_sleep_ms(6000)
+    leak._counter.state = 10
+    assert leak.state is None
+    assert leak._last is None
+
+    # 20 L/min is fine
+    for x in range(1, 4):
+        mock_sleep_ms(30000)
+        pulse(sensor)
+    assert flow.state == 20
+    assert leak.state is None
+    assert valve.is_closing.state is False
+
+    # 100 L/min trips the detector and closes the valve
+    for x in range(4, 14):
+        mock_sleep_ms(6000)
+        pulse(sensor)
+    assert leak.state == RATE
+    assert valve.is_closing.state is True
+    callback.assert_called_once_with(RATE)
+    callback.reset_mock()
+
+    # Opening the valve clears the state
+    valve.open()
+    assert leak.state is None
+    callback.assert_called_once_with(None)
+    teardown_leak(sensor, flow, valve, leak)
+
+
+def test_leak_duration():
+    """Test the continuous flow rule."""
+    sensor, flow, valve, leak = setup_leak(max_duration=600000, max_gap=120000)
+
+    # The flow stops for longer than the gap and starts over
+    for x in range(1, 8):
+        mock_sleep_ms(60000)
+        pulse(sensor)
+    mock_sleep_ms(130000)
+    main_loop.run_once()
+    assert leak._start is None
+    for x in range(8, 15):
+        mock_sleep_ms(60000)
+        pulse(sensor)
+    assert leak.state is None
+
+    # Pulses within the gap keep the flow going
+    for x in range(15, 20):
+        mock_sleep_ms(100000)
+        pulse(sensor)
+    assert leak.state == DURATION
+    assert valve.is_closing.state is True
+
+    # The rules can be disabled
+    leak.reset()
+    leak.max_duration = None
+    for x in range(20, 40):
+        mock_sleep_ms(60000)
+        pulse(sensor)
+    assert leak.state is None
+    teardown_leak(sensor, flow, valve, leak)
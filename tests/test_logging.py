@@ -1,7 +1,10 @@
 """Test logging lib."""
 
-from json import loads as json_loads
+from json import dumps as json_dumps, loads as json_loads
+from time import sleep_ms as mock_sleep_ms
+from unittest.mock import MagicMock, patch
 
+from lib.mainloop import main_loop
 from xbee import transmit as mock_transmit
 
 from flash.lib import logging
@@ -15,51 +18,57 @@ def test_logging():
 
     mock_transmit.reset_mock()
     logger.debug("Test debug message, %s", 123)
+    logger.flush(force=True)
     assert mock_transmit.call_count == 1
     assert mock_transmit.call_args[0][0] == b"\x00\x00\x00\x00\x00\x00\x00\x00"
     assert json_loads(mock_transmit.call_args[0][1]) == {
-        "log": {"sev": 10, "msg": "Test debug message, 123"}
+        "log": [{"sev": 10, "msg": "Test debug message, 123"}]
     }
 
     mock_transmit.reset_mock()
     logger.info("Test info message, %s", "123")
+    logger.flush(force=True)
     assert mock_transmit.call_count == 1
     assert mock_transmit.call_args[0][0] == b"\x00\x00\x00\x00\x00\x00\x00\x00"
     assert json_loads(mock_transmit.call_args[0][1]) == {
-        "log": {"sev": 20, "msg": "Test info message, 123"}
+        "log": [{"sev": 20, "msg": "Test info message, 123"}]
     }
 
     mock_transmit.reset_mock()
     logger.warning("Test warning message, %s", (123,))
+    logger.flush(force=True)
     assert mock_transmit.call_count == 1
     assert mock_transmit.call_args[0][0] == b"\x00\x00\x00\x00\x00\x00\x00\x00"
     assert json_loads(mock_transmit.call_args[0][1]) == {
-        "log": {"sev": 30, "msg": "Test warning message, (123,)"}
+        "log": [{"sev": 30, "msg": "Test warning message, (123,)"}]
     }
 
     mock_transmit.reset_mock()
     logger.error("Test error message, %s", {1: 23})
+    logger.flush(force=True)
     assert mock_transmit.call_count == 1
     assert mock_transmit.call_args[0][0] == b"\x00\x00\x00\x00\x00\x00\x00\x00"
     assert json_loads(mock_transmit.call_args[0][1]) == {
-        "log": {"sev": 40, "msg": "Test error message, {1: 23}"}
+        "log": [{"sev": 40, "msg": "Test error message, {1: 23}"}]
     }
 
     mock_transmit.reset_mock()
     logger.critical("Test critical message, %s, %s", True, False)
+    logger.flush(force=True)
     assert mock_transmit.call_count == 1
     assert mock_transmit.call_args[0][0] == b"\x00\x00\x00\x00\x00\x00\x00\x00"
     assert json_loads(mock_transmit.call_args[0][1]) == {
-        "log": {"sev": 50, "msg": "Test critical message, True, False"}
+        "log": [{"sev": 50, "msg": "Test critical message, True, False"}]
     }
 
     mock_transmit.reset_mock()
     logger.setTarget(b"\x01\x23\x45\x67\x89\xab\xcd\xef")
     logger.debug("Test debug message, %s", [1, 2, 3])
+    logger.flush(force=True)
     assert mock_transmit.call_count == 1
     assert mock_transmit.call_args[0][0] == b"\x01\x23\x45\x67\x89\xab\xcd\xef"
     assert json_loads(mock_transmit.call_args[0][1]) == {
-        "log": {"sev": 10, "msg": "Test debug message, [1, 2, 3]"}
+        "log": [{"sev": 10, "msg": "Test debug message, [1, 2, 3]"}]
     }
 
     logger2 = logging.getLogger("tests")
@@ -69,9 +78,136 @@ def test_logging():
     assert logger.getEffectiveLevel() == logging.DEBUG
     logger.setLevel(logging.INFO)
     assert logger.getEffectiveLevel() == logging.INFO
-    logger.debug("Test debug message")
+    assert logger.isEnabledFor(logging.INFO)
+    assert not logger.isEnabledFor(logging.DEBUG)
+    # The arguments are not formatted below the level
+    arg = MagicMock()
+    logger.debug("Test debug message %s", arg)
+    arg.__str__.assert_not_called()
+    logger.flush()
     assert mock_transmit.call_count == 0
 
     mock_transmit.side_effect = OSError("EAGAIN")
     logger.info("This message does not raise exception")
+    logger.flush()
     mock_transmit.side_effect = None
+    logger.flush(force=True)
+    assert json_loads(mock_transmit.call_args[0][1]) == {
+        "log": [{"sev": 20, "msg": "This message does not raise exception"}]
+    }
+    logger.setLevel(logging.DEBUG)
+    logger.setTarget()
+
+
+def test_logging_batch():
+    """Test packing, collapsing and the frame budget."""
+    logger = logging.Logger()
+    mock_transmit.reset_mock()
+
+    def sent():
+        """Return the log frames ignoring the tasks of other tests."""
+        return [
+            x[0][1] for x in mock_transmit.call_args_list if x[0][1][:8] == '{"log": '
+        ]
+
+    # Several records per frame, the repeated ones are counted
+    logger.info("First")
+    for x in range(3):
+        logger.error("Second")
+    logger.info("Third")
+    assert mock_transmit.call_count == 0
+    mock_sleep_ms(100)
+    main_loop.run_once()
+    assert len(sent()) == 1
+    assert json_loads(sent()[0]) == {
+        "log": [
+            {"sev": 20, "msg": "First"},
+            {"sev": 40, "msg": "Second (repeated 3 times)"},
+            {"sev": 20, "msg": "Third"},
+        ]
+    }
+
+    # The frames are limited by the payload size and the budget per second
+    mock_transmit.reset_mock()
+    for x in range(6):
+        logger.info("Message number {} {}".format(x, "x" * 80))
+    mock_sleep_ms(1000)
+    logger.flush()
+    assert len(sent()) == 2
+    assert all(len(x) <= logger._max_payload for x in sent())
+    mock_transmit.reset_mock()
+    mock_sleep_ms(1000)
+    main_loop.run_once()
+    assert len(sent()) == 1
+    assert json_loads(sent()[0])["log"][-1]["msg"][:16] == "Message number 5"
+
+    # The oldest records are dropped when the ring is full
+    mock_transmit.reset_mock()
+    for x in range(logger._size + 2):
+        logger.info("Record {}".format(x))
+    logger.info("x" * 300)
+    logger.flush(force=True)
+    records = [y for x in sent() for y in json_loads(x)["log"]]
+    assert records[0] == {"sev": 30, "msg": "3 log records dropped"}
+    assert records[1] == {"sev": 20, "msg": "Record 3"}
+    assert records[-1]["msg"][:10] == "x" * 10
+    assert all(len(x) <= logger._max_payload for x in sent())
+    assert logger._count == 0
+
+
+def test_logging_transmit_errors():
+    """Test the records that cannot be sent and the size in bytes."""
+    logger = logging.Logger()
+    mock_transmit.reset_mock()
+
+    # The records stay in the ring while the transfer buffer is full
+    logger.info("First")
+    logger.info("Second")
+    mock_transmit.side_effect = OSError("EAGAIN")
+    logger.flush()
+    assert mock_transmit.call_count == 1
+    assert logger._count == 2
+
+    # Other errors drop the oldest record
+    mock_transmit.reset_mock()
+    mock_transmit.side_effect = [ValueError("Bad frame"), None]
+    logger.flush(force=True)
+    assert mock_transmit.call_count == 2
+    assert json_loads(mock_transmit.call_args[0][1]) == {
+        "log": [
+            {"sev": 30, "msg": "1 log records dropped"},
+            {"sev": 20, "msg": "Second"},
+        ]
+    }
+    assert logger._count == 0
+    assert logger._dropped == 0
+
+    mock_transmit.reset_mock()
+    mock_transmit.side_effect = ValueError("Bad frame")
+    logger.info("Third")
+    logger.flush(force=True)
+    assert mock_transmit.call_count == 2
+    assert logger._count == 0
+    assert logger._dropped == 1
+    mock_transmit.side_effect = None
+    logger.flush(force=True)
+    assert logger._dropped == 0
+
+    # MicroPython does not escape the non-ASCII characters
+    mock_transmit.reset_mock()
+    with patch.object(
+        logging, "json_dumps", lambda x: json_dumps(x, ensure_ascii=False)
+    ):
+        logger.info("\u00e9" * 300)
+        logger.info("\u00e9" * 100)
+        logger.info("\u00e8" * 100)
+        logger.flush(force=True)
+    assert mock_transmit.call_count == 3
+    assert all(
+        len(x[0][1].encode()) <= logger._max_payload
+        for x in mock_transmit.call_args_list
+    )
+    assert logging._truncate("a\u00e9\u20ac", 6) == "a\u00e9\u20ac"
+    assert logging._truncate("a\u00e9\u20ac", 5) == "a\u00e9"
+    assert logging._truncate("a\u00e9\u20ac", 2) == "a"
+    assert logging._truncate("a\u00e9\u20ac", -1) == ""
@@ -11,7 +11,14 @@ def test_main(caplog):
         side_effect=RuntimeError("Test mainloop exception")
     )
     with mock.patch.dict("sys.modules", {"bundle": None}):
+        import config  # noqa: F401
+
+        handler = mock.MagicMock()
+        mainloop.main_loop.set_fault_handler(handler)
         import main
+    mainloop.main_loop.set_fault_handler()
+    handler.assert_called_once()
+    assert str(handler.call_args[0][1]) == "Test mainloop exception"
     main.main_loop.run.assert_called_once_with()
     assert "Test mainloop exception" in caplog.text
     assert "Mainloop exited" in caplog.text
@@ -166,3 +166,145 @@ def test_loop():
     loop.schedule_task(callback)
     assert loop.run_once() is None
     assert callback.call_count == 1
+
+
+def test_loop_order():
+    """Test that tasks are dispatched in the order of their deadlines."""
+    mock_ticks_ms.return_value = 10000
+    order = []
+    loop = mainloop.Loop()
+    tasks = {
+        delay: loop.schedule_task(
+            (lambda delay: lambda: order.append(delay))(delay), next_run=delay
+        )
+        for delay in (70, 10, 50, 30, 90, 20, 80, 60, 40)
+    }
+    assert loop.next_run == 10010
+
+    loop.remove_task(tasks[50])
+    loop.remove_task(tasks[10])
+    assert loop.next_run == 10020
+
+    mock_ticks_ms.return_value = 10065
+    assert loop.run_once() == 10070
+    assert order == [20, 30, 40, 60]
+
+    loop.schedule_task(lambda: order.append(75), next_run=10)
+    mock_ticks_ms.return_value = 10100
+    assert loop.run_once() is None
+    assert order == [20, 30, 40, 60, 70, 75, 80, 90]
+
+
+def test_loop_stats():
+    """Test loop profiling counters."""
+    mock_ticks_ms.return_value = 5000
+    loop = mainloop.Loop()
+    assert loop.stats() is None
+
+    loop.set_profiling()
+    assert loop.stats() == {"iterations": 0, "sleep": 0, "tasks": []}
+
+    loop.schedule_task(lambda: mock_sleep_ms(30), period=100, name="slow")
+    mock_ticks_ms.return_value = 5010
+    assert loop.run_once() == 5100
+    assert loop.stats() == {
+        "iterations": 1,
+        "sleep": 0,
+        "tasks": [["slow", 1, 30, 30, 10, 10]],
+    }
+
+    mock_ticks_ms.return_value = 5100
+    loop.schedule_task(lambda: loop.stop(), next_run=150)
+    assert loop.run() == 5300
+    assert loop.stats() == {
+        "iterations": 4,
+        "sleep": 90,
+        "tasks": [["slow", 3, 90, 30, 10, 10]],
+    }
+
+    loop.reset_stats()
+    assert loop.stats() == {
+        "iterations": 0,
+        "sleep": 0,
+        "tasks": [["slow", 0, 0, 0, 0, 0]],
+    }
+
+    # The running task and the tasks scheduled meanwhile are reported
+    reports = []
+
+    def report():
+        loop.schedule_task(lambda: None, next_run=500, name="added")
+        reports.append(loop.stats()["tasks"])
+
+    loop.schedule_task(report, name="report")
+    loop.run_once()
+    assert [x[0] for x in reports[0]] == ["added", "report", "slow"]
+
+    loop.set_profiling(False)
+    assert loop.stats() is None
+
+
+def test_loop_wake():
+    """Test interrupting the loop sleep."""
+    mock_ticks_ms.return_value = 8000
+    mock_sleep_ms.reset_mock()
+    loop = mainloop.Loop()
+    loop.set_wake_interval(20)
+    loop.schedule_task(lambda: loop.stop(), next_run=100)
+    assert loop.run() is None
+    assert mock_sleep_ms.call_count == 5
+    assert mock_ticks_ms.return_value == 8100
+
+    def wake():
+        loop.schedule_task(lambda: loop.stop())
+        loop.wake()
+
+    mock_sleep_ms.reset_mock()
+    side_effect = mock_sleep_ms.side_effect
+    mock_sleep_ms.side_effect = lambda t: wake()
+    loop.schedule_task(callback=mock.MagicMock(), next_run=1000)
+    assert loop.run() == 9100
+    mock_sleep_ms.assert_called_once_with(20)
+    mock_sleep_ms.side_effect = side_effect
+
+    loop.set_wake_interval()
+    loop.run_once()
+    assert not loop._wake
+
+
+def test_loop_fault():
+    """Test the exceptions are reported to the fault handler."""
+    handler = mock.MagicMock()
+    loop = mainloop.main_loop
+    loop.set_fault_handler(handler)
+
+    error = ValueError("Test")
+    task = loop.schedule_task(mock.MagicMock(side_effect=error), name="failing")
+    loop.run_once()
+    handler.assert_called_once_with("failing", error)
+    assert task.next_run is None
+
+    # The exception escaping the loop names the running task
+    handler.reset_mock()
+    loop.schedule_task(mock.MagicMock(side_effect=KeyboardInterrupt), name="stuck")
+    with pytest.raises(KeyboardInterrupt) as excinfo:
+        loop.run_once()
+    loop.fault(excinfo.value)
+    handler.assert_called_once_with("stuck", excinfo.value)
+
+    # The tasks running too long are reported
+    handler.reset_mock()
+    loop.set_fault_handler(handler, overrun=1000)
+    loop.schedule_task(lambda: mock_sleep_ms(1000), name="long")
+    loop.run_once()
+    handler.assert_not_called()
+    loop.schedule_task(lambda: mock_sleep_ms(1001), name="longer")
+    loop.run_once()
+    handler.assert_called_once_with("longer", "Overrun 1001 ms")
+
+    # The handler errors are only logged
+    handler.side_effect = OSError("Test")
+    loop.fault(error)
+    loop.set_fault_handler()
+    loop.fault(error)
+    assert handler.call_count == 2
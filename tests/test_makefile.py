@@ -17,3 +17,17 @@ def test_make():
         os.system(f"cp -r flash/* {tmpdir}")
         assert os.system(f"make -C {tmpdir}") == 0
         assert os.system(f"make -C {tmpdir} clean") == 0
+
+
+def test_make_release():
+    """Test compilation with the debug logs stripped and the build report."""
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        os.system(f"mkdir {tmpdir}/tests && cp -r tests/modules {tmpdir}/tests")
+        os.system(f"cp -r flash {tmpdir}")
+        assert os.system(f"make -C {tmpdir}/flash release") == 0
+        assert os.path.isfile(f"{tmpdir}/flash/valve.mpy")
+        assert os.path.isfile(f"{tmpdir}/flash/lib/core.mpy")
+        assert os.system(f"make -C {tmpdir}/flash report RAM_LIMIT=1") != 0
+        assert os.system(f"make -C {tmpdir}/flash clean") == 0
+        assert not os.path.exists(f"{tmpdir}/flash/.build")
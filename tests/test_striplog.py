@@ -0,0 +1,52 @@
+"""Test the log stripping tool."""
+
+from tools import striplog
+
+SOURCE = '''"""Module."""
+
+_LOGGER.debug("Started")
+
+
+def func(x):
+    """Do something."""
+    if x:
+        _LOGGER.info(
+            "Value %s",
+            x,  # The value
+        )
+    else:
+        _LOGGER.warning("No value")
+    result = _LOGGER.debug("Used")
+    call(lambda: _LOGGER.debug("In lambda"))
+    _LOGGER.error("Failed: %s", (x, [x]))
+    return result
+'''
+
+
+def test_strip():
+    """Test removing the logger calls below the level."""
+    lines = SOURCE.splitlines(True)
+    stripped = striplog.strip(lines, striplog.LEVELS["warning"])
+    assert len(stripped) == len(lines)
+    assert "".join(stripped) == SOURCE.replace(
+        '_LOGGER.debug("Started")', "pass"
+    ).replace(
+        """_LOGGER.info(
+            "Value %s",
+            x,  # The value
+        )""",
+        "pass\n\n\n",
+    )
+    compile("".join(stripped), "test", "exec")
+
+    assert striplog.strip(lines, striplog.LEVELS["debug"]) == lines
+
+
+def test_main(tmp_path):
+    """Test the command line."""
+    source = tmp_path / "source.py"
+    output = tmp_path / "output.py"
+    source.write_text(SOURCE)
+    assert striplog.main(["striplog.py", "50", str(source), str(output)]) == 0
+    assert "_LOGGER" not in output.read_text().replace("_LOGGER.debug", "")
+    assert striplog.main(["striplog.py"]) == 2
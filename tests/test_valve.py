@@ -1,6 +1,6 @@
 """The tests for the Valve class."""
 
-from time import sleep as mock_sleep
+from time import sleep as mock_sleep, sleep_ms as mock_sleep_ms
 from unittest.mock import MagicMock
 
 import pytest
@@ -18,7 +18,7 @@ def setup_valve():
         direction_switch=direction_switch,
         power_switch=power_switch,
         operation_time=4,
-        discretization=25,
+        milestones=(25, 50, 75),
     )
     return direction_switch, power_switch, valve
 
@@ -51,7 +51,7 @@ def test_valve_open(setup_valve):
     assert power_switch.state is True
     assert valve.is_opening.state is True
     assert valve.is_closing.state is False
-    assert valve.state is None
+    assert valve.state == 0
     callback.assert_not_called()
 
     mock_sleep(1)
@@ -116,7 +116,7 @@ def test_valve_close(setup_valve):
     assert power_switch.state is True
     assert valve.is_opening.state is False
     assert valve.is_closing.state is True
-    assert valve.state is None
+    assert valve.state == 100
     callback.assert_not_called()
 
     mock_sleep(1)
@@ -181,7 +181,7 @@ def test_valve_close_open(setup_valve):
     assert power_switch.state is True
     assert valve.is_opening.state is False
     assert valve.is_closing.state is True
-    assert valve.state is None
+    assert valve.state == 100
     callback.assert_not_called()
 
     mock_sleep(1)
@@ -195,17 +195,18 @@ def test_valve_close_open(setup_valve):
     callback.assert_called_once_with(75)
 
     callback.reset_mock()
+    mock_sleep_ms(500)
     valve.open()
 
     assert direction_switch.state is True
     assert power_switch.state is True
     assert valve.is_opening.state is True
     assert valve.is_closing.state is False
-    assert valve.state == 50
-    callback.assert_called_once_with(50)
+    assert valve.state == 63
+    callback.assert_called_once_with(63)
 
     callback.reset_mock()
-    mock_sleep(1)
+    mock_sleep_ms(480)
     main_loop.run_once()
 
     assert direction_switch.state is True
@@ -241,7 +242,7 @@ def test_valve_open_close(setup_valve):
     assert power_switch.state is True
     assert valve.is_opening.state is True
     assert valve.is_closing.state is False
-    assert valve.state is None
+    assert valve.state == 0
     callback.assert_not_called()
 
     mock_sleep(1)
@@ -255,17 +256,18 @@ def test_valve_open_close(setup_valve):
     callback.assert_called_once_with(25)
 
     callback.reset_mock()
+    mock_sleep_ms(500)
     valve.close()
 
     assert direction_switch.state is False
     assert power_switch.state is True
     assert valve.is_opening.state is False
     assert valve.is_closing.state is True
-    assert valve.state == 50
-    callback.assert_called_once_with(50)
+    assert valve.state == 37
+    callback.assert_called_once_with(37)
 
     callback.reset_mock()
-    mock_sleep(1)
+    mock_sleep_ms(480)
     main_loop.run_once()
 
     assert direction_switch.state is False
@@ -301,7 +303,7 @@ def test_valve_open_stop(setup_valve):
     assert power_switch.state is True
     assert valve.is_opening.state is True
     assert valve.is_closing.state is False
-    assert valve.state is None
+    assert valve.state == 0
     callback.assert_not_called()
 
     mock_sleep(1)
@@ -340,7 +342,7 @@ def test_valve_close_stop(setup_valve):
     assert power_switch.state is True
     assert valve.is_opening.state is False
     assert valve.is_closing.state is True
-    assert valve.state is None
+    assert valve.state == 100
     callback.assert_not_called()
 
     mock_sleep(1)
@@ -363,3 +365,115 @@ def test_valve_close_stop(setup_valve):
     assert valve.is_closing.state is False
     assert valve.state == 75
     callback.assert_not_called()
+
+
+def test_valve_interpolation():
+    """Test the position between the milestones."""
+    valve = Valve(direction_switch=Switch(), power_switch=Switch(), operation_time=4)
+    callback = MagicMock()
+    valve.subscribe(callback)
+    valve.state = 20
+    callback.reset_mock()
+
+    valve.open()
+    mock_sleep_ms(1000)
+    main_loop.run_once()
+    assert valve.state == 45
+    callback.assert_not_called()
+
+    # Calibrating the position while moving restarts the travel
+    valve.state = 80
+    callback.assert_called_once_with(80)
+    callback.reset_mock()
+    mock_sleep_ms(400)
+    assert valve.state == 90
+    mock_sleep_ms(399)
+    main_loop.run_once()
+    assert valve.is_opening.state is True
+    mock_sleep_ms(1)
+    main_loop.run_once()
+    assert valve.is_opening.state is False
+    assert valve.state == 100
+    callback.assert_called_once_with(100)
+
+
+def test_valve_set_position():
+    """Test moving the valve to a position with asymmetric travel times."""
+    direction_switch = Switch()
+    power_switch = Switch()
+    valve = Valve(
+        direction_switch=direction_switch,
+        power_switch=power_switch,
+        operation_time=4,
+        closing_time=2,
+    )
+    with pytest.raises(ValueError):
+        valve.set_position(50)
+    assert power_switch.state is False
+
+    valve.state = 0
+    callback = MagicMock()
+    valve.subscribe(callback)
+
+    # Opening takes 40 ms per percent
+    valve.set_position(30)
+    assert direction_switch.state is True
+    assert power_switch.state is True
+    assert valve.is_opening.state is True
+    mock_sleep_ms(1199)
+    main_loop.run_once()
+    assert valve.is_opening.state is True
+    mock_sleep_ms(1)
+    main_loop.run_once()
+    assert power_switch.state is False
+    assert valve.is_opening.state is False
+    assert valve.state == 30
+    callback.assert_called_once_with(30)
+    callback.reset_mock()
+
+    # Closing takes 20 ms per percent
+    valve.set_position(20)
+    assert direction_switch.state is False
+    assert valve.is_closing.state is True
+    mock_sleep_ms(200)
+    main_loop.run_once()
+    assert valve.is_closing.state is False
+    assert valve.state == 20
+    callback.assert_called_once_with(20)
+
+    # A new target in the same direction keeps the motor running
+    valve.set_position(60)
+    mock_sleep_ms(400)
+    valve.set_position(40)
+    assert valve.state == 30
+    assert valve.is_opening.state is True
+    mock_sleep_ms(400)
+    main_loop.run_once()
+    assert valve.state == 40
+    assert valve.is_opening.state is False
+
+    # A late timer stops at the target
+    valve.set_position(70)
+    mock_sleep_ms(1500)
+    main_loop.run_once()
+    assert valve.state == 70
+    assert power_switch.state is False
+    assert valve.is_opening.state is False
+    assert valve._operate_task is None
+    valve.set_position(50)
+    mock_sleep_ms(900)
+    main_loop.run_once()
+    assert valve.state == 50
+    assert power_switch.state is False
+    assert valve._operate_task is None
+
+    # The end positions run to the end stops
+    valve.set_position(100)
+    assert valve._target is None
+    mock_sleep_ms(2400)
+    main_loop.run_once()
+    assert valve.state == 100
+    valve.set_position(100)
+    main_loop.run_once()
+    assert valve.state == 100
+    assert valve.is_opening.state is False
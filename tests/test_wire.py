@@ -0,0 +1,82 @@
+"""Test wire lib."""
+
+from json import dumps as json_dumps
+
+import pytest
+from lib import wire
+
+
+@pytest.mark.parametrize(
+    "value",
+    [
+        None,
+        True,
+        False,
+        0,
+        255,
+        256,
+        -1,
+        -0x80000000,
+        0x7FFFFFFF,
+        0x100000000,
+        -0.5,
+        1024.125,
+        "",
+        "test",
+        [],
+        [1, [2, None], {"a": "b"}],
+        {"state": 100, "is_opening": False, "is_closing": True},
+    ],
+)
+def test_roundtrip(value):
+    """Test encoding and decoding of the values."""
+    assert wire.decode(bytes(wire.encode(12, 0xABCD, value))) == (12, 0xABCD, value)
+
+
+def test_sizes():
+    """Test the frames are compact."""
+    assert bytes(wire.encode(3, 1, None)) == b"\xfb\x03\x01\x00\x00"
+    assert len(wire.encode(3, 1, [0])) == 8
+    assert len(wire.encode(3, 1, 12345)) == 9
+    assert wire.decode(b"\xfb\x03\x01\x00") == (3, 1, None)
+
+
+def test_notification():
+    """Test notification frames."""
+    frame = wire.notification(
+        [wire.pack_item("counter_0", 12345), wire.pack_item("opening_1", True)]
+    )
+    assert len(frame) == 14
+    assert len(json_dumps({"counter_0": 12345, "opening_1": True})) == 39
+    assert wire.decode(bytes(frame)) == (
+        wire.NOTIFY,
+        0,
+        {"counter_0": 12345, "opening_1": True},
+    )
+
+    # The names out of the key table are sent as strings
+    frame = wire.notification(
+        [
+            wire.pack_item("uptime", 1.5),
+            wire.pack_item("counter_9", 1),
+            wire.pack_item("other", 2),
+        ]
+    )
+    assert len(frame) == 34
+    assert wire.decode(bytes(frame))[2] == {"uptime": 1.5, "counter_9": 1, "other": 2}
+
+
+def test_errors():
+    """Test invalid values and frames."""
+    with pytest.raises(TypeError):
+        wire.encode(0, 0, object())
+    with pytest.raises(ValueError, match="string too long"):
+        wire.encode(0, 0, "x" * 256)
+    with pytest.raises(ValueError, match="list too long"):
+        wire.encode(0, 0, [0] * 256)
+    with pytest.raises(ValueError, match="invalid frame"):
+        wire.decode(b'{"cmd": "help"}')
+    with pytest.raises(ValueError, match="invalid frame"):
+        wire.decode(b"\xfb\x00")
+    with pytest.raises(ValueError, match="unknown type"):
+        wire.decode(b"\xfb\x00\x00\x00\x20")
@@ -162,3 +162,195 @@ def test_analog_input():
     callback.assert_called_once_with(19)
     assert sensor.state == 19
     sensor._pin.read.assert_called_once_with()
+
+
+def test_pulse_input():
+    """Test PulseInput class."""
+    main_loop.reset()
+    mock_Pin.init.reset_mock()
+    mock_Pin.irq.reset_mock()
+    mock_Pin.value.return_value = False
+
+    sensor = xbeepin.PulseInput("D0")
+    mock_Pin.init.assert_called_once_with("D0", mock_Pin.IN, mock_Pin.PULL_UP)
+    mock_Pin.irq.assert_called_once_with(
+        handler=sensor._handler, trigger=mock_Pin.IRQ_RISING | mock_Pin.IRQ_FALLING
+    )
+    assert sensor.state == 0
+    assert sensor.level is False
+
+    callback = mock.MagicMock()
+    sensor.subscribe(callback)
+
+    # Test that edges are only folded by the periodic update
+    for _ in range(3):
+        sensor._irq(sensor._pin)
+    mock_Pin.value.return_value = True
+    main_loop.run_once()
+    assert callback.call_count == 0
+
+    sleep_ms(1000)
+    main_loop.run_once()
+    callback.assert_called_once_with(3)
+    assert sensor.level is True
+
+    # Test the counter wraparound
+    callback.reset_mock()
+    sensor._edges[0] = 0xFFFF
+    sensor._last_edges = 0xFFFF
+    sensor._irq(sensor._pin)
+    sensor._irq(sensor._pin)
+    assert sensor._edges[0] == 1
+    sleep_ms(1000)
+    main_loop.run_once()
+    callback.assert_called_once_with(5)
+
+    # Test no callback without new edges
+    callback.reset_mock()
+    sleep_ms(1000)
+    main_loop.run_once()
+    assert callback.call_count == 0
+
+    mock_Pin.irq.reset_mock()
+    sensor.__del__()
+    mock_Pin.irq.assert_called_once_with(handler=None)
+    mock_Pin.value.return_value = False
+
+
+def test_debounced_input():
+    """Test DebouncedInput class."""
+    main_loop.reset()
+    mock_Pin.value.return_value = False
+
+    sensor = xbeepin.DebouncedInput("D0", rise_time=100, fall_time=40)
+    assert sensor.state is False
+    callback = mock.MagicMock()
+    sensor.subscribe(callback)
+
+    # Test that a short glitch is ignored, polled fast while pending only
+    mock_Pin.value.return_value = True
+    sleep_ms(500)
+    main_loop.run_once()
+    assert sensor._fast.next_run is not None
+    for _ in range(3):
+        sleep_ms(20)
+        main_loop.run_once()
+    mock_Pin.value.return_value = False
+    sleep_ms(20)
+    main_loop.run_once()
+    assert sensor._fast.next_run is None
+    assert callback.call_count == 0
+
+    # Test the rise after the stable time
+    mock_Pin.value.return_value = True
+    sleep_ms(500)
+    main_loop.run_once()
+    for _ in range(4):
+        sleep_ms(20)
+        main_loop.run_once()
+    assert callback.call_count == 0
+    sleep_ms(20)
+    main_loop.run_once()
+    callback.assert_called_once_with(True)
+    assert sensor._fast.next_run is None
+
+    # Test the separate fall time
+    callback.reset_mock()
+    mock_Pin.value.return_value = False
+    sleep_ms(500)
+    main_loop.run_once()
+    for _ in range(2):
+        sleep_ms(20)
+        main_loop.run_once()
+    callback.assert_called_once_with(False)
+    mock_Pin.value.return_value = False
+    sensor.__del__()
+
+
+def test_debounced_input_integrator():
+    """Test DebouncedInput class with the integrator filter."""
+    main_loop.reset()
+    mock_Pin.value.return_value = False
+
+    sensor = xbeepin.DebouncedInput(
+        "D0", rise_time=100, integrator=True, fast_period=10
+    )
+    callback = mock.MagicMock()
+    sensor.subscribe(callback)
+
+    # Test that glitches only delay the rise
+    mock_Pin.value.return_value = True
+    sleep_ms(500)
+    main_loop.run_once()
+    for value in (True,) * 5 + (False,):
+        mock_Pin.value.return_value = value
+        sleep_ms(10)
+        main_loop.run_once()
+    assert sensor._fast.next_run is None
+    mock_Pin.value.return_value = True
+    sleep_ms(500)
+    main_loop.run_once()
+    for _ in range(4):
+        sleep_ms(10)
+        main_loop.run_once()
+    assert callback.call_count == 0
+    sleep_ms(10)
+    main_loop.run_once()
+    callback.assert_called_once_with(True)
+
+    # Test the fall from the saturated level
+    callback.reset_mock()
+    mock_Pin.value.return_value = False
+    sleep_ms(500)
+    main_loop.run_once()
+    for _ in range(9):
+        sleep_ms(10)
+        main_loop.run_once()
+    assert callback.call_count == 0
+    sleep_ms(10)
+    main_loop.run_once()
+    callback.assert_called_once_with(False)
+    sensor.__del__()
+
+    # Test immediate switch without the filter
+    sensor = xbeepin.DebouncedInput("D0", rise_time=0, integrator=True)
+    mock_Pin.value.return_value = True
+    sensor.update()
+    assert sensor.state is True
+    mock_Pin.value.return_value = False
+    sensor.update()
+    assert sensor.state is False
+
+
+def test_pulse_input_bounce():
+    """Test PulseInput contact bounce filter."""
+    main_loop.reset()
+    mock_Pin.value.return_value = False
+
+    sensor = xbeepin.PulseInput("D0", rise_time=50, fall_time=20)
+    sleep_ms(100)
+
+    # Rising edge followed by bounce
+    for value in (True, False, True, False, True):
+        mock_Pin.value.return_value = value
+        sensor._irq(sensor._pin)
+        sleep_ms(10)
+    assert sensor._edges[0] == 1
+
+    # Falling edge after the lockout, bounce shorter than the fall time
+    sleep_ms(10)
+    for value in (False, True, False):
+        mock_Pin.value.return_value = value
+        sensor._irq(sensor._pin)
+        sleep_ms(5)
+    assert sensor._edges[0] == 2
+
+    sleep_ms(20)
+    mock_Pin.value.return_value = True
+    sensor._irq(sensor._pin)
+    assert sensor._edges[0] == 3
+
+    sensor.update()
+    assert sensor.state == 3
+    assert sensor.level is True
+    mock_Pin.value.return_value = False
@@ -8,6 +8,7 @@ import pytest
 from homeassistant.core import callback
 from pytest_homeassistant_custom_component.common import MockConfigEntry
 
+from custom_components.xbee_watercounter import wire
 from custom_components.xbee_watercounter.const import DOMAIN
 
 from .const import MOCK_CONFIG
@@ -80,6 +81,68 @@ def _cmd_handler(cmd, args=_NO_ARGS):
     return "OK"
 
 
+def _snapshot_handler(args=_NO_ARGS):
+    if isinstance(args, dict) and args.get("bind"):
+        if "bind" not in commands:
+            commands["bind"] = MagicMock(return_value="OK")
+        commands["bind"]()
+
+    snapshot = {
+        "up": commands["uptime"].return_value,
+        "rc": commands["reset_cause"].return_value,
+        "c": [],
+        "v": [],
+        "m": [],
+        "f": [cached_values.get("flow", {}).get(number, 0) for number in range(3)],
+        "l": [cached_values.get("leak", {}).get(number) for number in range(3)],
+        "j": commands["journal"].return_value,
+        "h": cached_values.get("history_seq"),
+    }
+    for number in range(3):
+        snapshot["c"].append(
+            cached_values.get("counter", {}).get(
+                number, commands["counter"].return_value
+            )
+        )
+        valve = cached_values.get("valve", {}).get(
+            number, commands["valve"].return_value
+        )
+        if not isinstance(valve, dict):
+            valve = {"state": valve, "is_opening": False, "is_closing": False}
+        snapshot["v"].append(valve["state"])
+        snapshot["m"].append(
+            1 if valve["is_opening"] else -1 if valve["is_closing"] else 0
+        )
+    return snapshot
+
+
+# Binary command codes of the device firmware
+wire_commands = [
+    "atcmd",
+    "bind",
+    "close",
+    "counter",
+    "crashlog",
+    "help",
+    "history",
+    "journal",
+    "leak",
+    "logger",
+    "open",
+    "position",
+    "reset_cause",
+    "snapshot",
+    "soft_reset",
+    "stats",
+    "stop",
+    "test",
+    "unbind",
+    "unique_id",
+    "uptime",
+    "valve",
+    "wire",
+]
+
 commands = {
     "valve": MagicMock(side_effect=partial(_cmd_handler, "valve")),
     "open": MagicMock(side_effect=partial(_cmd_handler, "open")),
@@ -89,6 +152,10 @@ commands = {
     "atcmd": MagicMock(),
     "uptime": MagicMock(side_effect=partial(_cmd_handler, "uptime")),
     "reset_cause": MagicMock(),
+    "snapshot": MagicMock(side_effect=_snapshot_handler),
+    "wire": MagicMock(),
+    "journal": MagicMock(),
+    "history": MagicMock(),
 }
 
 
@@ -117,6 +184,10 @@ def data_from_device_fixture(hass):
     commands["counter"].return_value = 1234
     commands["uptime"].return_value = -10
     commands["reset_cause"].return_value = 6
+    commands["wire"].return_value = wire_commands
+    commands["journal"].return_value = False
+    commands["history"].return_value = None
+    commands["history"].side_effect = None
 
     def data_from_device(hass, ieee, data):
         """Simulate receiving data from device."""
@@ -129,23 +200,61 @@ def data_from_device_fixture(hass):
                 "endpoint_id": 232,
                 "cluster_id": 8,
                 "command": "receive_data",
-                "args": {"data": json.dumps(data)},
+                "args": {
+                    "data": (
+                        data.decode("latin1")
+                        if isinstance(data, bytes)
+                        else json.dumps(data)
+                    )
+                },
             },
         )
 
+    def run_command(data):
+        """Run a single command."""
+        cmd = data["cmd"]
+        if cmd not in commands:
+            commands[cmd] = MagicMock(return_value="OK")
+        if "args" in data:
+            return commands[cmd](data["args"])
+        return commands[cmd]()
+
+    def run_batch(items):
+        """Run the batch items while the results fit in one frame."""
+        results = []
+        too_large = {"err": "Response too large"}
+        for item in items:
+            if (
+                len(json.dumps({"batch_resp": results + [too_large], "id": 65535}))
+                > 255
+            ):
+                break
+            results.append(run_command(item))
+            if len(json.dumps({"batch_resp": results, "id": 65535})) > 255:
+                results[-1] = too_large
+        return results
+
     @callback
     def log_call(call):
         """Log service calls."""
         calls.append(call)
+        raw = call.data["params"]["data"].encode("latin1")
+        if wire.is_binary(raw):
+            code, request_id, args = wire.decode(raw)
+            data = {"cmd": wire_commands[code]}
+            if args is not None:
+                data["args"] = args
+            response = wire.encode(code, request_id, run_command(data))
+            data_from_device(hass, call.data["ieee"], response)
+            return
         data = json.loads(call.data["params"]["data"])
-        cmd = data["cmd"]
-        if cmd not in commands:
-            commands[cmd] = MagicMock(return_value="OK")
-        if "args" in data:
-            response = commands[cmd](data["args"])
+        if "batch" in data:
+            response = {"batch_resp": run_batch(data["batch"])}
         else:
-            response = commands[cmd]()
-        data_from_device(hass, call.data["ieee"], {cmd + "_resp": response})
+            response = {data["cmd"] + "_resp": run_command(data)}
+        if "id" in data:
+            response["id"] = data["id"]
+        data_from_device(hass, call.data["ieee"], response)
 
     hass.services.async_register("zha", "issue_zigbee_cluster_command", log_call)
 
@@ -3,15 +3,31 @@
 import asyncio
 import json
 import threading
-from unittest.mock import AsyncMock, patch
+from unittest.mock import AsyncMock, MagicMock, call, patch
 
 import pytest
+from homeassistant.components.recorder import get_instance
+from homeassistant.components.recorder.statistics import statistics_during_period
 from homeassistant.core import callback
 from homeassistant.exceptions import ServiceNotFound
+from homeassistant.util import dt as dt_util
+from pytest_homeassistant_custom_component.components.recorder.common import (
+    async_wait_recording_done,
+)
+
+from custom_components.xbee_watercounter import wire
+from custom_components.xbee_watercounter.coordinator import (
+    HISTORY_BACKLOG,
+    XBeeWatercounterApiClient,
+)
+
+from .conftest import cached_values, calls, commands, wire_commands
+from .const import IEEE
 
-from custom_components.xbee_watercounter.coordinator import XBeeWatercounterApiClient
 
-from .const import IEEE
+@pytest.fixture
+async def mock_recorder_before_hass(async_test_recorder):
+    """Prepare the recorder database before the hass fixture."""
 
 
 def test_double_start(hass):
@@ -191,3 +207,282 @@ async def test_service_call_exception(hass):
 
     with pytest.raises(ServiceNotFound, match="service_not_found"):
         await client.async_command("bind")
+
+
+async def test_request_id(hass):
+    """Test matching responses to concurrent identical commands."""
+
+    def data_from_device(hass, ieee, data):
+        """Simulate receiving data from device."""
+        hass.bus.async_fire(
+            "zha_event",
+            {
+                "device_ieee": ieee,
+                "unique_id": ieee + ":232:0x0008",
+                "device_id": "abcdef01234567899876543210fedcba",
+                "endpoint_id": 232,
+                "cluster_id": 8,
+                "command": "receive_data",
+                "args": {"data": json.dumps(data)},
+            },
+        )
+
+    requests = []
+
+    @callback
+    def receive(call):
+        requests.append(json.loads(call.data["params"]["data"]))
+
+    hass.services.async_register("zha", "issue_zigbee_cluster_command", receive)
+
+    client = XBeeWatercounterApiClient(hass, IEEE)
+
+    tasks = [
+        asyncio.create_task(client.async_command("counter", number))
+        for number in range(3)
+    ]
+    while len(requests) < 3:
+        await asyncio.sleep(0)
+    assert [request["args"] for request in requests] == [0, 1, 2]
+    assert len({request["id"] for request in requests}) == 3
+
+    # Responses out of order are matched by the id
+    for request, value in zip(reversed(requests), (12, 11, 10)):
+        data_from_device(hass, IEEE, {"counter_resp": value, "id": request["id"]})
+    # Unknown id is ignored
+    data_from_device(hass, IEEE, {"counter_resp": 99, "id": 1234})
+    assert await asyncio.gather(*tasks) == [10, 11, 12]
+
+    # Responses without the id are matched in order
+    requests.clear()
+    tasks = [
+        asyncio.create_task(client.async_command("counter", number))
+        for number in range(2)
+    ]
+    while len(requests) < 2:
+        await asyncio.sleep(0)
+    data_from_device(hass, IEEE, {"counter_resp": 20})
+    data_from_device(hass, IEEE, {"counter_resp": 21})
+    assert await asyncio.gather(*tasks) == [20, 21]
+    assert client._awaiting == {}
+
+    hass.services.async_remove("zha", "issue_zigbee_cluster_command")
+
+
+async def test_batch(hass, data_from_device):
+    """Test batched commands."""
+
+    client = XBeeWatercounterApiClient(hass, IEEE)
+    calls.clear()
+
+    assert await client.async_batch([("open", 0), ("close", 1), ("stop", 2)]) == [
+        "OK",
+        "OK",
+        "OK",
+    ]
+    assert len(calls) == 1
+    assert json.loads(calls[0].data["params"]["data"])["batch"] == [
+        {"cmd": "open", "args": 0},
+        {"cmd": "close", "args": 1},
+        {"cmd": "stop", "args": 2},
+    ]
+    commands["open"].assert_called_once_with(0)
+    commands["close"].assert_called_once_with(1)
+    commands["stop"].assert_called_once_with(2)
+
+    # Commands above the payload limit are split into several frames
+    calls.clear()
+    assert await client.async_batch([("counter", n % 3, 1000 + n) for n in range(20)])
+    assert len(calls) > 1
+    assert all(len(call.data["params"]["data"]) <= 255 for call in calls)
+    assert [
+        item["args"]
+        for call in calls
+        for item in json.loads(call.data["params"]["data"])["batch"]
+    ] == [[n % 3, 1000 + n] for n in range(20)]
+
+    # The items not run because the response frame is full are sent again
+    calls.clear()
+    commands["big"] = MagicMock(return_value="x" * 100)
+    assert await client.async_batch([("big",)] * 3) == ["x" * 100] * 3
+    assert len(calls) == 2
+    assert commands["big"].call_count == 3
+    del commands["big"]
+
+    # Errors in batched commands
+    commands["do_magic"] = MagicMock(return_value={"err": "Test error"})
+    with pytest.raises(RuntimeError, match="Command response: Test error"):
+        await client.async_batch([("open", 0), ("do_magic",)])
+    result = await client.async_batch(
+        [("do_magic",), ("open", 0)], return_exceptions=True
+    )
+    assert isinstance(result[0], RuntimeError)
+    assert result[1] == "OK"
+    del commands["do_magic"]
+
+
+async def test_binary_wire(hass, data_from_device):
+    """Test the binary wire protocol."""
+
+    client = XBeeWatercounterApiClient(hass, IEEE)
+    calls.clear()
+
+    await client.async_set_wire()
+    commands["wire"].assert_called_once_with("binary")
+    assert json.loads(calls[0].data["params"]["data"])["cmd"] == "wire"
+
+    assert await client.async_command("counter", 1) == 1234
+    assert await client.async_command("valve", 2, 50) == "OK"
+    assert await client.async_command("snapshot", bind=True)
+    assert len(calls) == 4
+    frames = [call.data["params"]["data"].encode("latin1") for call in calls[1:]]
+    assert all(wire.is_binary(frame) for frame in frames)
+    assert wire.decode(frames[0])[::2] == (wire_commands.index("counter"), 1)
+    assert wire.decode(frames[1])[::2] == (wire_commands.index("valve"), [2, 50])
+    assert wire.decode(frames[2])[::2] == (
+        wire_commands.index("snapshot"),
+        {"bind": True},
+    )
+    commands["counter"].assert_called_once_with(1)
+    commands["valve"].assert_called_once_with([2, 50])
+
+    # Binary and JSON notifications are both accepted
+    listener = AsyncMock()
+    client.add_subscriber("counter_0", listener)
+    data_from_device(
+        hass, IEEE, wire.encode(wire.NOTIFY, 0, {"counter_0": 100, "opening_1": True})
+    )
+    data_from_device(hass, IEEE, {"counter_0": 101})
+    # One-byte keys: counter_0, flow_2 and a name out of the key table
+    data_from_device(
+        hass,
+        IEEE,
+        b"\xfb\xff\x00\x00\x0b\x03\x11\x03\x66\x33\x0a\x00\x00\xc0\x3f"
+        b"\xff\x05other\x00",
+    )
+    await hass.async_block_till_done()
+    assert listener.await_args_list == [call(100), call(101), call(102)]
+    assert client._decode(
+        "\xfb\xff\x00\x00\x0b\x02\x33\x0a\x00\x00\xc0\x3f\xff\x05other\x00"
+    ) == ({"flow_2": 1.5, "other": None}, None)
+
+    # Errors
+    commands["do_magic"] = MagicMock(return_value={"err": "Test error"})
+    wire_commands.append("do_magic")
+    await client.async_set_wire()
+    with pytest.raises(RuntimeError, match="Command response: Test error"):
+        await client.async_command("do_magic", retry_count=1)
+    wire_commands.remove("do_magic")
+    del commands["do_magic"]
+    with pytest.raises(ValueError, match="Unknown command code 200"):
+        await client._async_data_received(wire.encode(200, 0).decode("latin1"))
+
+    # Back to JSON
+    await client.async_set_wire(binary=False)
+    commands["wire"].assert_called_with("json")
+    calls.clear()
+    assert await client.async_command("counter", 1) == 1234
+    assert json.loads(calls[0].data["params"]["data"]) == {
+        "cmd": "counter",
+        "args": 1,
+        "id": client._next_id - 1,
+    }
+
+    # Firmware without the binary protocol
+    commands["wire"].return_value = {"err": "AttributeError: No such command"}
+    with pytest.raises(RuntimeError):
+        await client.async_set_wire()
+    assert client._wire_codes is None
+
+
+async def test_history_backfill(
+    recorder_mock, hass, data_from_device, test_config_entry
+):
+    """Test the consumption history import into the statistics."""
+
+    now = dt_util.utcnow().timestamp()
+    # 5 minute intervals ending now, the first one starting 2 hours ago
+    history = {"seq": 24, "age": 0, "interval": 300000, "data": list(range(24))}
+
+    def history_handler(args):
+        number, cursor = args
+        cursor = 0 if cursor is None else cursor
+        if number:
+            return {**history, "cursor": 24, "data": []}
+        return {**history, "cursor": cursor, "data": history["data"][cursor:][:16]}
+
+    commands["history"].side_effect = history_handler
+    cached_values["history_seq"] = 24
+    coordinator = hass.data["xbee_watercounter"][test_config_entry.entry_id]
+    with patch(
+        "custom_components.xbee_watercounter.coordinator.dt_util.utcnow",
+        return_value=dt_util.utc_from_timestamp(now),
+    ):
+        # One chunk per refresh, an hour is imported once downloaded entirely
+        await coordinator.async_refresh()
+        assert coordinator._history_cursor == {0: 16, 1: 24, 2: 24}
+        await async_wait_recording_done(hass)
+        # The rest comes on the turn of the counter, less than the backlog
+        for _ in range(3):
+            await coordinator.async_refresh()
+    await async_wait_recording_done(hass)
+
+    assert [x[0][0] for x in commands["history"].call_args_list] == [
+        [0, None],
+        [1, None],
+        [2, None],
+        [0, 16],
+    ]
+    assert coordinator._history_cursor == {0: 24, 1: 24, 2: 24}
+
+    statistic_id = "xbee_watercounter:ok_counter_1"
+    stats = await get_instance(hass).async_add_executor_job(
+        statistics_during_period,
+        hass,
+        dt_util.utc_from_timestamp(now - 3 * 3600),
+        None,
+        {statistic_id},
+        "hour",
+        None,
+        {"sum"},
+    )
+    first_hour = now - 2 * 3600
+    first_hour -= first_hour % 3600
+    expected = []
+    total = 0
+    for hour in (first_hour, first_hour + 3600):
+        values = [
+            x for x in range(24) if hour <= now - 2 * 3600 + x * 300 < hour + 3600
+        ]
+        total += sum(values)
+        if hour + 3600 <= now:
+            expected.append((hour, total))
+    assert [(x["start"], x["sum"]) for x in stats[statistic_id]] == expected
+    assert coordinator._history_hours[0]
+
+    # Nothing is downloaded until the device records the next interval
+    commands["history"].reset_mock()
+    await coordinator.async_refresh()
+    commands["history"].assert_not_called()
+    # One counter per refresh in turn
+    cached_values["history_seq"] = 25
+    await coordinator.async_refresh()
+    assert [x[0][0] for x in commands["history"].call_args_list] == [[2, 24]]
+
+    # After an outage the counters behind by the backlog are all downloaded
+    commands["history"].reset_mock()
+    cached_values["history_seq"] = 24 + HISTORY_BACKLOG
+    await coordinator.async_refresh()
+    assert commands["history"].call_count == 3
+
+    # The history starts over after a device reset
+    commands["history"].reset_mock()
+    await coordinator.device_reset(False)
+    await hass.async_block_till_done()
+    assert commands["history"].call_args_list[0][0][0] == [0, None]
+
+    # Firmware without the history
+    commands["history"].reset_mock()
+    cached_values["history_seq"] = None
+    await coordinator.async_refresh()
+    commands["history"].assert_not_called()
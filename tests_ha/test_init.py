@@ -2,7 +2,7 @@
 
 import datetime as dt
 
-from .conftest import commands
+from .conftest import calls, commands
 from .const import IEEE
 
 
@@ -13,7 +13,9 @@ def test_test(hass):
 async def test_init(hass, caplog, data_from_device, test_config_entry):
     """Test component initialization."""
 
-    assert len(commands) == 10
+    assert len(commands) == 14
+    commands["wire"].assert_called_once_with("binary")
+    commands["snapshot"].assert_called_once_with({"bind": True})
     commands["bind"].assert_called_once_with()
     commands["unique_id"].assert_called_once_with()
     commands["atcmd"].assert_called_once_with("VL")
@@ -22,12 +24,11 @@ async def test_init(hass, caplog, data_from_device, test_config_entry):
     commands["close"].assert_not_called()
     commands["stop"].assert_not_called()
     commands["counter"].assert_not_called()
-    commands["reset_cause"].assert_called_once_with()
-    assert commands["uptime"].call_count == 2
-    assert commands["uptime"].call_args_list[0][0] == ()
+    commands["reset_cause"].assert_not_called()
+    assert commands["uptime"].call_count == 1
     assert (
         abs(
-            commands["uptime"].call_args_list[1][0][0]
+            commands["uptime"].call_args_list[0][0][0]
             + 10
             - dt.datetime.now(tz=dt.timezone.utc).timestamp()
         )
@@ -38,6 +39,15 @@ async def test_init(hass, caplog, data_from_device, test_config_entry):
     await hass.async_block_till_done()
     assert "Test log" in caplog.text
 
+    data_from_device(
+        hass,
+        IEEE,
+        {"log": [{"msg": "First log", "sev": 30}, {"msg": "Second log", "sev": 40}]},
+    )
+    await hass.async_block_till_done()
+    assert "First log" in caplog.text
+    assert "Second log" in caplog.text
+
     assert hass.states.get("sensor.xbee_watercounter_1_counter").state == "unknown"
     assert hass.states.get("sensor.xbee_watercounter_2_counter").state == "unknown"
     assert hass.states.get("sensor.xbee_watercounter_3_counter").state == "unknown"
@@ -59,9 +69,11 @@ async def test_refresh(hass, data_from_device, test_config_entry):
     commands["uptime"].return_value = 0
     commands["reset_cause"].reset_mock()
     commands["counter"].reset_mock()
+    commands["snapshot"].reset_mock()
 
     data_from_device(hass, IEEE, {"uptime": 0})
     await hass.async_block_till_done()
+    commands["snapshot"].assert_called_once_with({"bind": True})
     commands["bind"].assert_called_once_with()
     assert commands["valve"].call_count == 3
     assert commands["valve"].call_args_list[0][0][0] == [0, None]
@@ -71,7 +83,7 @@ async def test_refresh(hass, data_from_device, test_config_entry):
     commands["close"].assert_not_called()
     commands["stop"].assert_not_called()
     commands["counter"].assert_called_once_with([0, 1234])
-    commands["reset_cause"].assert_called_once_with()
+    commands["reset_cause"].assert_not_called()
     assert commands["uptime"].call_count == 1
     assert (
         abs(
@@ -96,20 +108,16 @@ async def test_reload(hass, data_from_device, test_config_entry):
     commands["uptime"].reset_mock()
     commands["counter"].reset_mock()
     commands["counter"].return_value = 1234
+    commands["snapshot"].reset_mock()
 
     assert await hass.config_entries.async_reload(test_config_entry.entry_id)
     await hass.async_block_till_done()
 
+    commands["snapshot"].assert_called_once_with({"bind": True})
     commands["bind"].assert_called_once_with()
-    commands["uptime"].assert_called_once_with()
-    assert commands["valve"].call_count == 3
-    assert commands["valve"].call_args_list[0][0][0] == 0
-    assert commands["valve"].call_args_list[1][0][0] == 1
-    assert commands["valve"].call_args_list[2][0][0] == 2
-    assert commands["counter"].call_count == 3
-    assert commands["counter"].call_args_list[0][0][0] == 0
-    assert commands["counter"].call_args_list[1][0][0] == 1
-    assert commands["counter"].call_args_list[2][0][0] == 2
+    commands["uptime"].assert_not_called()
+    commands["valve"].assert_not_called()
+    commands["counter"].assert_not_called()
 
     assert hass.states.get("sensor.xbee_watercounter_1_counter").state == "1.234"
     assert hass.states.get("sensor.xbee_watercounter_2_counter").state == "1.234"
@@ -125,19 +133,19 @@ async def test_coordinator_update(hass, data_from_device, test_config_entry):
     commands["bind"].reset_mock()
     commands["uptime"].reset_mock()
     commands["counter"].reset_mock()
+    commands["snapshot"].reset_mock()
+    calls.clear()
 
     coordinator = hass.data["xbee_watercounter"][test_config_entry.entry_id]
     await coordinator.async_refresh()
     await hass.async_block_till_done()
 
-    assert commands["valve"].call_count == 3
-    assert commands["valve"].call_args_list[0][0][0] == 0
-    assert commands["valve"].call_args_list[1][0][0] == 1
-    assert commands["valve"].call_args_list[2][0][0] == 2
-    assert commands["counter"].call_count == 3
-    assert commands["counter"].call_args_list[0][0][0] == 0
-    assert commands["counter"].call_args_list[1][0][0] == 1
-    assert commands["counter"].call_args_list[2][0][0] == 2
+    assert len(calls) == 1
+    commands["snapshot"].assert_called_once_with({"bind": True})
+    commands["bind"].assert_called_once_with()
+    commands["uptime"].assert_not_called()
+    commands["valve"].assert_not_called()
+    commands["counter"].assert_not_called()
 
     assert hass.states.get("sensor.xbee_watercounter_1_counter").state == "1.234"
     assert hass.states.get("sensor.xbee_watercounter_2_counter").state == "1.234"
@@ -160,17 +168,21 @@ async def test_device_reset(hass, data_from_device, test_config_entry):
     commands["uptime"].return_value = -12
     commands["reset_cause"].reset_mock()
     commands["counter"].reset_mock()
+    commands["snapshot"].reset_mock()
+    commands["wire"].reset_mock()
 
     coordinator = hass.data["xbee_watercounter"][test_config_entry.entry_id]
     await coordinator.async_refresh()
     await hass.async_block_till_done()
 
+    commands["snapshot"].assert_called_once_with({"bind": True})
     commands["bind"].assert_called_once_with()
-    assert commands["uptime"].call_count == 2
-    assert commands["uptime"].call_args_list[0][0] == ()
+    # The command codes are negotiated again after the reset
+    commands["wire"].assert_called_once_with("binary")
+    assert commands["uptime"].call_count == 1
     assert (
         abs(
-            commands["uptime"].call_args_list[1][0][0]
+            commands["uptime"].call_args_list[0][0][0]
             + 12
             - dt.datetime.now(tz=dt.timezone.utc).timestamp()
         )
@@ -185,7 +197,7 @@ async def test_device_reset(hass, data_from_device, test_config_entry):
     commands["close"].assert_not_called()
     commands["stop"].assert_not_called()
     commands["counter"].assert_called_once_with([0, 1234])
-    commands["reset_cause"].assert_called_once_with()
+    commands["reset_cause"].assert_not_called()
 
     assert hass.states.get("sensor.xbee_watercounter_1_counter").state == "1.234"
     assert hass.states.get("sensor.xbee_watercounter_2_counter").state == "unknown"
@@ -195,28 +207,67 @@ async def test_device_reset(hass, data_from_device, test_config_entry):
     assert hass.states.get("valve.xbee_watercounter_3_valve").state == "closed"
 
 
+async def test_device_reset_journal(hass, data_from_device, test_config_entry):
+    """Test counters restored from the device journal are not overwritten."""
+
+    data_from_device(hass, IEEE, {"counter_0": 1234})
+    data_from_device(hass, IEEE, {"valve_1": 95})
+    await hass.async_block_till_done()
+
+    commands["uptime"].reset_mock()
+    commands["uptime"].return_value = -12
+    commands["counter"].reset_mock()
+    commands["counter"].return_value = 4321
+    commands["valve"].reset_mock()
+    commands["journal"].return_value = True
+
+    coordinator = hass.data["xbee_watercounter"][test_config_entry.entry_id]
+    await coordinator.async_refresh()
+    await hass.async_block_till_done()
+
+    commands["journal"].assert_not_called()  # The snapshot carries the flag
+    assert coordinator.journal is True
+    assert commands["uptime"].call_count == 1
+    commands["counter"].assert_not_called()
+    assert commands["valve"].call_args_list[1][0][0] == [1, 95]
+
+    assert hass.states.get("sensor.xbee_watercounter_1_counter").state == "4.321"
+    assert hass.states.get("sensor.xbee_watercounter_2_counter").state == "4.321"
+    assert hass.states.get("sensor.xbee_watercounter_3_counter").state == "4.321"
+
+    # The journal older than the last known value does not set the counter back
+    data_from_device(hass, IEEE, {"counter_0": 5000})
+    await hass.async_block_till_done()
+    commands["counter"].reset_mock()
+    commands["counter"].return_value = 4321
+    commands["uptime"].return_value = -12
+
+    await coordinator.async_refresh()
+    await hass.async_block_till_done()
+
+    commands["counter"].assert_called_once_with([0, 5000])
+    assert hass.states.get("sensor.xbee_watercounter_1_counter").state == "5.0"
+    assert hass.states.get("sensor.xbee_watercounter_2_counter").state == "4.321"
+
+
 async def test_connection_recovery(hass, data_from_device, test_config_entry):
     """Test device coming back online after being unavailable during last update."""
 
     commands["bind"].reset_mock()
     commands["uptime"].reset_mock()
     commands["counter"].reset_mock()
+    commands["snapshot"].reset_mock()
 
     coordinator = hass.data["xbee_watercounter"][test_config_entry.entry_id]
     coordinator.last_update_success = False
     data_from_device(hass, IEEE, {"counter_0": 1234})
     await hass.async_block_till_done()
 
+    commands["snapshot"].assert_called_once_with({"bind": True})
     commands["bind"].assert_called_once_with()
-    commands["uptime"].assert_called_once_with()
-    assert commands["valve"].call_count == 3
-    assert commands["valve"].call_args_list[0][0][0] == 0
-    assert commands["valve"].call_args_list[1][0][0] == 1
-    assert commands["valve"].call_args_list[2][0][0] == 2
-    assert commands["counter"].call_count == 3
-    assert commands["counter"].call_args_list[0][0][0] == 0
-    assert commands["counter"].call_args_list[1][0][0] == 1
-    assert commands["counter"].call_args_list[2][0][0] == 2
+    commands["uptime"].assert_not_called()
+    commands["valve"].assert_not_called()
+    commands["counter"].assert_not_called()
 
     assert hass.states.get("sensor.xbee_watercounter_1_counter").state == "1.234"
     assert hass.states.get("sensor.xbee_watercounter_2_counter").state == "1.234"
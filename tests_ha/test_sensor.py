@@ -4,7 +4,7 @@ import datetime as dt
 
 from homeassistant.const import ATTR_ENTITY_ID
 
-from .conftest import commands
+from .conftest import cached_values, commands
 from .const import IEEE
 
 ENTITY = "sensor.xbee_watercounter_main_unit_uptime"
@@ -34,6 +34,38 @@ async def test_counter(hass, data_from_device, test_config_entry):
     assert hass.states.get("sensor.xbee_watercounter_1_counter").state == "12.346"
 
 
+async def test_flow(hass, data_from_device, test_config_entry):
+    """Test flow rate sensor."""
+
+    assert hass.states.get("sensor.xbee_watercounter_1_flow_rate").state == "0"
+    data_from_device(hass, IEEE, {"flow_0": 12})
+    await hass.async_block_till_done()
+    assert hass.states.get("sensor.xbee_watercounter_1_flow_rate").state == "12"
+
+    cached_values["flow"] = {1: 7}
+    coordinator = hass.data["xbee_watercounter"][test_config_entry.entry_id]
+    await coordinator.async_refresh()
+    await hass.async_block_till_done()
+    assert hass.states.get("sensor.xbee_watercounter_1_flow_rate").state == "0"
+    assert hass.states.get("sensor.xbee_watercounter_2_flow_rate").state == "7"
+
+
+async def test_leak(hass, data_from_device, test_config_entry):
+    """Test leak detection sensor."""
+
+    assert hass.states.get("sensor.xbee_watercounter_1_leak").state == "none"
+    data_from_device(hass, IEEE, {"leak_0": "rate"})
+    await hass.async_block_till_done()
+    assert hass.states.get("sensor.xbee_watercounter_1_leak").state == "rate"
+
+    cached_values["leak"] = {1: "duration"}
+    coordinator = hass.data["xbee_watercounter"][test_config_entry.entry_id]
+    await coordinator.async_refresh()
+    await hass.async_block_till_done()
+    assert hass.states.get("sensor.xbee_watercounter_1_leak").state == "none"
+    assert hass.states.get("sensor.xbee_watercounter_2_leak").state == "duration"
+
+
 async def test_uptime_set(hass, data_from_device, test_config_entry):
     """Test absolute uptime set if relative uptime is returned from the device."""
 
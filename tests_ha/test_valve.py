@@ -1,10 +1,14 @@
 """Test xbee_watercounter valves."""
 
+import json
+
 import pytest
 from homeassistant.components.valve import (
+    ATTR_POSITION,
     DOMAIN as VALVE,
     SERVICE_CLOSE_VALVE,
     SERVICE_OPEN_VALVE,
+    SERVICE_SET_VALVE_POSITION,
     SERVICE_STOP_VALVE,
     STATE_CLOSED,
     STATE_CLOSING,
@@ -13,7 +17,7 @@ from homeassistant.components.valve import (
 )
 from homeassistant.const import ATTR_ENTITY_ID, STATE_UNKNOWN
 
-from .conftest import commands
+from .conftest import calls, commands
 from .const import IEEE
 
 ENT_VALVE1 = "valve.xbee_watercounter_1_valve"
@@ -110,3 +114,40 @@ async def test_valve_remote_update(
     await hass.async_block_till_done()
 
     assert hass.states.get(entity).state == STATE_CLOSING
+
+
+async def test_valve_batch(hass, data_from_device, test_config_entry):
+    """Test the valves moved together share one frame."""
+
+    calls.clear()
+    await hass.services.async_call(
+        VALVE,
+        SERVICE_OPEN_VALVE,
+        {ATTR_ENTITY_ID: [ENT_VALVE1, ENT_VALVE2, ENT_VALVE3]},
+        blocking=True,
+    )
+
+    assert len(calls) == 1
+    batch = json.loads(calls[0].data["params"]["data"])["batch"]
+    assert sorted(batch, key=lambda x: x["args"]) == [
+        {"cmd": "open", "args": number} for number in range(3)
+    ]
+    for entity in (ENT_VALVE1, ENT_VALVE2, ENT_VALVE3):
+        assert hass.states.get(entity).state == STATE_OPENING
+
+
+async def test_valve_set_position(hass, data_from_device, test_config_entry):
+    """Test valve set position."""
+
+    data_from_device(hass, IEEE, {"valve_1": 20})
+    await hass.async_block_till_done()
+
+    await hass.services.async_call(
+        VALVE,
+        SERVICE_SET_VALVE_POSITION,
+        {ATTR_ENTITY_ID: ENT_VALVE2, ATTR_POSITION: 40},
+        blocking=True,
+    )
+
+    assert hass.states.get(ENT_VALVE2).state == STATE_OPENING
+    commands["position"].assert_called_once_with([1, 40])